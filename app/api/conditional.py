@@ -0,0 +1,77 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response, status
+from sqlalchemy import Row
+
+# OpenAPI entry of routes answering conditional GETs
+NOT_MODIFIED_RESPONSES = {status.HTTP_304_NOT_MODIFIED: {"description": "Not Modified"}}
+
+
+def entity_tag(version: Row) -> str:
+    # Weak: the same version renders the same data, not necessarily the
+    # same bytes (content encodings, FAST_JSON_RESPONSES)
+    return f'W/"{version.user_id.hex}.{version.version}"'
+
+
+def validator_headers(version: Optional[Row]) -> dict[str, str]:
+    """ETag and Last-Modified of a response rendered at `version`."""
+    if version is None:
+        return {}
+    # Revalidated on every use instead of heuristically cached for a while
+    headers = {"ETag": entity_tag(version), "Cache-Control": "no-cache"}
+    if version.modified_at is not None:
+        headers["Last-Modified"] = _http_date(version.modified_at)
+    return headers
+
+
+def not_modified(request: Request, version: Optional[Row]) -> Optional[Response]:
+    """A 304 response if the client's copy is still at `version`, else None.
+
+    If-Modified-Since only counts without If-None-Match, as in RFC 9110.
+    """
+    if version is None:
+        return None
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = _etag_matches(if_none_match, entity_tag(version))
+    else:
+        fresh = _not_modified_since(
+            request.headers.get("if-modified-since"), version.modified_at
+        )
+    if not fresh:
+        return None
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED, headers=validator_headers(version)
+    )
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/ prefixes do not matter
+    opaque_tag = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == opaque_tag for tag in if_none_match.split(",")
+    )
+
+
+def _not_modified_since(
+    if_modified_since: Optional[str], modified_at: Optional[datetime]
+) -> bool:
+    if not if_modified_since or modified_at is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have whole seconds
+    return modified_at.replace(microsecond=0, tzinfo=timezone.utc) <= since
+
+
+def _http_date(value: datetime) -> str:
+    # Times are stored as naive UTC
+    return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
@@ -1,13 +1,176 @@
-from typing import Generator, Annotated
+import json
+import uuid
+from typing import AsyncGenerator, Generator, Annotated, Optional
 
-from fastapi import Depends
+from fastapi import Depends, Request
+from fastapi.requests import HTTPConnection
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
 from sqlmodel import Session
-from app.database import engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.constants import MAXIMUM_MESSAGE_BATCH_SIZE, NDJSON_MEDIA_TYPE
+from app.core.middleware import get_route_template
+from app.core.rate_limit import rate_limiter
+from app.core.read_routing import WRITTEN_KEYS
+from app.database import async_engine, async_read_router, engine, read_router
+from app.models.message import MessageCreate
+from app.services.exceptions import BadRequestError, TooManyRequestsError
+import app.core.resources as res
 
+_message_batch_adapter = TypeAdapter(list[MessageCreate])
 
-def get_session() -> Generator[Session, None, None]:
+READ_METHODS = ("GET", "HEAD")
+
+
+async def check_rate_limits(connection: HTTPConnection) -> None:
+    """Reject requests over the limits of their route with a 429.
+
+    A router dependency: it runs before the dependencies of the route, so
+    shed requests never open a database session. Being async, it runs on
+    the event loop, which keeps the memory backend lock-free.
+    """
+    if connection.scope["type"] != "http":
+        return
+    retry_after = await rate_limiter.check(
+        connection.scope["method"],
+        get_route_template(connection.scope),
+        _normalized_user_id(connection.path_params.get("user_id")),
+    )
+    if retry_after:
+        raise TooManyRequestsError(message=res.RATE_LIMITED, retry_after=retry_after)
+
+
+def _normalized_user_id(user_id: Optional[str]) -> Optional[str]:
+    # Other spellings of the same UUID must not get their own bucket
+    if user_id is None:
+        return None
+    try:
+        return str(uuid.UUID(user_id))
+    except ValueError:
+        return user_id
+
+
+def _is_read(connection: HTTPConnection) -> bool:
+    if connection.scope["type"] != "http":
+        return False
+    return connection.scope["method"] in READ_METHODS
+
+
+def _is_write(connection: HTTPConnection) -> bool:
+    # WebSockets neither read from replicas nor count as writes
+    return connection.scope["type"] == "http" and not _is_read(connection)
+
+
+def _read_your_writes_key(connection: HTTPConnection) -> Optional[str]:
+    # Reads of a user's data are addressed by their id, except for looking
+    # a user up by email; user writes note the emails they touched
+    user_id = _normalized_user_id(connection.path_params.get("user_id"))
+    return user_id or connection.path_params.get("email")
+
+
+def _written_keys(key: Optional[str], session_info: dict) -> set[str]:
+    return {key, *session_info.get(WRITTEN_KEYS, ())} - {None}
+
+
+def get_session(connection: HTTPConnection) -> Generator[Session, None, None]:
+    """A session on a read engine for GET requests, when there are any,
+    and on the primary engine otherwise.
+
+    A write keeps reads of its user on the primary for a while afterwards;
+    the window starts once the route is done, i.e. after the commit.
+    """
+    key = _read_your_writes_key(connection)
+    if _is_read(connection):
+        with read_router.route(key) as read_engine:
+            with Session(read_engine or engine) as session:
+                yield session
+        return
     with Session(engine) as session:
         yield session
+    if _is_write(connection):
+        for written_key in _written_keys(key, session.info):
+            read_router.record_write(written_key)
+
+
+async def get_async_session(
+    connection: HTTPConnection,
+) -> AsyncGenerator[AsyncSession, None]:
+    key = _read_your_writes_key(connection)
+    if _is_read(connection):
+        with async_read_router.route(key) as read_engine:
+            async with AsyncSession(
+                read_engine or async_engine, expire_on_commit=False
+            ) as session:
+                yield session
+        return
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+    if _is_write(connection):
+        for written_key in _written_keys(key, session.info):
+            async_read_router.record_write(written_key)
+
+
+# Dependencies are torn down before a streamed body is sent, so streams
+# that read from the database open their own session.
+def open_session() -> Session:
+    return Session(engine)
+
+
+def open_async_session() -> AsyncSession:
+    return AsyncSession(async_engine, expire_on_commit=False)
+
+
+async def get_message_batch(request: Request) -> list[MessageCreate]:
+    """Parse a JSON array or a streamed NDJSON body of messages."""
+    if request.headers.get("content-type", "").startswith(NDJSON_MEDIA_TYPE):
+        return await _read_ndjson_message_batch(request)
+
+    try:
+        items = json.loads(await request.body())
+    except ValueError:
+        raise RequestValidationError(
+            [{"loc": ("body",), "msg": "Invalid JSON", "type": "json_invalid"}]
+        )
+    if isinstance(items, list) and len(items) > MAXIMUM_MESSAGE_BATCH_SIZE:
+        raise BadRequestError(message=res.MESSAGE_BATCH_TOO_LARGE)
+    try:
+        return _message_batch_adapter.validate_python(items)
+    except ValidationError as exc:
+        raise RequestValidationError(_prefix_errors(exc, "body"))
+
+
+async def _read_ndjson_message_batch(request: Request) -> list[MessageCreate]:
+    messages: list[MessageCreate] = []
+    buffer = b""
+    line_number = 0
+
+    def parse(line: bytes) -> None:
+        nonlocal line_number
+        line_number += 1
+        if not line.strip():
+            return
+        if len(messages) >= MAXIMUM_MESSAGE_BATCH_SIZE:
+            raise BadRequestError(message=res.MESSAGE_BATCH_TOO_LARGE)
+        try:
+            messages.append(MessageCreate.model_validate_json(line))
+        except ValidationError as exc:
+            raise RequestValidationError(_prefix_errors(exc, "body", line_number))
+
+    # Lines are validated as they arrive, so oversized streams are rejected
+    # without buffering the whole body.
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            parse(line)
+    parse(buffer)
+    return messages
+
+
+def _prefix_errors(exc: ValidationError, *prefix) -> list[dict]:
+    return [{**error, "loc": (*prefix, *error["loc"])} for error in exc.errors()]
 
 
 SessionDep = Annotated[Session, Depends(get_session)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
+MessageBatchDep = Annotated[list[MessageCreate], Depends(get_message_batch)]
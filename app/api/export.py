@@ -0,0 +1,76 @@
+import csv
+import io
+import zlib
+from typing import Literal, Sequence, get_type_hints
+
+from pydantic import TypeAdapter
+from sqlalchemy import Row
+
+from app.core.compression import negotiate_encoding
+from app.core.constants import EXPORT_GZIP_LEVEL, NDJSON_MEDIA_TYPE
+
+ExportFormat = Literal["ndjson", "csv"]
+
+EXPORT_MEDIA_TYPES = {"ndjson": NDJSON_MEDIA_TYPE, "csv": "text/csv; charset=utf-8"}
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    return negotiate_encoding(accept_encoding, ["gzip"]) == "gzip"
+
+
+class ExportEncoder:
+    """Encodes batches of result rows into chunks of a streamed export.
+
+    Each batch becomes one chunk, so memory use is bounded by the batch
+    size. With gzip the chunks are parts of one gzip stream; a chunk may be
+    empty while the compressor is buffering.
+    """
+
+    def __init__(self, format: ExportFormat, row_type: type, name: str, gzip: bool):
+        self.format = format
+        self.media_type = EXPORT_MEDIA_TYPES[format]
+        # Varies with Accept-Encoding even when sent uncompressed, so shared
+        # caches do not hand gzip bytes to clients that did not accept them
+        self.headers = {
+            "Content-Disposition": f'attachment; filename="{name}.{format}"',
+            "Vary": "Accept-Encoding",
+        }
+        if gzip:
+            self.headers["Content-Encoding"] = "gzip"
+        self._adapter = TypeAdapter(row_type)
+        self._columns = list(get_type_hints(row_type))
+        self._header_written = False
+        self._compressor = (
+            zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            if gzip
+            else None
+        )
+
+    def encode(self, rows: Sequence[Row]) -> bytes:
+        if self.format == "csv":
+            data = self._encode_csv(rows)
+        else:
+            data = b"".join(
+                self._adapter.dump_json(dict(row._mapping)) + b"\n" for row in rows
+            )
+        if self._compressor is None:
+            return data
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        # The header row of an export without rows
+        data = self._encode_csv([]) if self.format == "csv" else b""
+        if self._compressor is None:
+            return data
+        return self._compressor.compress(data) + self._compressor.flush()
+
+    def _encode_csv(self, rows: Sequence[Row]) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not self._header_written:
+            writer.writerow(self._columns)
+            self._header_written = True
+        for row in rows:
+            values = self._adapter.dump_python(dict(row._mapping), mode="json")
+            writer.writerow(values[column] for column in self._columns)
+        return buffer.getvalue().encode()
@@ -1,7 +1,17 @@
-from fastapi import APIRouter
-from app.api.routes import users, messages
+from dataclasses import asdict
 
-router = APIRouter(prefix="/api")
+from fastapi import APIRouter, Depends
+
+from app.api.dependencies import check_rate_limits
+from app.core import config
+from app.core.cache import user_cache
+
+if config.DATABASE_ASYNC:
+    from app.api.routes import async_users as users, async_messages as messages
+else:
+    from app.api.routes import users, messages
+
+router = APIRouter(prefix="/api", dependencies=[Depends(check_rate_limits)])
 router.include_router(router=users.router, prefix="/users", tags=["users"])
 router.include_router(
     router=messages.router, prefix="/users/{user_id}/messages", tags=["messages"]
@@ -11,3 +21,8 @@ router.include_router(
 @router.get("/")
 def read_root():
     return {"Hello": "World"}
+
+
+@router.get("/cache/stats")
+def get_cache_stats():
+    return {"users": {**asdict(user_cache.stats), "size": user_cache.size()}}
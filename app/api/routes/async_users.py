@@ -0,0 +1,133 @@
+import uuid
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Body, Query, Request, Response
+
+from app.api.conditional import (
+    NOT_MODIFIED_RESPONSES,
+    not_modified,
+    validator_headers,
+)
+from app.api.dependencies import AsyncSessionDep
+from app.core import config
+from app.core.constants import (
+    DEFAULT_USER_LIMIT,
+    MAXIMUM_USER_LIMIT,
+    MAXIMUM_USER_BATCH_SIZE,
+    MAXIMUM_USER_PREFIX_LENGTH,
+)
+from app.core.responses import ORJSONResponse, RowSerializer
+from app.models.user import (
+    UserPublic,
+    UserCreate,
+    UserRow,
+    UserUpdate,
+    User,
+    UsersBatchPublic,
+    UsersPublic,
+    UserSortKey,
+)
+from app.services import async_user_service as user_service
+from app.models.util import ResponseMessage
+from pydantic import EmailStr
+
+router = APIRouter()
+
+_user_rows = RowSerializer(UserRow)
+
+
+@router.get("/", response_model=UsersPublic)
+async def get_users(
+    session: AsyncSessionDep,
+    limit: int = Query(default=DEFAULT_USER_LIMIT, ge=1, le=MAXIMUM_USER_LIMIT),
+    after: Optional[str] = None,
+    order_by: UserSortKey = "id",
+    email_prefix: Optional[str] = Query(
+        default=None, max_length=MAXIMUM_USER_PREFIX_LENGTH
+    ),
+    name_prefix: Optional[str] = Query(
+        default=None, max_length=MAXIMUM_USER_PREFIX_LENGTH
+    ),
+    include_total: bool = False,
+):
+    page = await user_service.get_users(
+        session=session,
+        limit=limit,
+        after=after,
+        order_by=order_by,
+        email_prefix=email_prefix,
+        name_prefix=name_prefix,
+    )
+    total = total_exact = None
+    if include_total:
+        count = await user_service.estimate_user_count(
+            session=session, email_prefix=email_prefix, name_prefix=name_prefix
+        )
+        total, total_exact = count.value, count.exact
+    if config.FAST_JSON_RESPONSES:
+        return ORJSONResponse(
+            {
+                "data": _user_rows(page.items),
+                "next_cursor": page.next_cursor,
+                "total": total,
+                "total_exact": total_exact,
+            }
+        )
+    return UsersPublic(
+        data=page.items,
+        next_cursor=page.next_cursor,
+        total=total,
+        total_exact=total_exact,
+    )
+
+
+@router.get("/{email}", response_model=UserPublic, responses=NOT_MODIFIED_RESPONSES)
+async def get_user_by_email(
+    email: EmailStr, request: Request, response: Response, session: AsyncSessionDep
+):
+    # Read before the user: a write in between leaves the response with an
+    # outdated tag, which only costs the client a full response next time
+    version = await user_service.get_user_version_by_email(session=session, email=email)
+    if not_modified_response := not_modified(request, version):
+        return not_modified_response
+    response.headers.update(validator_headers(version))
+    user = await user_service.get_user_by_email(session=session, email=email)
+    return user
+
+
+@router.post("/", response_model=UserPublic)
+async def create_user(user_in: UserCreate, session: AsyncSessionDep):
+    user_created: User = await user_service.create_user(
+        session=session, user_in=user_in
+    )
+    return user_created
+
+
+@router.post("/batch", response_model=UsersBatchPublic)
+async def create_users(
+    users_in: Annotated[list[UserCreate], Body(max_length=MAXIMUM_USER_BATCH_SIZE)],
+    session: AsyncSessionDep,
+):
+    items = await user_service.create_users(session=session, users_in=users_in)
+    created = sum(1 for item in items if item.user)
+    return UsersBatchPublic(
+        data=[vars(item) for item in items],
+        created=created,
+        conflicts=len(items) - created,
+    )
+
+
+@router.patch("/{user_id}", response_model=UserPublic)
+async def update_user(
+    session: AsyncSessionDep, user_id: uuid.UUID, user_in: UserUpdate
+):
+    user_updated: User = await user_service.update_user(
+        session=session, user_id=user_id, user_in=user_in
+    )
+    return user_updated
+
+
+@router.delete("/{user_id}")
+async def delete_user(user_id: uuid.UUID, session: AsyncSessionDep):
+    await user_service.delete_user(session=session, user_id=user_id)
+    return ResponseMessage(message="User deleted successfully.")
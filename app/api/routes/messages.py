@@ -1,19 +1,220 @@
+from typing import Iterator, Optional
 from uuid import UUID
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Query, Request, Response, WebSocket, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 
-from app.api.dependencies import SessionDep
-from app.models.message import MessagePublic, MessageCreate
+from app.api.streaming import (
+    SSE_HEADERS,
+    SSE_MEDIA_TYPE,
+    send_websocket_events,
+    sse_events,
+)
+from app.api.conditional import (
+    NOT_MODIFIED_RESPONSES,
+    not_modified,
+    validator_headers,
+)
+from app.api.dependencies import SessionDep, MessageBatchDep, open_session
+from app.api.export import ExportEncoder, ExportFormat, accepts_gzip
+from app.core import config
+from app.core.constants import (
+    DEFAULT_CHANGE_LIMIT,
+    DEFAULT_MESSAGE_LIMIT,
+    MAXIMUM_CHANGE_LIMIT,
+    MAXIMUM_MESSAGE_LIMIT,
+    MAXIMUM_MESSAGE_BATCH_SIZE,
+    MAXIMUM_SEARCH_QUERY_LENGTH,
+    NDJSON_MEDIA_TYPE,
+)
+from app.core.pubsub import message_hub
+from app.core.responses import ORJSONResponse, RowSerializer
+from app.models.message import (
+    MessageRow,
+    MessagePublic,
+    MessageCreate,
+    MessagesPublic,
+    MessagesCreatedPublic,
+    MessagesDelete,
+    MessagesDeletedPublic,
+)
+from app.models.message_change import MessageChangePublic, MessageChangesPublic
 from app.models.util import ResponseMessage
-from app.services import message_service
+from app.services import message_service, user_service
+from app.services.exceptions import NotFoundError
 
 router = APIRouter()
 
+_message_rows = RowSerializer(MessageRow)
 
-@router.get("/", response_model=list[MessagePublic])
-def get_user_messages(user_id: UUID, session: SessionDep):
-    messages = message_service.get_user_messages(session=session, user_id=user_id)
-    return messages
+_MESSAGE_BATCH_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {
+                "schema": {
+                    "type": "array",
+                    "items": {"$ref": "#/components/schemas/MessageCreate"},
+                    "maxItems": MAXIMUM_MESSAGE_BATCH_SIZE,
+                }
+            },
+            NDJSON_MEDIA_TYPE: {
+                "schema": {"$ref": "#/components/schemas/MessageCreate"}
+            },
+        },
+    }
+}
+
+
+@router.get("/", response_model=MessagesPublic, responses=NOT_MODIFIED_RESPONSES)
+def get_user_messages(
+    user_id: UUID,
+    request: Request,
+    response: Response,
+    session: SessionDep,
+    limit: int = Query(default=DEFAULT_MESSAGE_LIMIT, ge=1, le=MAXIMUM_MESSAGE_LIMIT),
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+):
+    version = user_service.get_user_version_by_id(session=session, user_id=user_id)
+    if not_modified_response := not_modified(request, version):
+        return not_modified_response
+    headers = validator_headers(version)
+    page = message_service.get_user_messages(
+        session=session, user_id=user_id, limit=limit, after=after, before=before
+    )
+    if config.FAST_JSON_RESPONSES:
+        return ORJSONResponse(
+            {
+                "data": _message_rows(page.items),
+                "next_cursor": page.next_cursor,
+                "prev_cursor": page.prev_cursor,
+            },
+            headers=headers,
+        )
+    response.headers.update(headers)
+    return MessagesPublic(
+        data=page.items, next_cursor=page.next_cursor, prev_cursor=page.prev_cursor
+    )
+
+
+@router.get("/search", response_model=MessagesPublic)
+def search_user_messages(
+    user_id: UUID,
+    session: SessionDep,
+    q: str = Query(min_length=1, max_length=MAXIMUM_SEARCH_QUERY_LENGTH),
+    limit: int = Query(default=DEFAULT_MESSAGE_LIMIT, ge=1, le=MAXIMUM_MESSAGE_LIMIT),
+    after: Optional[str] = None,
+):
+    page = message_service.search_user_messages(
+        session=session, user_id=user_id, q=q, limit=limit, after=after
+    )
+    if config.FAST_JSON_RESPONSES:
+        return ORJSONResponse(
+            {
+                "data": _message_rows(page.items),
+                "next_cursor": page.next_cursor,
+                "prev_cursor": None,
+            }
+        )
+    return MessagesPublic(data=page.items, next_cursor=page.next_cursor)
+
+
+@router.get("/changes", response_model=MessageChangesPublic)
+def get_message_changes(
+    user_id: UUID,
+    session: SessionDep,
+    since: Optional[int] = Query(default=None, ge=0),
+    limit: int = Query(default=DEFAULT_CHANGE_LIMIT, ge=1, le=MAXIMUM_CHANGE_LIMIT),
+):
+    page = message_service.get_message_changes(
+        session=session, user_id=user_id, since=since, limit=limit
+    )
+    return MessageChangesPublic(
+        data=[
+            MessageChangePublic(
+                seq=change.seq,
+                op=change.op,
+                message_id=change.message_id,
+                message=message,
+            )
+            for change, message in page.items
+        ],
+        next_since=page.next_since,
+        has_more=page.has_more,
+    )
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    responses={200: {"content": {NDJSON_MEDIA_TYPE: {}, "text/csv": {}}}},
+)
+def export_user_messages(
+    user_id: UUID,
+    request: Request,
+    session: SessionDep,
+    format: ExportFormat = "ndjson",
+):
+    user_service.get_user_by_id(session=session, user_id=user_id)
+    encoder = ExportEncoder(
+        format,
+        MessageRow,
+        name=f"messages-{user_id}",
+        gzip=accepts_gzip(request.headers.get("accept-encoding", "")),
+    )
+    return StreamingResponse(
+        _export_messages(user_id, encoder),
+        media_type=encoder.media_type,
+        headers=encoder.headers,
+    )
+
+
+def _export_messages(user_id: UUID, encoder: ExportEncoder) -> Iterator[bytes]:
+    # Iterated in a threadpool by StreamingResponse, one batch at a time
+    with open_session() as session:
+        for rows in message_service.iter_user_messages(
+            session=session, user_id=user_id
+        ):
+            chunk = encoder.encode(rows)
+            if chunk:
+                yield chunk
+    yield encoder.finish()
+
+
+@router.get(
+    "/stream",
+    response_class=StreamingResponse,
+    responses={200: {"content": {SSE_MEDIA_TYPE: {}}}},
+)
+async def stream_user_messages(user_id: UUID, session: SessionDep):
+    await run_in_threadpool(
+        user_service.get_user_by_id, session=session, user_id=user_id
+    )
+    # Give the connection back to the pool for the lifetime of the stream
+    session.close()
+    subscription = message_hub.subscribe(message_service.message_topic(user_id))
+    return StreamingResponse(
+        sse_events(subscription), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS
+    )
+
+
+@router.websocket("/stream")
+async def stream_user_messages_websocket(
+    websocket: WebSocket, user_id: UUID, session: SessionDep
+):
+    try:
+        await run_in_threadpool(
+            user_service.get_user_by_id, session=session, user_id=user_id
+        )
+    except NotFoundError as exc:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=exc.message)
+        return
+    session.close()
+    subscription = message_hub.subscribe(message_service.message_topic(user_id))
+    await websocket.accept()
+    await send_websocket_events(websocket, subscription)
 
 
 @router.post("/", response_model=MessagePublic)
@@ -26,6 +227,33 @@ def create_message_for_user(
     return message
 
 
+@router.post(
+    "/batch",
+    response_model=MessagesCreatedPublic,
+    openapi_extra=_MESSAGE_BATCH_OPENAPI,
+)
+def create_messages_for_user(
+    user_id: UUID, messages_in: MessageBatchDep, session: SessionDep
+):
+    messages = message_service.create_messages_for_user(
+        session=session, user_id=user_id, messages_in=messages_in
+    )
+    return MessagesCreatedPublic(data=messages, count=len(messages))
+
+
+@router.post("/batch/delete", response_model=MessagesDeletedPublic)
+def delete_messages_for_user(
+    user_id: UUID, messages_in: MessagesDelete, session: SessionDep
+):
+    count = message_service.delete_messages_for_user(
+        session=session,
+        user_id=user_id,
+        message_ids=messages_in.ids,
+        before=messages_in.before,
+    )
+    return MessagesDeletedPublic(count=count)
+
+
 @router.delete("/{message_id}", response_model=ResponseMessage)
 def delete_message_for_user(user_id: UUID, message_id: UUID, session: SessionDep):
     message_service.delete_message_for_user(
@@ -0,0 +1,75 @@
+import asyncio
+import json
+from typing import AsyncIterator
+
+from fastapi import WebSocket, status
+
+from app.core import config
+from app.core.pubsub import Subscription, SubscriptionOverflow
+
+SSE_MEDIA_TYPE = "text/event-stream"
+# Stop proxies from buffering the stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+async def sse_events(subscription: Subscription) -> AsyncIterator[str]:
+    """Server-sent events for a subscription, with keepalive comments.
+
+    Ends with an `overflow` event when the client fell behind; it should
+    reload with GET messages and reconnect.
+    """
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                data = await subscription.get(
+                    timeout=config.MESSAGE_STREAM_KEEPALIVE_SECONDS
+                )
+            except SubscriptionOverflow:
+                yield "event: overflow\ndata: {}\n\n"
+                return
+            if data is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"id: {data['id']}\nevent: message\ndata: {json.dumps(data)}\n\n"
+    finally:
+        subscription.close()
+
+
+async def send_websocket_events(
+    websocket: WebSocket, subscription: Subscription
+) -> None:
+    """Forward a subscription to an accepted websocket until either side
+    goes away. Falling behind closes the socket with 1013 (try again later).
+    """
+    # Nothing is expected from the client, but reading is the only way to
+    # notice it has disconnected while no messages are published.
+    receiver = asyncio.ensure_future(_wait_for_disconnect(websocket))
+    try:
+        while True:
+            getter = asyncio.ensure_future(
+                subscription.get(timeout=config.MESSAGE_STREAM_KEEPALIVE_SECONDS)
+            )
+            done, _ = await asyncio.wait(
+                {getter, receiver}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if receiver in done:
+                getter.cancel()
+                break
+            try:
+                data = getter.result()
+            except SubscriptionOverflow:
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                break
+            if data is not None:
+                await websocket.send_json(data)
+    finally:
+        receiver.cancel()
+        subscription.close()
+
+
+async def _wait_for_disconnect(websocket: WebSocket) -> None:
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
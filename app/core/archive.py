@@ -0,0 +1,100 @@
+import gzip
+import io
+import os
+from collections import defaultdict
+from datetime import date
+from pathlib import Path
+from typing import IO, Callable, Iterable, Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is an optional dependency
+    zstandard = None
+
+from pydantic import TypeAdapter
+
+_SUFFIXES = {"gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}
+
+
+class PartitionArchive:
+    """Append-only NDJSON files of rows, one compressed file per day.
+
+    Every write appends a new gzip member or zstd frame, both of which
+    concatenate into one valid stream, so batches never rewrite a file.
+    Writes are fsynced before returning: once `write` is done the rows can
+    be deleted from the database.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        row_type: type,
+        prefix: str,
+        compression: str = "gzip",
+        level: Optional[int] = None,
+    ):
+        if compression not in _SUFFIXES:
+            raise ValueError(f"Unknown archive compression: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("zstd archives require the zstandard package")
+        self.directory = Path(directory)
+        self.prefix = prefix
+        self.compression = compression
+        self.level = level
+        self._adapter = TypeAdapter(row_type)
+
+    def partition_path(self, day: date, compression: Optional[str] = None) -> Path:
+        suffix = _SUFFIXES[compression or self.compression]
+        return self.directory / f"{self.prefix}-{day.isoformat()}{suffix}"
+
+    def partitions(self) -> list[date]:
+        days = set()
+        for path in self.directory.glob(f"{self.prefix}-*.ndjson.*"):
+            day = path.name[len(self.prefix) + 1 :].split(".", 1)[0]
+            days.add(date.fromisoformat(day))
+        return sorted(days)
+
+    def write(self, rows: Iterable[dict], day_of: Callable[[dict], date]) -> int:
+        """Append rows to the partitions of their `day_of(row)` day."""
+        lines_by_day: dict[date, list[bytes]] = defaultdict(list)
+        for row in rows:
+            lines_by_day[day_of(row)].append(self._adapter.dump_json(row) + b"\n")
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for day, lines in lines_by_day.items():
+            with open(self.partition_path(day), "ab") as raw:
+                raw.write(self._compress(b"".join(lines)))
+                raw.flush()
+                os.fsync(raw.fileno())
+        return sum(len(lines) for lines in lines_by_day.values())
+
+    def read(self, day: date) -> Iterator[dict]:
+        """Rows of a partition, validated against the row type, streamed."""
+        paths = [
+            self.partition_path(day, compression)
+            for compression in _SUFFIXES
+            if self.partition_path(day, compression).exists()
+        ]
+        if not paths:
+            raise FileNotFoundError(f"No archive partition for {day.isoformat()}")
+        for path in paths:
+            with self._open(path) as lines:
+                for line in lines:
+                    if line.strip():
+                        yield self._adapter.validate_json(line)
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == "zstd":
+            level = self.level if self.level is not None else 3
+            return zstandard.ZstdCompressor(level=level).compress(data)
+        level = self.level if self.level is not None else 6
+        return gzip.compress(data, compresslevel=level)
+
+    def _open(self, path: Path) -> IO[bytes]:
+        if path.name.endswith(_SUFFIXES["zstd"]):
+            if zstandard is None:
+                raise RuntimeError("zstd archives require the zstandard package")
+            reader = zstandard.ZstdDecompressor().stream_reader(
+                open(path, "rb"), read_across_frames=True, closefd=True
+            )
+            return io.BufferedReader(reader)
+        return gzip.open(path, "rb")
@@ -0,0 +1,187 @@
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is an optional dependency
+    redis = None
+
+from app.core import config
+from app.core.metrics import Counter, Metric, registry as metrics_registry
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    invalidations: int = 0
+
+
+class Cache(ABC):
+    """Key-value cache for JSON-serializable dicts with hit/miss counters."""
+
+    def __init__(self):
+        self.stats = CacheStats()
+
+    def get(self, key: str) -> Optional[dict]:
+        value = self._get(key)
+        if value is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return value
+
+    def set(self, key: str, value: dict) -> None:
+        self._set(key, value)
+
+    def delete(self, *keys: str) -> None:
+        self.stats.invalidations += len(keys)
+        self._delete(*keys)
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    def _set(self, key: str, value: dict) -> None: ...
+
+    @abstractmethod
+    def _delete(self, *keys: str) -> None: ...
+
+    @abstractmethod
+    def clear(self) -> None: ...
+
+    @abstractmethod
+    def size(self) -> int: ...
+
+
+class NullCache(Cache):
+    def _get(self, key: str) -> Optional[dict]:
+        return None
+
+    def _set(self, key: str, value: dict) -> None:
+        pass
+
+    def _delete(self, *keys: str) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+    def size(self) -> int:
+        return 0
+
+
+class InMemoryCache(Cache):
+    """Process-local cache with per-entry TTL and LRU eviction."""
+
+    def __init__(self, ttl_seconds: float, max_size: int):
+        super().__init__()
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return dict(value)
+
+    def _set(self, key: str, value: dict) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, dict(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisCache(Cache):
+    """Cache shared between workers, backed by any Redis-protocol client."""
+
+    def __init__(self, client: Any, ttl_seconds: float, prefix: str = "cache:"):
+        super().__init__()
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def _get(self, key: str) -> Optional[dict]:
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def _set(self, key: str, value: dict) -> None:
+        self.client.set(
+            self.prefix + key, json.dumps(value), ex=max(1, int(self.ttl_seconds))
+        )
+
+    def _delete(self, *keys: str) -> None:
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def clear(self) -> None:
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def size(self) -> int:
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*"))
+
+
+def create_cache(
+    backend: str, ttl_seconds: float, max_size: int, prefix: str = "cache:"
+) -> Cache:
+    if backend == "memory":
+        return InMemoryCache(ttl_seconds=ttl_seconds, max_size=max_size)
+    if backend == "redis":
+        if redis is None:
+            raise RuntimeError("The redis cache backend requires the redis package")
+        client = redis.Redis.from_url(config.REDIS_URL)
+        return RedisCache(client=client, ttl_seconds=ttl_seconds, prefix=prefix)
+    if backend == "none":
+        return NullCache()
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+user_cache = create_cache(
+    backend=config.USER_CACHE_BACKEND,
+    ttl_seconds=config.USER_CACHE_TTL_SECONDS,
+    max_size=config.USER_CACHE_MAX_SIZE,
+    prefix="user:",
+)
+
+
+def _collect_user_cache_metrics() -> list[Metric]:
+    hits = Counter("user_cache_hits_total", "User cache hits.")
+    hits.inc(user_cache.stats.hits)
+    misses = Counter("user_cache_misses_total", "User cache misses.")
+    misses.inc(user_cache.stats.misses)
+    invalidations = Counter(
+        "user_cache_invalidations_total", "User cache invalidated keys."
+    )
+    invalidations.inc(user_cache.stats.invalidations)
+    return [hits, misses, invalidations]
+
+
+metrics_registry.register_collector(_collect_user_cache_metrics)
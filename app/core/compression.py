@@ -0,0 +1,255 @@
+import zlib
+from typing import Optional, Sequence
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is an optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is an optional dependency
+    zstandard = None
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core import config
+from app.core.metrics import Counter, registry as metrics_registry
+
+# Content types worth compressing; event streams are excluded because every
+# event has to reach the client as soon as it is sent
+COMPRESSIBLE_CONTENT_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "text/plain",
+    "text/csv",
+    "text/html",
+)
+
+# Valid levels of each encoding
+_LEVELS = {"gzip": range(1, 10), "br": range(0, 12), "zstd": range(1, 23)}
+
+compression_input_bytes = metrics_registry.register(
+    Counter(
+        "http_compression_input_bytes_total",
+        "Response bytes before compression.",
+        ("encoding",),
+    )
+)
+compression_output_bytes = metrics_registry.register(
+    Counter(
+        "http_compression_output_bytes_total",
+        "Response bytes after compression.",
+        ("encoding",),
+    )
+)
+
+
+def available_encodings() -> list[str]:
+    encodings = ["gzip"]
+    if brotli is not None:
+        encodings.append("br")
+    if zstandard is not None:
+        encodings.append("zstd")
+    return encodings
+
+
+def negotiate_encoding(accept_encoding: str, encodings: Sequence[str]) -> Optional[str]:
+    """The encoding the client accepts with the highest q-value, or None.
+
+    Ties go to the first one in `encodings`, the server's preference.
+    """
+    qualities = _parse_accept_encoding(accept_encoding)
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _parse_accept_encoding(accept_encoding: str) -> dict[str, float]:
+    qualities = {}
+    for coding in accept_encoding.split(","):
+        name, *params = [part.strip() for part in coding.split(";")]
+        if not name:
+            continue
+        quality = next((param[2:] for param in params if param.startswith("q=")), "1")
+        try:
+            qualities[name.lower()] = float(quality)
+        except ValueError:
+            qualities[name.lower()] = 0.0
+    return qualities
+
+
+class _GzipCompressor:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliCompressor:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdCompressor:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+_COMPRESSORS = {
+    "gzip": _GzipCompressor,
+    "br": _BrotliCompressor,
+    "zstd": _ZstdCompressor,
+}
+
+
+class CompressionMiddleware:
+    """Compresses response bodies with the best encoding the client accepts.
+
+    Complete bodies smaller than `minimum_size` are sent as they are.
+    Streamed bodies are compressed chunk by chunk, each chunk flushed so the
+    client can decode it right away. Responses that are already encoded
+    (like exports), event streams and `no-transform` responses are left
+    alone.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = config.COMPRESSION_MINIMUM_SIZE,
+        encodings: Sequence[str] = config.COMPRESSION_ENCODINGS,
+        levels: Optional[dict[str, int]] = None,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = [
+            encoding for encoding in encodings if encoding in available_encodings()
+        ]
+        self.levels = {
+            "gzip": config.COMPRESSION_GZIP_LEVEL,
+            "br": config.COMPRESSION_BROTLI_QUALITY,
+            "zstd": config.COMPRESSION_ZSTD_LEVEL,
+            **(levels or {}),
+        }
+        for encoding in self.encodings:
+            if self.levels[encoding] not in _LEVELS[encoding]:
+                raise ValueError(
+                    f"Invalid {encoding} compression level: {self.levels[encoding]}"
+                )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(
+            Headers(scope=scope).get("accept-encoding", ""), self.encodings
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressingResponder(
+            send, encoding, self.levels[encoding], self.minimum_size
+        )
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressingResponder:
+    def __init__(self, send: Send, encoding: str, level: int, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.level = level
+        self.minimum_size = minimum_size
+        # Held back until the first body part shows whether to compress
+        self._start: Optional[Message] = None
+        self._compressor = None
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self._start = message
+        elif self._start is not None:
+            start, self._start = self._start, None
+            if message["type"] == "http.response.body" and self._should_compress(
+                start, message
+            ):
+                await self._send_compressed_start(start, message)
+            else:
+                await self._send(start)
+                await self._send(message)
+        elif self._compressor is not None and message["type"] == "http.response.body":
+            await self._send_compressed_body(message)
+        else:
+            await self._send(message)
+
+    def _should_compress(self, start: Message, message: Message) -> bool:
+        headers = Headers(raw=start["headers"])
+        if start["status"] < 200 or start["status"] in (204, 304):
+            return False
+        if "content-encoding" in headers:
+            return False
+        if "no-transform" in headers.get("cache-control", ""):
+            return False
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type not in COMPRESSIBLE_CONTENT_TYPES:
+            return False
+        if message.get("more_body", False):
+            # Streamed: only a declared length tells the size in advance
+            content_length = headers.get("content-length")
+            return content_length is None or int(content_length) >= self.minimum_size
+        return len(message.get("body", b"")) >= self.minimum_size
+
+    async def _send_compressed_start(self, start: Message, message: Message) -> None:
+        self._compressor = _COMPRESSORS[self.encoding](self.level)
+        body = self._compress(message)
+        headers = MutableHeaders(raw=list(start["headers"]))
+        headers["Content-Encoding"] = self.encoding
+        if "accept-encoding" not in headers.get("vary", "").lower():
+            headers.add_vary_header("Accept-Encoding")
+        if message.get("more_body", False):
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(len(body))
+        await self._send({**start, "headers": headers.raw})
+        await self._send({**message, "body": body})
+
+    async def _send_compressed_body(self, message: Message) -> None:
+        await self._send({**message, "body": self._compress(message)})
+
+    def _compress(self, message: Message) -> bytes:
+        data = message.get("body", b"")
+        body = self._compressor.compress(data)
+        if message.get("more_body", False):
+            body += self._compressor.flush()
+        else:
+            body += self._compressor.finish()
+        compression_input_bytes.inc(len(data), encoding=self.encoding)
+        compression_output_bytes.inc(len(body), encoding=self.encoding)
+        return body
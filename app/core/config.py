@@ -0,0 +1,124 @@
+import os
+
+
+def _get_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _get_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value is not None else default
+
+
+def _get_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value is not None else default
+
+
+# Logging
+# Fraction of requests that get an access log line, between 0 and 1
+LOG_SAMPLE_RATE = _get_float("LOG_SAMPLE_RATE", 1.0)
+
+# Serve list endpoints from column rows rendered by orjson instead of
+# ORM entities going through response_model validation
+FAST_JSON_RESPONSES = _get_bool("FAST_JSON_RESPONSES", False)
+
+# Response compression
+# Encodings in order of preference, the unavailable ones (br needs brotli,
+# zstd zstandard) are skipped; empty disables compression
+COMPRESSION_ENCODINGS = [
+    encoding.strip()
+    for encoding in os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",")
+    if encoding.strip()
+]
+# Complete bodies below this many bytes are not worth compressing
+COMPRESSION_MINIMUM_SIZE = _get_int("COMPRESSION_MINIMUM_SIZE", 1024)
+# Low levels: most of the size reduction for a small share of the CPU time
+# of the highest ones
+COMPRESSION_GZIP_LEVEL = _get_int("COMPRESSION_GZIP_LEVEL", 5)
+COMPRESSION_BROTLI_QUALITY = _get_int("COMPRESSION_BROTLI_QUALITY", 4)
+COMPRESSION_ZSTD_LEVEL = _get_int("COMPRESSION_ZSTD_LEVEL", 3)
+
+# Database
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
+# Serve requests with async route handlers over an AsyncEngine/AsyncSession
+DATABASE_ASYNC = _get_bool("DATABASE_ASYNC", False)
+DATABASE_ECHO = _get_bool("DATABASE_ECHO", False)
+DATABASE_POOL_SIZE = _get_int("DATABASE_POOL_SIZE", 5)
+DATABASE_MAX_OVERFLOW = _get_int("DATABASE_MAX_OVERFLOW", 10)
+DATABASE_POOL_PRE_PING = _get_bool("DATABASE_POOL_PRE_PING", True)
+# Seconds after which pooled connections are replaced, -1 disables recycling
+DATABASE_POOL_RECYCLE = _get_int("DATABASE_POOL_RECYCLE", 1800)
+
+# Read routing: GET requests read from these replica URLs instead of
+# DATABASE_URL, e.g. read replicas of a server database
+DATABASE_READ_URLS = [
+    url.strip() for url in os.getenv("DATABASE_READ_URLS", "").split(",") if url.strip()
+]
+# Read-only engines over a file-backed SQLite DATABASE_URL; in WAL mode
+# they read alongside the writer without blocking it
+SQLITE_READ_ENGINES = _get_int("SQLITE_READ_ENGINES", 0)
+# "round_robin" or "least_load" (fewest reads in flight)
+DATABASE_READ_ROUTING = os.getenv("DATABASE_READ_ROUTING", "round_robin")
+# Reads of a user stay on the primary this long after a write to them, so
+# clients read their own writes despite replication lag
+READ_YOUR_WRITES_SECONDS = _get_float("READ_YOUR_WRITES_SECONDS", 2.0)
+# Recently written users remembered for that, oldest forgotten first
+READ_YOUR_WRITES_MAX_USERS = _get_int("READ_YOUR_WRITES_MAX_USERS", 100_000)
+
+# SQLite per-connection PRAGMAs
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = _get_int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+SQLITE_MMAP_SIZE = _get_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)
+# Negative values are KiB rather than pages, i.e. -65536 is a 64 MiB cache
+SQLITE_CACHE_SIZE = _get_int("SQLITE_CACHE_SIZE", -65536)
+
+# Group commit: writes of concurrent requests go through one writer thread,
+# many per transaction, instead of contending for SQLite's write lock
+WRITE_COALESCING = _get_bool("WRITE_COALESCING", False)
+WRITE_COALESCING_MAX_BATCH_SIZE = _get_int("WRITE_COALESCING_MAX_BATCH_SIZE", 64)
+# How long the writer waits for more writes after the first one of a batch
+WRITE_COALESCING_MAX_DELAY_MS = _get_float("WRITE_COALESCING_MAX_DELAY_MS", 1.0)
+
+# Cache
+# "memory" (per process), "redis" (shared between workers) or "none"
+USER_CACHE_BACKEND = os.getenv("USER_CACHE_BACKEND", "memory")
+USER_CACHE_TTL_SECONDS = _get_int("USER_CACHE_TTL_SECONDS", 60)
+USER_CACHE_MAX_SIZE = _get_int("USER_CACHE_MAX_SIZE", 10000)
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Rate limiting
+# "memory" (buckets per process), "redis" (shared between workers) or "none"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+# ";"-separated "<METHOD> <route>=<requests>/<s|m|h>[:<burst>][@user]" limits;
+# "@user" gives every user_id its own bucket. See app/core/rate_limit.py.
+# The batch endpoint is left unlimited: it is bounded per request already
+# and meant for importers sending bursts of batches.
+RATE_LIMITS = os.getenv(
+    "RATE_LIMITS", "POST /api/users/{user_id}/messages/=10/s:20@user"
+)
+# Buckets kept by the memory backend, least recently used ones evicted first
+RATE_LIMIT_MAX_BUCKETS = _get_int("RATE_LIMIT_MAX_BUCKETS", 100_000)
+
+# Message streams
+# "memory" (subscribers of this process only) or "redis" (across workers)
+MESSAGE_STREAM_BACKEND = os.getenv("MESSAGE_STREAM_BACKEND", "memory")
+# Messages buffered per subscriber before a slow stream is dropped
+MESSAGE_STREAM_QUEUE_SIZE = _get_int("MESSAGE_STREAM_QUEUE_SIZE", 100)
+MESSAGE_STREAM_KEEPALIVE_SECONDS = _get_float("MESSAGE_STREAM_KEEPALIVE_SECONDS", 15.0)
+
+# Message change log
+# Tombstones older than this are dropped by scripts/compact_changes.py
+MESSAGE_TOMBSTONE_RETENTION_DAYS = _get_int("MESSAGE_TOMBSTONE_RETENTION_DAYS", 30)
+
+# Message retention, applied by scripts/apply_retention.py; 0 disables a limit
+MESSAGE_RETENTION_MAX_AGE_DAYS = _get_int("MESSAGE_RETENTION_MAX_AGE_DAYS", 0)
+MESSAGE_RETENTION_MAX_PER_USER = _get_int("MESSAGE_RETENTION_MAX_PER_USER", 0)
+# Messages removed by retention are kept in one NDJSON file per day here
+MESSAGE_ARCHIVE_DIR = os.getenv("MESSAGE_ARCHIVE_DIR", "./archive")
+# "gzip", or "zstd" with the zstandard package installed
+MESSAGE_ARCHIVE_COMPRESSION = os.getenv("MESSAGE_ARCHIVE_COMPRESSION", "gzip")
@@ -1,2 +1,18 @@
 DEFAULT_USER_LIMIT = 10
 MAXIMUM_USER_LIMIT = 100
+MAXIMUM_USER_PREFIX_LENGTH = 255
+# User counts above this are estimated instead of counted exactly
+USER_COUNT_EXACT_LIMIT = 10_000
+DEFAULT_MESSAGE_LIMIT = 20
+MAXIMUM_MESSAGE_LIMIT = 100
+MAXIMUM_MESSAGE_BATCH_SIZE = 1000
+MAXIMUM_USER_BATCH_SIZE = 1000
+# Messages deleted per transaction by bulk deletes
+MESSAGE_DELETE_CHUNK_SIZE = 500
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Rows fetched per round trip of the server-side cursor of exports
+MESSAGE_EXPORT_BATCH_SIZE = 1000
+EXPORT_GZIP_LEVEL = 6
+MAXIMUM_SEARCH_QUERY_LENGTH = 200
+DEFAULT_CHANGE_LIMIT = 100
+MAXIMUM_CHANGE_LIMIT = 1000
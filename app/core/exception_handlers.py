@@ -1,8 +1,15 @@
+import math
 from urllib.request import Request
 
 from fastapi.exceptions import RequestValidationError
 from starlette.responses import JSONResponse
-from app.services.exceptions import NotFoundError, AlreadyExistsError
+from app.services.exceptions import (
+    NotFoundError,
+    AlreadyExistsError,
+    BadRequestError,
+    GoneError,
+    TooManyRequestsError,
+)
 
 
 def not_found_exception_handler(request: Request, exc: Exception) -> JSONResponse:
@@ -13,6 +20,24 @@ def conflict_exception_handler(request: Request, exc: Exception) -> JSONResponse
     return JSONResponse(status_code=409, content={"message": str(exc)})
 
 
+def bad_request_exception_handler(request: Request, exc: Exception) -> JSONResponse:
+    return JSONResponse(status_code=400, content={"message": str(exc)})
+
+
+def gone_exception_handler(request: Request, exc: Exception) -> JSONResponse:
+    return JSONResponse(status_code=410, content={"message": str(exc)})
+
+
+def too_many_requests_exception_handler(
+    request: Request, exc: TooManyRequestsError
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"message": str(exc)},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+
 def validation_exception_handler(
     request: Request, exc: RequestValidationError
 ) -> JSONResponse:
@@ -31,4 +56,7 @@ def validation_exception_handler(
 def setup_exception_handlers(app):
     app.add_exception_handler(NotFoundError, not_found_exception_handler)
     app.add_exception_handler(AlreadyExistsError, conflict_exception_handler)
+    app.add_exception_handler(BadRequestError, bad_request_exception_handler)
+    app.add_exception_handler(GoneError, gone_exception_handler)
+    app.add_exception_handler(TooManyRequestsError, too_many_requests_exception_handler)
     app.add_exception_handler(RequestValidationError, validation_exception_handler)
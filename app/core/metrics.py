@@ -0,0 +1,263 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import Engine, event
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.075,
+    0.1,
+    0.25,
+    0.5,
+    0.75,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+DB_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+DB_QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Iterable[str], labelvalues: Iterable[str]) -> str:
+    pairs = [
+        f'{name}="{_escape(str(value))}"'
+        for name, value in zip(labelnames, labelvalues)
+    ]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in values
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+@dataclass
+class _HistogramValue:
+    buckets: list[int]
+    sum: float = 0.0
+    count: int = 0
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = DEFAULT_LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: dict[tuple, _HistogramValue] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = _HistogramValue(buckets=[0] * len(self.buckets))
+                self._values[key] = histogram
+            histogram.buckets[index] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def count(self, **labels) -> int:
+        histogram = self._values.get(self._key(labels))
+        return histogram.count if histogram else 0
+
+    def _samples(self) -> list[str]:
+        lines = []
+        with self._lock:
+            values = [
+                (key, list(value.buckets), value.sum, value.count)
+                for key, value in self._values.items()
+            ]
+        for key, buckets, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, buckets):
+                cumulative += bucket_count
+                labels = _format_labels(
+                    (*self.labelnames, "le"), (*key, _format_value(bound))
+                )
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list[Metric] = []
+        self._collectors: list[Callable[[], Iterable[Metric]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Metric]]) -> None:
+        # Collectors build metrics on demand from state owned elsewhere
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        metrics = list(self._metrics)
+        for collector in self._collectors:
+            metrics.extend(collector())
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests_total = registry.register(
+    Counter(
+        "http_requests_total",
+        "Total HTTP requests.",
+        ("method", "route", "status_code"),
+    )
+)
+http_requests_in_progress = registry.register(
+    Gauge("http_requests_in_progress", "HTTP requests in progress.", ("method",))
+)
+http_request_duration_seconds = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency in seconds.",
+        ("method", "route", "status_code"),
+    )
+)
+db_queries_per_request = registry.register(
+    Histogram(
+        "db_queries_per_request",
+        "Database queries executed per HTTP request.",
+        ("method", "route"),
+        buckets=DB_QUERY_COUNT_BUCKETS,
+    )
+)
+db_query_duration_seconds_per_request = registry.register(
+    Histogram(
+        "db_query_duration_seconds_per_request",
+        "Total database query time per HTTP request in seconds.",
+        ("method", "route"),
+        buckets=DB_LATENCY_BUCKETS,
+    )
+)
+db_query_duration_seconds = registry.register(
+    Histogram(
+        "db_query_duration_seconds",
+        "Database query latency in seconds.",
+        buckets=DB_LATENCY_BUCKETS,
+    )
+)
+
+
+@dataclass
+class RequestDatabaseStats:
+    queries: int = 0
+    duration: float = 0.0
+
+
+# Set for the duration of each HTTP request; threadpool workers inherit a
+# copy of the context, so sync handlers update the same stats object.
+request_db_stats: ContextVar[Optional[RequestDatabaseStats]] = ContextVar(
+    "request_db_stats", default=None
+)
+
+
+# The start time is kept on the execution context, not the connection: a
+# failing statement never reaches after_cursor_execute, and its context is
+# dropped with it instead of leaving a stale entry on a pooled connection.
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start_time = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - context._query_start_time
+    db_query_duration_seconds.observe(duration)
+    stats = request_db_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.duration += duration
+
+
+def instrument_engine(engine: Engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
@@ -1,19 +1,141 @@
-import time
 import logging
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core import config, metrics
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+
+
+class _DeferredQueueHandler(QueueHandler):
+    # The default prepare() formats the record in the calling thread; here
+    # formatting is left to the listener thread, off the event loop.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_queue_handler = _DeferredQueueHandler(_log_queue)
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+_log_listener = QueueListener(_log_queue, _stream_handler)
+# Records only go through the queue while the listener drains it; before
+# startup, and in tests and scripts that never start it, they are written
+# directly instead of piling up in the queue.
+logger.addHandler(_stream_handler)
+
+
+def start_request_logging() -> None:
+    if _log_listener._thread is None:
+        _log_listener.start()
+        logger.addHandler(_queue_handler)
+        logger.removeHandler(_stream_handler)
+
+
+def stop_request_logging() -> None:
+    if _log_listener._thread is not None:
+        logger.addHandler(_stream_handler)
+        logger.removeHandler(_queue_handler)
+        # Writes the records still queued
+        _log_listener.stop()
+
+
+# Route label of requests no route matched; their paths are unbounded
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def get_route_template(scope: Scope, default: str = UNMATCHED_ROUTE) -> str:
+    route = scope.get("route")
+    return getattr(route, "path_format", None) or default
+
+
+class LoggingMiddleware:
+    def __init__(self, app: ASGIApp, sample_rate: float = config.LOG_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or (
+            self.sample_rate < 1.0 and random.random() >= self.sample_rate
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start_time = time.perf_counter_ns()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration_ms = (time.perf_counter_ns() - start_time) / 1_000_000
+            # Unlike metric labels, log lines can carry the raw path
+            route = get_route_template(scope, default=scope["path"])
+            logger.info(
+                "Request: %s %s - Status: %d - Time: %.0f ms",
+                scope["method"],
+                route,
+                status_code,
+                duration_ms,
+                extra={
+                    "method": scope["method"],
+                    "route": route,
+                    "status_code": status_code,
+                    "duration_ms": duration_ms,
+                },
+            )
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        db_stats = metrics.RequestDatabaseStats()
+        token = metrics.request_db_stats.set(db_stats)
+        metrics.http_requests_in_progress.inc(method=method)
+        start_time = time.perf_counter_ns()
 
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        response = await call_next(request)
-        process_time = time.time() - start_time
-        logger.info(
-            f"Request: {request.method} {request.url.path} - Time: {process_time*1000:.0f} ms"
-        )
-        return response
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = (time.perf_counter_ns() - start_time) / 1_000_000_000
+            metrics.request_db_stats.reset(token)
+            metrics.http_requests_in_progress.dec(method=method)
+            route = get_route_template(scope)
+            metrics.http_requests_total.inc(
+                method=method, route=route, status_code=status_code
+            )
+            metrics.http_request_duration_seconds.observe(
+                duration, method=method, route=route, status_code=status_code
+            )
+            metrics.db_queries_per_request.observe(
+                db_stats.queries, method=method, route=route
+            )
+            metrics.db_query_duration_seconds_per_request.observe(
+                db_stats.duration, method=method, route=route
+            )
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import threading
+from abc import ABC
+from typing import Any, Callable, Optional
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is an optional dependency
+    redis = None
+
+from app.core import config
+from app.core.metrics import Counter, Gauge, Metric, registry as metrics_registry
+
+Deliver = Callable[[str, dict], None]
+
+
+class SubscriptionOverflow(Exception):
+    """Raised to a subscriber that fell too far behind its topic."""
+
+
+class Subscription:
+    """Bounded per-subscriber queue, owned by the event loop that reads it.
+
+    Publishers never wait for slow readers: once the queue is full the
+    subscription is dropped from the hub, the reader drains what was queued
+    and then gets SubscriptionOverflow, so it can reconnect and catch up.
+    """
+
+    def __init__(self, hub: "MessageHub", topic: str, maxsize: int):
+        self.hub = hub
+        self.topic = topic
+        self.overflowed = False
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=maxsize)
+
+    def put(self, data: dict) -> None:
+        # Publishers run in threadpool workers or on other event loops
+        try:
+            self._loop.call_soon_threadsafe(self._put, data)
+        except RuntimeError:
+            # The reader's event loop is already closed
+            self.hub.unsubscribe(self)
+
+    def _put(self, data: dict) -> None:
+        if self.overflowed:
+            return
+        try:
+            self._queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self.hub.unsubscribe(self)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Next item, or None when nothing was published within `timeout`."""
+        if self.overflowed and self._queue.empty():
+            raise SubscriptionOverflow()
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self)
+
+
+class PubSubBackend(ABC):
+    """Carries published items to the hubs of every worker.
+
+    `attach` is given the hub's local delivery function; a cross-worker
+    backend calls it for items published by any worker, this one included.
+    """
+
+    # Remote backends must always publish; local ones only for live topics
+    is_local = True
+
+    def attach(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    def publish(self, topic: str, data: dict) -> None:
+        self._deliver(topic, data)
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+
+class LocalPubSubBackend(PubSubBackend):
+    pass
+
+
+class RedisPubSubBackend(PubSubBackend):
+    """Fans out between workers through Redis channels, one per topic."""
+
+    is_local = False
+
+    def __init__(self, client: Any, prefix: str = "pubsub:"):
+        self.client = client
+        self.prefix = prefix
+        self._thread = None
+
+    def publish(self, topic: str, data: dict) -> None:
+        self.client.publish(self.prefix + topic, json.dumps(data))
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(**{self.prefix + "*": self._on_message})
+        self._thread = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+
+    def _on_message(self, message: dict) -> None:
+        channel = message["channel"]
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        self._deliver(channel[len(self.prefix) :], json.loads(message["data"]))
+
+
+class MessageHub:
+    """In-process publish/subscribe of JSON-serializable dicts by topic."""
+
+    def __init__(self, backend: PubSubBackend, queue_size: int):
+        self.backend = backend
+        self.queue_size = queue_size
+        self.overflows = 0
+        self._subscriptions: dict[str, set[Subscription]] = {}
+        self._lock = threading.Lock()
+        backend.attach(self._deliver)
+
+    def subscribe(self, topic: str) -> Subscription:
+        """Must be called from the event loop that will read the subscription."""
+        subscription = Subscription(self, topic, maxsize=self.queue_size)
+        with self._lock:
+            self._subscriptions.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.topic)
+            if subscriptions is None or subscription not in subscriptions:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.topic]
+            if subscription.overflowed:
+                self.overflows += 1
+
+    def has_listeners(self, topic: str) -> bool:
+        """Whether publishing to `topic` can reach anyone; lets callers skip
+        building payloads nobody would receive."""
+        return not self.backend.is_local or topic in self._subscriptions
+
+    def publish(self, topic: str, data: dict) -> None:
+        self.backend.publish(topic, data)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subs) for subs in self._subscriptions.values())
+
+    def _deliver(self, topic: str, data: dict) -> None:
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(topic, ()))
+        for subscription in subscriptions:
+            subscription.put(data)
+
+
+def create_pubsub_backend(backend: str, prefix: str = "pubsub:") -> PubSubBackend:
+    if backend == "memory":
+        return LocalPubSubBackend()
+    if backend == "redis":
+        if redis is None:
+            raise RuntimeError("The redis pub/sub backend requires the redis package")
+        client = redis.Redis.from_url(config.REDIS_URL)
+        return RedisPubSubBackend(client=client, prefix=prefix)
+    raise ValueError(f"Unknown pub/sub backend: {backend}")
+
+
+message_hub = MessageHub(
+    backend=create_pubsub_backend(config.MESSAGE_STREAM_BACKEND, prefix="messages:"),
+    queue_size=config.MESSAGE_STREAM_QUEUE_SIZE,
+)
+
+
+def _collect_message_hub_metrics() -> list[Metric]:
+    subscribers = Gauge("message_stream_subscribers", "Open message streams.")
+    subscribers.set(message_hub.subscriber_count())
+    overflows = Counter(
+        "message_stream_overflows_total",
+        "Message streams dropped for falling behind.",
+    )
+    overflows.inc(message_hub.overflows)
+    return [subscribers, overflows]
+
+
+metrics_registry.register_collector(_collect_message_hub_metrics)
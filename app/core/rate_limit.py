@@ -0,0 +1,219 @@
+import re
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # pragma: no cover - redis is an optional dependency
+    redis_asyncio = None
+
+from app.core import config
+from app.core.metrics import Counter, registry as metrics_registry
+
+_RATE_LIMIT_PATTERN = re.compile(
+    r"(?P<method>[A-Z]+) (?P<route>\S+)="
+    r"(?P<requests>\d+)/(?P<unit>[smh])(?::(?P<burst>\d+))?(?P<per_user>@user)?"
+)
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600}
+
+# Token buckets in one round trip, with the rate and burst of each key in
+# ARGV; Redis' clock is shared by all workers
+_TOKEN_BUCKET_SCRIPT = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local tokens = {}
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    local state = redis.call("HMGET", key, "tokens", "updated")
+    local available = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    available = math.min(burst, available + math.max(0, now - updated) * rate)
+    if available < 1 then
+        retry_after = math.max(retry_after, (1 - available) / rate)
+    end
+    tokens[i] = available
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    if retry_after == 0 then
+        tokens[i] = tokens[i] - 1
+    end
+    redis.call("HSET", key, "tokens", tokens[i], "updated", now)
+    redis.call("EXPIRE", key, math.ceil(burst / rate) + 1)
+end
+return tostring(retry_after)
+"""
+
+rate_limited_requests = metrics_registry.register(
+    Counter(
+        "http_rate_limited_requests_total",
+        "Requests rejected by rate limits.",
+        ("method", "route"),
+    )
+)
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    method: str
+    # Route template, as in metrics: /api/users/{user_id}/messages/
+    route: str
+    # Tokens added per second, up to `burst`; every request takes one
+    rate: float
+    burst: int
+    # One bucket per user_id path parameter instead of one for the route
+    per_user: bool = False
+
+
+def parse_rate_limits(spec: str) -> list[RateLimit]:
+    """Parse ";"-separated limits like `POST /api/users/=10/s:20@user`:
+    10 requests per second (or m, h), bursts of up to 20, per user_id."""
+    limits = []
+    for item in spec.split(";"):
+        if not item.strip():
+            continue
+        match = _RATE_LIMIT_PATTERN.fullmatch(item.strip())
+        if match is None:
+            raise ValueError(f"Invalid rate limit: {item.strip()}")
+        requests = int(match["requests"])
+        limits.append(
+            RateLimit(
+                method=match["method"],
+                route=match["route"],
+                rate=requests / _UNIT_SECONDS[match["unit"]],
+                burst=int(match["burst"] or requests),
+                per_user=match["per_user"] is not None,
+            )
+        )
+    return limits
+
+
+# Key, tokens added per second and maximum tokens of a bucket
+Bucket = tuple[str, float, int]
+
+
+class RateLimitBackend(ABC):
+    @abstractmethod
+    async def acquire(self, buckets: list[Bucket]) -> float:
+        """Take a token from each of `buckets` if all of them have one: 0 if
+        they had, otherwise the seconds until they will, and none is taken."""
+
+    @abstractmethod
+    def reset(self) -> None: ...
+
+
+class NullRateLimitBackend(RateLimitBackend):
+    async def acquire(self, buckets: list[Bucket]) -> float:
+        return 0.0
+
+    def reset(self) -> None:
+        pass
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Buckets of this process, least recently used ones evicted first.
+
+    Only used from the event loop and never awaiting in between reading and
+    writing a bucket, so it needs no lock.
+    """
+
+    def __init__(self, max_buckets: int):
+        self.max_buckets = max_buckets
+        # key -> (tokens, monotonic time of the last update)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def acquire(self, buckets: list[Bucket]) -> float:
+        now = time.monotonic()
+        available = []
+        retry_after = 0.0
+        for key, rate, burst in buckets:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens < 1:
+                retry_after = max(retry_after, (1 - tokens) / rate)
+            available.append(tokens)
+        taken = 0 if retry_after else 1
+        for (key, _, _), tokens in zip(buckets, available):
+            self._buckets[key] = (tokens - taken, now)
+        # An evicted bucket comes back full, which only errs on the lenient side
+        while len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    def reset(self) -> None:
+        self._buckets.clear()
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """Buckets shared between workers, backed by an asyncio Redis client."""
+
+    def __init__(self, client: Any, prefix: str = "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(_TOKEN_BUCKET_SCRIPT)
+
+    async def acquire(self, buckets: list[Bucket]) -> float:
+        retry_after = await self._script(
+            keys=[self.prefix + key for key, _, _ in buckets],
+            args=[value for _, rate, burst in buckets for value in (rate, burst)],
+        )
+        return float(retry_after)
+
+    def reset(self) -> None:
+        pass
+
+
+class RateLimiter:
+    def __init__(self, backend: RateLimitBackend, limits: list[RateLimit]):
+        self.backend = backend
+        self.limits: dict[tuple[str, str], list[RateLimit]] = {}
+        for limit in limits:
+            self.limits.setdefault((limit.method, limit.route), []).append(limit)
+
+    async def check(self, method: str, route: str, user_id: Optional[str]) -> float:
+        """Seconds until a request to `route` may be retried, 0 if it may
+        go ahead now. A request rejected by one of the limits of the route
+        takes no token from the others."""
+        buckets = []
+        for limit in self.limits.get((method, route), ()):
+            # Limits of one route differ by rate and burst
+            key = f"{method} {route} {limit.rate:g}:{limit.burst}"
+            if limit.per_user and user_id is not None:
+                key += f" {user_id}"
+            buckets.append((key, limit.rate, limit.burst))
+        if not buckets:
+            return 0.0
+        retry_after = await self.backend.acquire(buckets)
+        if retry_after:
+            rate_limited_requests.inc(method=method, route=route)
+        return retry_after
+
+
+def create_rate_limiter(
+    backend: str, limits: list[RateLimit], max_buckets: int
+) -> RateLimiter:
+    if backend == "memory":
+        return RateLimiter(InMemoryRateLimitBackend(max_buckets=max_buckets), limits)
+    if backend == "redis":
+        if redis_asyncio is None:
+            raise RuntimeError(
+                "The redis rate limit backend requires the redis package"
+            )
+        client = redis_asyncio.Redis.from_url(config.REDIS_URL)
+        return RateLimiter(RedisRateLimitBackend(client=client), limits)
+    if backend == "none":
+        return RateLimiter(NullRateLimitBackend(), [])
+    raise ValueError(f"Unknown rate limit backend: {backend}")
+
+
+rate_limiter = create_rate_limiter(
+    backend=config.RATE_LIMIT_BACKEND,
+    limits=parse_rate_limits(config.RATE_LIMITS),
+    max_buckets=config.RATE_LIMIT_MAX_BUCKETS,
+)
@@ -0,0 +1,109 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Generic, Iterator, Optional, Sequence, TypeVar
+
+from app.core.metrics import Counter, registry as metrics_registry
+
+T = TypeVar("T")
+
+READ_ROUTING_POLICIES = ("round_robin", "least_load")
+
+# Session.info entry of the users a request wrote besides the one in its
+# path: the ids of created users and the (old and new) emails of all
+WRITTEN_KEYS = "read_your_writes_keys"
+
+routed_reads = metrics_registry.register(
+    Counter(
+        "db_routed_reads_total",
+        "Read-only requests by the engine serving them.",
+        ("target",),
+    )
+)
+
+
+def record_session_writes(session: Any, *keys: str) -> None:
+    """Note keys of users written through `session`; the session dependency
+    keeps reads of them on the primary after the request."""
+    session.info.setdefault(WRITTEN_KEYS, set()).update(keys)
+
+
+class ReadRouter(Generic[T]):
+    """Picks the replica serving a read-only request, or None for the
+    primary.
+
+    Replicas are taken in turn (round_robin) or by the fewest reads in
+    flight (least_load). Reads of a key written in the last
+    `sticky_seconds` stay on the primary, so a user reads their own writes
+    however far the replicas lag behind. Used from the threadpool of sync
+    routes as well as from the event loop, hence the lock.
+    """
+
+    def __init__(
+        self,
+        replicas: Sequence[T],
+        policy: str = "round_robin",
+        sticky_seconds: float = 0.0,
+        max_sticky_keys: int = 100_000,
+    ):
+        if policy not in READ_ROUTING_POLICIES:
+            raise ValueError(f"Unknown read routing policy: {policy}")
+        self.replicas = list(replicas)
+        self.policy = policy
+        self.sticky_seconds = sticky_seconds
+        self.max_sticky_keys = max_sticky_keys
+        self._in_flight = [0] * len(self.replicas)
+        self._turns = itertools.count()
+        # key -> monotonic time until which its reads go to the primary
+        self._sticky: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record_write(self, key: Optional[str]) -> None:
+        if key is None or not self.replicas or self.sticky_seconds <= 0:
+            return
+        with self._lock:
+            self._sticky.pop(key, None)
+            self._sticky[key] = time.monotonic() + self.sticky_seconds
+            # Oldest first: evicting one only ends its window early
+            while len(self._sticky) > self.max_sticky_keys:
+                self._sticky.popitem(last=False)
+
+    @contextmanager
+    def route(self, key: Optional[str]) -> Iterator[Optional[T]]:
+        index = self._acquire(key)
+        if index is None:
+            routed_reads.inc(target="primary")
+            yield None
+            return
+        routed_reads.inc(target=f"replica{index}")
+        try:
+            yield self.replicas[index]
+        finally:
+            with self._lock:
+                self._in_flight[index] -= 1
+
+    def _acquire(self, key: Optional[str]) -> Optional[int]:
+        if not self.replicas:
+            return None
+        with self._lock:
+            if key is not None and self._is_sticky(key):
+                return None
+            # Ties of least_load go round-robin too, so idle replicas share
+            # the reads instead of the first one taking them all
+            start = next(self._turns) % len(self.replicas)
+            order = self._in_flight[start:] + self._in_flight[:start]
+            offset = 0 if self.policy == "round_robin" else order.index(min(order))
+            index = (start + offset) % len(self.replicas)
+            self._in_flight[index] += 1
+            return index
+
+    def _is_sticky(self, key: str) -> bool:
+        until = self._sticky.get(key)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            del self._sticky[key]
+            return False
+        return True
@@ -3,3 +3,15 @@ USER_NOT_FOUND = "User not found"
 EMAIL_ALREADY_EXISTS = "A user with this email already exists"
 MESSAGE_NOT_FOUND = "Message not found"
 MESSAGE_NOT_FOUND_FOR_USER = "Message not found or doesn't belong to the user"
+INVALID_CURSOR = "Invalid pagination cursor"
+CONFLICTING_CURSORS = "Only one of 'after' and 'before' cursors can be provided"
+MESSAGE_BATCH_TOO_LARGE = "Message batch exceeds the maximum size"
+ID_ALREADY_EXISTS = "A record with this id already exists"
+ID_ALREADY_IMPORTED = "A record with this id already exists, skipped as imported"
+EMAIL_DUPLICATED_IN_BATCH = "A user with this email appears earlier in the batch"
+CONFLICTING_DELETE_FILTERS = "Exactly one of 'ids' and 'before' must be provided"
+RATE_LIMITED = "Too many requests, retry after the time in Retry-After"
+INVALID_SEARCH_QUERY = "Search query must contain at least one term"
+CHANGES_COMPACTED = (
+    "Changes since this sequence number were compacted, resync all messages"
+)
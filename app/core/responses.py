@@ -0,0 +1,34 @@
+from typing import Any, Iterable
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional dependency
+    orjson = None
+
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+from starlette.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered by orjson, which serializes UUIDs, datetimes
+    and dicts natively. Falls back to pydantic's serializer without orjson."""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return to_json(content)
+        return orjson.dumps(content)
+
+
+class RowSerializer:
+    """Turns result rows into plain dicts, validated once against a TypedDict.
+
+    On list endpoints this replaces ORM hydration, response_model validation
+    and jsonable_encoder: column rows -> dicts -> ORJSONResponse.
+    """
+
+    def __init__(self, row_type: type):
+        self._adapter = TypeAdapter(list[row_type])
+
+    def __call__(self, rows: Iterable) -> list[dict]:
+        return self._adapter.validate_python([row._mapping for row in rows])
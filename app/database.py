@@ -1,9 +1,210 @@
+from typing import Any, Optional
+
+from sqlalchemy import Connection, Engine, Table, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import DropIndex
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlmodel import SQLModel, create_engine
 
+from app.core import config
+from app.core.metrics import instrument_engine
+from app.core.read_routing import ReadRouter
+from app.models import Message, MessageChange
+from app.models.message_search import create_search_index
+
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _is_sqlite_memory(url: str) -> bool:
+    return _is_sqlite(url) and make_url(url).database in (None, "", ":memory:")
+
+
+def _to_async_url(url: str) -> str:
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+
+def _engine_options(url: str) -> dict[str, Any]:
+    options: dict[str, Any] = {
+        "echo": config.DATABASE_ECHO,
+        "pool_pre_ping": config.DATABASE_POOL_PRE_PING,
+        "pool_recycle": config.DATABASE_POOL_RECYCLE,
+    }
+    # In-memory SQLite uses a singleton/static pool that cannot be sized
+    if not _is_sqlite_memory(url):
+        options["pool_size"] = config.DATABASE_POOL_SIZE
+        options["max_overflow"] = config.DATABASE_MAX_OVERFLOW
+    return options
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS:d}")
+        cursor.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE:d}")
+        cursor.execute(f"PRAGMA cache_size={config.SQLITE_CACHE_SIZE:d}")
+        # Off by default; deleting a user relies on ON DELETE CASCADE
+        cursor.execute("PRAGMA foreign_keys=ON")
+    finally:
+        cursor.close()
+
+
+def set_sqlite_query_only(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        # A write routed to a read engine by mistake fails loudly
+        cursor.execute("PRAGMA query_only=ON")
+    finally:
+        cursor.close()
+
+
+def read_replica_urls(url: str) -> list[str]:
+    """URLs of the read engines of a primary at `url`."""
+    urls = list(config.DATABASE_READ_URLS)
+    # In-memory databases are private to a connection, nothing to share
+    if _is_sqlite(url) and not _is_sqlite_memory(url):
+        urls += [url] * config.SQLITE_READ_ENGINES
+    return urls
+
+
+def create_db_engine(url: str) -> Engine:
+    engine = create_engine(url, **_engine_options(url))
+    if _is_sqlite(url):
+        event.listen(engine, "connect", set_sqlite_pragmas)
+    instrument_engine(engine)
+    return engine
+
 
-DATABASE_URL = "sqlite:///./app.db"
-engine = create_engine(DATABASE_URL, echo=True)
+def create_async_db_engine(url: str) -> AsyncEngine:
+    async_url = _to_async_url(url)
+    async_engine = create_async_engine(async_url, **_engine_options(async_url))
+    if _is_sqlite(async_url):
+        event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+    instrument_engine(async_engine.sync_engine)
+    return async_engine
+
+
+def create_read_engine(url: str) -> Engine:
+    engine = create_db_engine(url)
+    if _is_sqlite(url):
+        event.listen(engine, "connect", set_sqlite_query_only)
+    return engine
+
+
+def create_async_read_engine(url: str) -> AsyncEngine:
+    async_engine = create_async_db_engine(url)
+    if _is_sqlite(url):
+        event.listen(async_engine.sync_engine, "connect", set_sqlite_query_only)
+    return async_engine
+
+
+def create_read_router(replicas: list) -> ReadRouter:
+    return ReadRouter(
+        replicas,
+        policy=config.DATABASE_READ_ROUTING,
+        sticky_seconds=config.READ_YOUR_WRITES_SECONDS,
+        max_sticky_keys=config.READ_YOUR_WRITES_MAX_USERS,
+    )
+
+
+engine = create_db_engine(config.DATABASE_URL)
+async_engine: Optional[AsyncEngine] = (
+    create_async_db_engine(config.DATABASE_URL) if config.DATABASE_ASYNC else None
+)
+# Engines of GET requests; without any, reads use the primary engines above
+read_router = create_read_router(
+    []
+    if config.DATABASE_ASYNC
+    else [create_read_engine(url) for url in read_replica_urls(config.DATABASE_URL)]
+)
+async_read_router = create_read_router(
+    [create_async_read_engine(url) for url in read_replica_urls(config.DATABASE_URL)]
+    if config.DATABASE_ASYNC
+    else []
+)
 
 
 def init_db() -> None:
     SQLModel.metadata.create_all(engine)
+    # Databases created before full-text search existed only get an empty
+    # index here; scripts/rebuild_search_index.py populates it.
+    with engine.begin() as connection:
+        create_search_index(connection)
+        create_missing_indexes(connection)
+
+
+async def init_async_db() -> None:
+    async with async_engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+        await connection.run_sync(create_search_index)
+        await connection.run_sync(create_missing_indexes)
+
+
+def create_missing_indexes(connection: Connection) -> None:
+    # create_all skips existing tables, including indexes added to them later
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def migrate_cascade_deletes(engine: Engine) -> list[str]:
+    """Rebuild SQLite tables created before their user foreign keys had
+    ON DELETE CASCADE; SQLite cannot alter a constraint in place.
+
+    Rows keep their rowids, so the search index stays valid. Returns the
+    names of the rebuilt tables.
+    """
+    if engine.dialect.name != "sqlite":
+        return []
+    with engine.connect() as connection:
+        # Cannot be switched inside a transaction
+        connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        try:
+            # pysqlite only opens transactions for DML; the rebuild must be
+            # all or nothing, DDL included
+            connection.exec_driver_sql("BEGIN")
+            migrated = [
+                table.name
+                for table in (Message.__table__, MessageChange.__table__)
+                if _rebuild_with_cascade_deletes(connection, table)
+            ]
+            create_search_index(connection)
+            connection.commit()
+        finally:
+            connection.rollback()
+            connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+    return migrated
+
+
+def _rebuild_with_cascade_deletes(connection: Connection, table: Table) -> bool:
+    foreign_keys = connection.exec_driver_sql(
+        f'PRAGMA foreign_key_list("{table.name}")'
+    ).all()
+    if all(fk.on_delete == "CASCADE" for fk in foreign_keys if fk.table == "user"):
+        return False
+    old_name = f"{table.name}_old"
+    for index in table.indexes:
+        connection.execute(DropIndex(index, if_exists=True))
+    # Triggers of the old table move with it and are dropped along with it
+    connection.exec_driver_sql(f'ALTER TABLE "{table.name}" RENAME TO "{old_name}"')
+    table.create(connection)
+    columns = ", ".join(["rowid"] + [f'"{c.name}"' for c in table.columns])
+    connection.exec_driver_sql(
+        f'INSERT INTO "{table.name}" ({columns}) SELECT {columns} FROM "{old_name}"'
+    )
+    if table.dialect_options["sqlite"]["autoincrement"]:
+        # Keep AUTOINCREMENT from reusing values of compacted rows
+        connection.exec_driver_sql(
+            "DELETE FROM sqlite_sequence WHERE name = ?", (table.name,)
+        )
+        connection.exec_driver_sql(
+            "UPDATE sqlite_sequence SET name = ? WHERE name = ?",
+            (table.name, old_name),
+        )
+    connection.exec_driver_sql(f'DROP TABLE "{old_name}"')
+    return True
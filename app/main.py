@@ -1,17 +1,44 @@
 from fastapi import FastAPI
 
+from app.core.compression import CompressionMiddleware
 from app.core.exception_handlers import setup_exception_handlers
-from app.core.middleware import LoggingMiddleware
-from app.database import init_db
+from app.core.middleware import (
+    LoggingMiddleware,
+    MetricsMiddleware,
+    start_request_logging,
+    stop_request_logging,
+)
+from app.core import config
+from app.core.pubsub import message_hub
+from app.database import init_db, init_async_db
+from app.services.group_commit import write_coalescer
 from app.api.routes.api import router as api_router
-
+from app.api.routes.metrics import router as metrics_router
 
 app = FastAPI()
 setup_exception_handlers(app)
+# Innermost, so request logs and metrics include the compression time
+app.add_middleware(CompressionMiddleware)
 app.add_middleware(LoggingMiddleware)
+app.add_middleware(MetricsMiddleware)
 app.include_router(api_router)
+app.include_router(metrics_router)
 
 
 @app.on_event("startup")
-def on_startup():
-    init_db()
+async def on_startup():
+    start_request_logging()
+    message_hub.backend.start()
+    if config.DATABASE_ASYNC:
+        await init_async_db()
+    else:
+        init_db()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    # Writes already queued are committed before the writer stops
+    if write_coalescer is not None:
+        write_coalescer.stop()
+    message_hub.backend.stop()
+    stop_request_logging()
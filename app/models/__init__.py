@@ -1,5 +1,7 @@
 # To avoid circular dependencies, models are imported here
-from .user import User
+from .user import User, UserVersion
 from .message import Message
+from .message_change import MessageChange, MessageChangeHorizon
+from . import message_search  # noqa: F401 - registers the search index DDL
 
-__all__ = ["Message", "User"]
+__all__ = ["Message", "MessageChange", "MessageChangeHorizon", "User", "UserVersion"]
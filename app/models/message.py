@@ -1,7 +1,11 @@
 import uuid
 from datetime import datetime
+from typing import Optional
 
-from sqlmodel import SQLModel, Field, Relationship
+from sqlmodel import SQLModel, Field, Relationship, Index
+from typing_extensions import TypedDict
+
+from app.core.constants import MAXIMUM_MESSAGE_BATCH_SIZE
 
 
 # Shared models
@@ -20,10 +24,53 @@ class MessagePublic(MessageBase):
     timestamp: datetime
 
 
+# Result row of column-only reads; same fields as MessagePublic
+class MessageRow(TypedDict):
+    id: uuid.UUID
+    sender_id: uuid.UUID
+    content: str
+    timestamp: datetime
+
+
+class MessagesPublic(SQLModel):
+    data: list[MessagePublic]
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+
+class MessageCreatedPublic(SQLModel):
+    id: uuid.UUID
+    timestamp: datetime
+
+
+class MessagesCreatedPublic(SQLModel):
+    data: list[MessageCreatedPublic]
+    count: int
+
+
+# Either the ids of the messages to delete, or a time before which all go
+class MessagesDelete(SQLModel):
+    ids: Optional[list[uuid.UUID]] = Field(
+        default=None, max_length=MAXIMUM_MESSAGE_BATCH_SIZE
+    )
+    before: Optional[datetime] = None
+
+
+class MessagesDeletedPublic(SQLModel):
+    count: int
+
+
 # Database models
 class Message(MessageBase, table=True):
+    __table_args__ = (
+        # Backs keyset pagination of a sender's messages ordered by (timestamp, id)
+        Index("ix_message_sender_id_timestamp_id", "sender_id", "timestamp", "id"),
+        # Lets retention find expired messages of all senders, oldest first
+        Index("ix_message_timestamp_id", "timestamp", "id"),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
-    sender_id: uuid.UUID = Field(foreign_key="user.id")
+    sender_id: uuid.UUID = Field(foreign_key="user.id", ondelete="CASCADE")
     sender: "User" = Relationship(back_populates="messages")  # noqa: F821
@@ -0,0 +1,62 @@
+import uuid
+from datetime import datetime
+from enum import Enum
+from typing import Optional
+
+from sqlmodel import SQLModel, Field, Index
+
+from .message import MessagePublic
+
+
+class ChangeOperation(str, Enum):
+    INSERT = "insert"
+    DELETE = "delete"
+
+
+# API models
+class MessageChangePublic(SQLModel):
+    seq: int
+    op: ChangeOperation
+    message_id: uuid.UUID
+    # Only set for inserts; deletes are tombstones
+    message: Optional[MessagePublic] = None
+
+
+class MessageChangesPublic(SQLModel):
+    data: list[MessageChangePublic]
+    # Pass as `since` to fetch the changes after this page
+    next_since: int
+    has_more: bool
+
+
+# Database models
+class MessageChange(SQLModel, table=True):
+    """Append-only log of message inserts and deletes (tombstones) per user.
+
+    `seq` comes from one AUTOINCREMENT counter, so it never goes backwards or
+    gets reused after compaction, and is increasing within each user's log.
+    """
+
+    __tablename__ = "message_change"
+    __table_args__ = (
+        Index("ix_message_change_user_id_seq", "user_id", "seq"),
+        {"sqlite_autoincrement": True},
+    )
+
+    seq: Optional[int] = Field(default=None, primary_key=True)
+    user_id: uuid.UUID = Field(foreign_key="user.id", ondelete="CASCADE")
+    message_id: uuid.UUID
+    op: ChangeOperation
+    changed_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class MessageChangeHorizon(SQLModel, table=True):
+    """Single row holding the highest seq removed by tombstone compaction.
+
+    Clients syncing from before it may have missed deletes and must resync.
+    """
+
+    __tablename__ = "message_change_horizon"
+
+    id: int = Field(default=1, primary_key=True)
+    seq: int = 0
@@ -0,0 +1,91 @@
+# Full-text search index over message content, backed by an SQLite FTS5 table.
+# Triggers keep it in sync with the message table on insert, update and delete.
+# Index rows share the rowid of their message so deletes are point lookups.
+# VACUUM may renumber message rowids, after which the index should be rebuilt
+# (scripts/rebuild_search_index.py); until then, matching on message_id keeps
+# a stale index from deleting or returning the wrong message, and INSERT OR
+# REPLACE keeps a reused rowid from failing inserts.
+from sqlalchemy import Column, Connection, Float, Integer, MetaData, String, Table
+from sqlalchemy import event, text
+
+from .message import Message
+
+SEARCH_INDEX_TABLE = "message_fts"
+
+# Kept out of SQLModel.metadata: the virtual table is created by the DDL below
+message_fts = Table(
+    SEARCH_INDEX_TABLE,
+    MetaData(),
+    Column("rowid", Integer, primary_key=True),
+    Column("content", String),
+    Column("sender_id", String),
+    Column("message_id", String),
+    Column("rank", Float),
+)
+
+_CREATE_SEARCH_INDEX = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_INDEX_TABLE} USING fts5(
+        content, sender_id, message_id UNINDEXED, tokenize = 'unicode61'
+    )
+    """,
+    # Rank on content only; sender_id is there to filter by sender
+    f"""
+    INSERT INTO {SEARCH_INDEX_TABLE}({SEARCH_INDEX_TABLE}, rank)
+    VALUES ('rank', 'bm25(1.0, 0.0)')
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS message_fts_insert AFTER INSERT ON message
+    BEGIN
+        INSERT OR REPLACE INTO {SEARCH_INDEX_TABLE}(
+            rowid, content, sender_id, message_id
+        )
+        VALUES (new.rowid, new.content, new.sender_id, new.id);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS message_fts_delete AFTER DELETE ON message
+    BEGIN
+        DELETE FROM {SEARCH_INDEX_TABLE}
+        WHERE rowid = old.rowid AND message_id = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS message_fts_update
+    AFTER UPDATE OF content, sender_id ON message
+    BEGIN
+        DELETE FROM {SEARCH_INDEX_TABLE}
+        WHERE rowid = old.rowid AND message_id = old.id;
+        INSERT OR REPLACE INTO {SEARCH_INDEX_TABLE}(
+            rowid, content, sender_id, message_id
+        )
+        VALUES (new.rowid, new.content, new.sender_id, new.id);
+    END
+    """,
+]
+
+
+def create_search_index(connection: Connection) -> None:
+    if connection.dialect.name != "sqlite":
+        return
+    for statement in _CREATE_SEARCH_INDEX:
+        connection.execute(text(statement))
+
+
+def rebuild_search_index(connection: Connection) -> int:
+    create_search_index(connection)
+    connection.execute(text(f"DELETE FROM {SEARCH_INDEX_TABLE}"))
+    result = connection.execute(
+        text(
+            f"INSERT INTO {SEARCH_INDEX_TABLE}(rowid, content, sender_id, message_id) "
+            "SELECT rowid, content, sender_id, id FROM message"
+        )
+    )
+    optimize = f"INSERT INTO {SEARCH_INDEX_TABLE}({SEARCH_INDEX_TABLE}) VALUES (?)"
+    connection.exec_driver_sql(optimize, ("optimize",))
+    return result.rowcount
+
+
+@event.listens_for(Message.__table__, "after_create")
+def _create_search_index_after_message_table(target, connection, **kw) -> None:
+    create_search_index(connection)
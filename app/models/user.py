@@ -1,8 +1,10 @@
 import uuid
-from typing import Optional
+from datetime import datetime
+from typing import Literal, Optional
 
 from pydantic import EmailStr
 from sqlmodel import SQLModel, Field, Relationship
+from typing_extensions import TypedDict
 
 
 # Shared models
@@ -25,9 +27,57 @@ class UserPublic(UserBase):
     id: uuid.UUID
 
 
+# Result row of column-only reads; same fields as UserPublic
+class UserRow(TypedDict):
+    id: uuid.UUID
+    name: str
+    email: str
+
+
+# Columns users can be paginated by; both are unique, so they make stable keys
+UserSortKey = Literal["id", "email"]
+
+
+class UsersPublic(SQLModel):
+    data: list[UserPublic]
+    next_cursor: Optional[str] = None
+    # Only computed on request; see user_service.estimate_user_count
+    total: Optional[int] = None
+    total_exact: Optional[bool] = None
+
+
+class UserBatchItemPublic(SQLModel):
+    index: int
+    user: Optional[UserPublic] = None
+    error: Optional[str] = None
+
+
+class UsersBatchPublic(SQLModel):
+    data: list[UserBatchItemPublic]
+    created: int
+    conflicts: int
+
+
 # Database models
 class User(UserBase, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    # Messages are deleted by the database (ON DELETE CASCADE), never
+    # loaded into the session just to be deleted one by one
     messages: list["Message"] = Relationship(  # noqa: F821
-        back_populates="sender", cascade_delete=True
+        back_populates="sender", cascade_delete=True, passive_deletes=True
+    )
+
+
+class UserVersion(SQLModel, table=True):
+    """Counter of writes to a user and their messages, for conditional GETs.
+
+    Users get a row with their first write, until then they are at version 0.
+    """
+
+    __tablename__ = "user_version"
+
+    user_id: uuid.UUID = Field(
+        foreign_key="user.id", ondelete="CASCADE", primary_key=True
     )
+    version: int = 0
+    modified_at: datetime = Field(default_factory=datetime.utcnow)
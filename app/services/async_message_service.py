@@ -0,0 +1,179 @@
+from datetime import datetime
+from typing import AsyncIterator, Optional
+from uuid import UUID
+
+from sqlalchemy import Row
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.constants import (
+    DEFAULT_CHANGE_LIMIT,
+    DEFAULT_MESSAGE_LIMIT,
+    MESSAGE_DELETE_CHUNK_SIZE,
+    MESSAGE_EXPORT_BATCH_SIZE,
+)
+from app.services.exceptions import NotFoundError, BadRequestError
+from app.services.message_service import (
+    ChangesPage,
+    _changes_page,
+    _check_changes_available,
+    _latest_change_seq_query,
+    _message_changes_query,
+    _message_ids_query,
+    _messages_before_query,
+    _search_messages_page,
+    _search_messages_query,
+    _user_messages_query,
+    _user_messages_export_query,
+    _user_messages_page,
+    publish_messages,
+)
+from app.services.pagination import Page
+from app.models import Message, MessageChangeHorizon
+from app.models.message import MessageCreate
+from app.services import async_user_service as user_service
+from app.services import group_commit, message_service
+import app.core.resources as res
+
+
+async def get_user_messages(
+    session: AsyncSession,
+    user_id: UUID,
+    limit: int = DEFAULT_MESSAGE_LIMIT,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+) -> Page[Row]:
+    if after and before:
+        raise BadRequestError(message=res.CONFLICTING_CURSORS)
+    user = await user_service.get_user_by_id(session=session, user_id=user_id)
+    query = _user_messages_query(
+        sender_id=user.id, limit=limit, after=after, before=before
+    )
+    rows = list((await session.exec(query)).all())
+    return _user_messages_page(messages=rows, limit=limit, after=after, before=before)
+
+
+async def iter_user_messages(
+    session: AsyncSession, user_id: UUID, batch_size: int = MESSAGE_EXPORT_BATCH_SIZE
+) -> AsyncIterator[list[Row]]:
+    result = await session.stream(_user_messages_export_query(user_id, batch_size))
+    async for rows in result.partitions():
+        yield rows
+
+
+async def search_user_messages(
+    session: AsyncSession,
+    user_id: UUID,
+    q: str,
+    limit: int = DEFAULT_MESSAGE_LIMIT,
+    after: Optional[str] = None,
+) -> Page[Row]:
+    user = await user_service.get_user_by_id(session=session, user_id=user_id)
+    query = _search_messages_query(sender_id=user.id, q=q, limit=limit, after=after)
+    rows = (await session.exec(query)).all()
+    return _search_messages_page(rows=rows, limit=limit)
+
+
+async def get_message_for_user(
+    session: AsyncSession, user_id: UUID, message_id: UUID
+) -> Message:
+    user = await user_service.get_user_by_id(session=session, user_id=user_id)
+    query = (
+        select(Message)
+        .where(Message.sender_id == user.id)
+        .where(Message.id == message_id)
+    )
+    message = (await session.exec(query)).first()
+    if not message:
+        raise NotFoundError(message=res.MESSAGE_NOT_FOUND)
+    return message
+
+
+async def create_message_for_user(
+    session: AsyncSession, user_id: UUID, message_in: MessageCreate
+) -> Message:
+    message = await group_commit.run_write_async(
+        session, message_service.insert_message, user_id=user_id, message_in=message_in
+    )
+    # Results of the coalescer's writer come detached and already loaded
+    if message in session:
+        await session.refresh(message)
+    publish_messages(sender_id=user_id, messages=[message])
+    return message
+
+
+async def create_messages_for_user(
+    session: AsyncSession, user_id: UUID, messages_in: list[MessageCreate]
+) -> list[Message]:
+    messages = await group_commit.run_write_async(
+        session,
+        message_service.insert_messages,
+        user_id=user_id,
+        messages_in=messages_in,
+    )
+    if messages:
+        publish_messages(sender_id=user_id, messages=messages)
+    return messages
+
+
+async def delete_message_for_user(
+    session: AsyncSession, user_id: UUID, message_id: UUID
+) -> None:
+    await group_commit.run_write_async(
+        session,
+        message_service.delete_message_row,
+        user_id=user_id,
+        message_id=message_id,
+    )
+
+
+async def delete_messages_for_user(
+    session: AsyncSession,
+    user_id: UUID,
+    message_ids: Optional[list[UUID]] = None,
+    before: Optional[datetime] = None,
+    chunk_size: int = MESSAGE_DELETE_CHUNK_SIZE,
+) -> int:
+    if (message_ids is None) == (before is None):
+        raise BadRequestError(message=res.CONFLICTING_DELETE_FILTERS)
+    user = await user_service.get_user_by_id(session=session, user_id=user_id)
+    deleted = 0
+    if message_ids is not None:
+        for start in range(0, len(message_ids), chunk_size):
+            chunk = message_ids[start : start + chunk_size]
+            query = _message_ids_query(user.id).where(Message.id.in_(chunk))
+            deleted += await group_commit.run_write_async(
+                session,
+                message_service.delete_message_chunk,
+                sender_id=user.id,
+                query=query,
+            )
+        return deleted
+    query = _messages_before_query(user.id, before).limit(chunk_size)
+    while True:
+        count = await group_commit.run_write_async(
+            session,
+            message_service.delete_message_chunk,
+            sender_id=user.id,
+            query=query,
+        )
+        deleted += count
+        if count < chunk_size:
+            return deleted
+
+
+async def get_message_changes(
+    session: AsyncSession,
+    user_id: UUID,
+    since: Optional[int] = None,
+    limit: int = DEFAULT_CHANGE_LIMIT,
+) -> ChangesPage:
+    user = await user_service.get_user_by_id(session=session, user_id=user_id)
+    horizon = await session.get(MessageChangeHorizon, 1)
+    horizon_seq = horizon.seq if horizon else 0
+    latest_seq = (await session.exec(_latest_change_seq_query())).one() or 0
+    if since is None:
+        return ChangesPage(next_since=max(latest_seq, horizon_seq))
+    _check_changes_available(since=since, horizon_seq=horizon_seq)
+    rows = (await session.exec(_message_changes_query(user.id, since, limit))).all()
+    return _changes_page(rows=rows, since=since, limit=limit, latest_seq=latest_seq)
@@ -0,0 +1,160 @@
+import uuid
+from typing import Optional
+
+from sqlalchemy import Row
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.constants import DEFAULT_USER_LIMIT, USER_COUNT_EXACT_LIMIT
+from app.core.read_routing import record_session_writes
+from app.services import group_commit, user_service
+from app.services.exceptions import NotFoundError, AlreadyExistsError
+from app.services.pagination import Page
+from app.models.user import UserCreate, User, UserUpdate, UserSortKey
+from app.services.user_service import (
+    UserBatchItem,
+    UserCount,
+    _bounded_count_query,
+    _cache_user,
+    _email_cache_key,
+    _id_cache_key,
+    _table_rows_estimate_query,
+    _user_count_estimate,
+    _user_from_cache,
+    _user_version_query,
+    _users_page,
+    _users_query,
+)
+import app.core.resources as res
+
+
+async def get_users(
+    session: AsyncSession,
+    limit: int = DEFAULT_USER_LIMIT,
+    after: Optional[str] = None,
+    order_by: UserSortKey = "id",
+    email_prefix: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+) -> Page[Row]:
+    query = _users_query(
+        limit=limit,
+        after=after,
+        order_by=order_by,
+        email_prefix=email_prefix,
+        name_prefix=name_prefix,
+    )
+    rows = list((await session.exec(query)).all())
+    return _users_page(users=rows, limit=limit, order_by=order_by)
+
+
+async def estimate_user_count(
+    session: AsyncSession,
+    email_prefix: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+) -> UserCount:
+    count = (await session.exec(_bounded_count_query(email_prefix, name_prefix))).one()
+    if count <= USER_COUNT_EXACT_LIMIT:
+        return UserCount(value=count, exact=True)
+    estimate = None
+    if not email_prefix and not name_prefix:
+        estimate_query = _table_rows_estimate_query(session.get_bind().dialect.name)
+        if estimate_query is not None:
+            estimate = (await session.exec(estimate_query)).scalar()
+    return _user_count_estimate(estimate)
+
+
+async def get_user_by_email(session: AsyncSession, email: str) -> User:
+    cached_user = _user_from_cache(key=_email_cache_key(email))
+    if cached_user:
+        return await session.merge(cached_user, load=False)
+    user = await _get_user_by_email(session=session, email=email)
+    if not user:
+        raise NotFoundError(message=res.USER_NOT_FOUND)
+    _cache_user(user)
+    return user
+
+
+async def _get_user_by_email(session: AsyncSession, email: str) -> Optional[User]:
+    user = select(User).where(User.email == email)
+    result_user = (await session.exec(user)).first()
+    return result_user
+
+
+async def get_user_by_id(session: AsyncSession, user_id: uuid.UUID) -> User:
+    cached_user = _user_from_cache(key=_id_cache_key(user_id))
+    if cached_user:
+        return await session.merge(cached_user, load=False)
+    user = await session.get(User, user_id)
+    if not user:
+        raise NotFoundError(message=res.USER_NOT_FOUND)
+    _cache_user(user)
+    return user
+
+
+async def get_user_version_by_email(session: AsyncSession, email: str) -> Optional[Row]:
+    query = _user_version_query().where(User.email == email)
+    return (await session.exec(query)).first()
+
+
+async def get_user_version_by_id(
+    session: AsyncSession, user_id: uuid.UUID
+) -> Optional[Row]:
+    query = _user_version_query().where(User.id == user_id)
+    return (await session.exec(query)).first()
+
+
+async def create_user(session: AsyncSession, user_in: UserCreate) -> User:
+    user = await group_commit.run_write_async(
+        session, user_service.insert_user, user_in=user_in
+    )
+    # Results of the coalescer's writer come detached and already loaded
+    if user in session:
+        await session.refresh(user)
+    record_session_writes(session, str(user.id), user.email)
+    return user
+
+
+async def create_users(
+    session: AsyncSession, users_in: list[UserCreate]
+) -> list[UserBatchItem]:
+    try:
+        items = await group_commit.run_write_async(
+            session, user_service.insert_users, users_in=users_in
+        )
+    except IntegrityError:
+        # An email was taken concurrently after the conflict check. The insert
+        # was rolled back; checking again reports the conflict for its item.
+        try:
+            items = await group_commit.run_write_async(
+                session, user_service.insert_users, users_in=users_in
+            )
+        except IntegrityError:
+            raise AlreadyExistsError(message=res.EMAIL_ALREADY_EXISTS)
+    record_session_writes(
+        session, *user_service.written_user_keys([item.user for item in items])
+    )
+    return items
+
+
+async def update_user(
+    session: AsyncSession, user_id: uuid.UUID, user_in: UserUpdate
+) -> User:
+    user, emails = await group_commit.run_write_async(
+        session, user_service.update_user_row, user_id=user_id, user_in=user_in
+    )
+    if emails:
+        user_service.invalidate_user(user_id, *emails)
+        record_session_writes(session, str(user_id), *emails)
+        # Results of the coalescer's writer come detached and already loaded
+        if user in session:
+            await session.refresh(user)
+    return user
+
+
+async def delete_user(session: AsyncSession, user_id: uuid.UUID) -> None:
+    email = await group_commit.run_write_async(
+        session, user_service.delete_user_row, user_id=user_id
+    )
+    user_service.invalidate_user(user_id, email)
+    record_session_writes(session, str(user_id), email)
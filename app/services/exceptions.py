@@ -8,3 +8,23 @@ class AlreadyExistsError(Exception):
     def __init__(self, message="Entity already exists"):
         self.message = message
         super().__init__(self.message)
+
+
+class BadRequestError(Exception):
+    def __init__(self, message="Bad request"):
+        self.message = message
+        super().__init__(self.message)
+
+
+class TooManyRequestsError(Exception):
+    def __init__(self, message="Too many requests", retry_after: float = 1):
+        self.message = message
+        # Seconds until the request may be retried
+        self.retry_after = retry_after
+        super().__init__(self.message)
+
+
+class GoneError(Exception):
+    def __init__(self, message="Entity no longer available"):
+        self.message = message
+        super().__init__(self.message)
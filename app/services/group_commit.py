@@ -0,0 +1,202 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, TypeVar
+
+from sqlalchemy import Engine
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core import config
+from app.core.metrics import Counter, Metric, registry as metrics_registry
+from app.database import engine
+
+T = TypeVar("T")
+
+# A write operation: runs its statements in the given session, does not
+# commit, and returns its result. The services' operations are public: the
+# sync and async services run the same ones.
+WriteOperation = Callable[..., T]
+
+_STOP = object()
+
+
+@dataclass
+class WriteCoalescerStats:
+    batches: int = 0
+    writes: int = 0
+
+
+class WriteCoalescer:
+    """Runs the write operations of concurrent requests on one writer thread,
+    many of them per transaction (group commit).
+
+    The writer takes every operation queued within `max_delay` seconds of
+    the first one, up to `max_batch_size`, and runs each in a savepoint of
+    one transaction: an operation that raises is rolled back alone and its
+    caller gets the exception, as it would have in a transaction of its
+    own. Callers' futures resolve once the transaction is committed.
+    Results are detached from the writer's session, with their attributes
+    loaded.
+    """
+
+    def __init__(self, engine: Engine, max_batch_size: int, max_delay: float):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.stats = WriteCoalescerStats()
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="write-coalescer", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(_STOP)
+                self._thread.join()
+                self._thread = None
+
+    def submit(self, operation: WriteOperation, **kwargs: Any) -> Future:
+        self.start()
+        future: Future = Future()
+        self._queue.put((operation, kwargs, future))
+        return future
+
+    def run(self, operation: WriteOperation[T], **kwargs: Any) -> T:
+        return self.submit(operation, **kwargs).result()
+
+    async def run_async(self, operation: WriteOperation[T], **kwargs: Any) -> T:
+        return await asyncio.wrap_future(self.submit(operation, **kwargs))
+
+    def _run(self) -> None:
+        with Session(self.engine, expire_on_commit=False) as session:
+            while True:
+                batch, stopping = self._next_batch()
+                if batch:
+                    self._write_batch(session, batch)
+                if stopping:
+                    return
+
+    def _next_batch(self) -> tuple[list, bool]:
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write_batch(self, session: Session, batch: list) -> None:
+        outcomes = []
+        try:
+            if self.engine.dialect.name == "sqlite":
+                # pysqlite would only begin at the first DML statement and
+                # a released outermost savepoint would commit on its own
+                session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+            for operation, kwargs, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    with session.begin_nested():
+                        outcomes.append((future, operation(session, **kwargs), None))
+                except Exception as exc:
+                    outcomes.append((future, None, exc))
+            session.commit()
+        except Exception as exc:
+            session.rollback()
+            for operation, kwargs, future in batch:
+                if future.running():
+                    future.set_exception(exc)
+            return
+        finally:
+            session.expunge_all()
+        self.stats.batches += 1
+        self.stats.writes += len(outcomes)
+        for future, result, exc in outcomes:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
+
+
+def create_write_coalescer(
+    enabled: bool, max_batch_size: int, max_delay_ms: float
+) -> Optional[WriteCoalescer]:
+    if not enabled:
+        return None
+    return WriteCoalescer(
+        engine=engine, max_batch_size=max_batch_size, max_delay=max_delay_ms / 1000
+    )
+
+
+write_coalescer = create_write_coalescer(
+    enabled=config.WRITE_COALESCING,
+    max_batch_size=config.WRITE_COALESCING_MAX_BATCH_SIZE,
+    max_delay_ms=config.WRITE_COALESCING_MAX_DELAY_MS,
+)
+
+
+def run_write(session: Session, operation: WriteOperation[T], **kwargs: Any) -> T:
+    """Run a write operation and commit it: in `session`, or batched with the
+    writes of concurrent requests when write coalescing is enabled."""
+    if write_coalescer is not None:
+        return write_coalescer.run(operation, **kwargs)
+    try:
+        result = operation(session, **kwargs)
+        # Inside the try: the flush of a commit can fail as well
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return result
+
+
+async def run_write_async(
+    session: AsyncSession, operation: WriteOperation[T], **kwargs: Any
+) -> T:
+    """run_write for an async session: the same operation runs in its sync
+    session, so sync and async services cannot write differently."""
+    if write_coalescer is not None:
+        return await write_coalescer.run_async(operation, **kwargs)
+    try:
+        result = await session.run_sync(operation, **kwargs)
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    return result
+
+
+def _collect_write_coalescer_metrics() -> list[Metric]:
+    if write_coalescer is None:
+        return []
+    batches = Counter(
+        "write_coalescer_batches_total", "Transactions committed by the writer."
+    )
+    batches.inc(write_coalescer.stats.batches)
+    writes = Counter(
+        "write_coalescer_writes_total", "Write operations run by the writer."
+    )
+    writes.inc(write_coalescer.stats.writes)
+    return [batches, writes]
+
+
+metrics_registry.register_collector(_collect_write_coalescer_metrics)
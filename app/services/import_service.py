@@ -0,0 +1,344 @@
+import csv
+import json
+import os
+import uuid
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import IO, Callable, Iterable, Iterator, Literal, Optional, Union
+
+from pydantic import ValidationError
+from sqlmodel import Session, insert, select
+
+from app.models import Message, MessageChange, User
+from app.models.message import MessageCreate
+from app.models.message_change import ChangeOperation
+from app.models.user import UserCreate
+from app.services import user_service
+import app.core.resources as res
+
+ImportKind = Literal["users", "messages"]
+ImportFormat = Literal["ndjson", "csv"]
+
+# A record as read from the input: its 1-based number and a raw NDJSON line
+# or a CSV row
+RawRecord = tuple[int, Union[str, dict]]
+OnReject = Callable[[int, str], None]
+
+
+class UserRecord(UserCreate):
+    id: Optional[uuid.UUID] = None
+
+
+class MessageRecord(MessageCreate):
+    id: Optional[uuid.UUID] = None
+    sender_id: uuid.UUID
+    timestamp: Optional[datetime] = None
+
+
+_RECORD_MODELS = {"users": UserRecord, "messages": MessageRecord}
+
+# Values per IN list of the lookups, below SQLite's bound parameter limit
+LOOKUP_CHUNK_SIZE = 500
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    # Already present, e.g. committed just before an interrupted run stopped
+    skipped: int = 0
+    rejected: int = 0
+
+
+class ImportCheckpoint:
+    """Number of input records already processed, kept in a JSON file.
+
+    Written atomically after every commit, so an interrupted import resumes
+    after the last committed batch; a finished import is marked done and
+    not resumed. It also keeps the id of the import, from which the ids of
+    records without one are derived: a resumed import derives the same ids
+    again, any other import different ones.
+    """
+
+    def __init__(self, path: Path, source: str, kind: ImportKind):
+        self.path = Path(path)
+        self.source = source
+        self.kind = kind
+        self.import_id = uuid.uuid4()
+        self.records = 0
+        # Existing records skipped by all runs of the import
+        self.skipped = 0
+
+    def resumable(self) -> bool:
+        if not self.path.exists():
+            return False
+        return not json.loads(self.path.read_text()).get("done", False)
+
+    def load(self) -> int:
+        if not self.path.exists():
+            return 0
+        state = json.loads(self.path.read_text())
+        if state["source"] != self.source or state["kind"] != self.kind:
+            raise ValueError(f"Checkpoint {self.path} belongs to another import")
+        self.import_id = uuid.UUID(state["import_id"])
+        self.records = state["records"]
+        self.skipped = state.get("skipped", 0)
+        return self.records
+
+    def save(self, records: int, skipped: int = 0, done: bool = False) -> None:
+        self.records = records
+        self.skipped = skipped
+        state = {
+            "source": self.source,
+            "kind": self.kind,
+            "import_id": str(self.import_id),
+            "records": records,
+            "skipped": skipped,
+            "done": done,
+        }
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        temp_path.write_text(json.dumps(state))
+        os.replace(temp_path, self.path)
+
+
+def read_records(
+    stream: IO[str], format: ImportFormat, skip: int = 0
+) -> Iterator[RawRecord]:
+    """Records of an NDJSON or CSV (with a header row) stream, numbered
+    from 1; the first `skip` records are read but not returned."""
+    if format == "csv":
+        records: Iterable = csv.DictReader(stream)
+    else:
+        records = (line for line in stream if line.strip())
+    for number, record in enumerate(records, start=1):
+        if number > skip:
+            yield number, record
+
+
+def validate_records(
+    kind: ImportKind, import_id: uuid.UUID, records: list[RawRecord]
+) -> tuple[list[tuple[int, dict]], list[tuple[int, str]]]:
+    """Validate records into insertable rows; runs in worker processes.
+
+    Records without an id get one derived from `import_id` and their
+    number, so resuming the import yields the same ids.
+    """
+    model = _RECORD_MODELS[kind]
+    rows, errors = [], []
+    for number, record in records:
+        try:
+            data = json.loads(record) if isinstance(record, str) else record
+            if not isinstance(data, dict):
+                raise ValueError("Record must be an object")
+            # Empty CSV cells are missing values
+            data = {key: value for key, value in data.items() if value != ""}
+            row = model.model_validate(data).model_dump(exclude_none=True)
+        except ValidationError as exc:
+            errors.append((number, _format_errors(exc)))
+            continue
+        except ValueError as exc:
+            errors.append((number, str(exc)))
+            continue
+        row.setdefault("id", uuid.uuid5(import_id, str(number)))
+        if kind == "messages":
+            row.setdefault("timestamp", datetime.utcnow())
+        rows.append((number, row))
+    return rows, errors
+
+
+def _format_errors(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}"
+        for error in exc.errors()
+    )
+
+
+def import_records(
+    session: Session,
+    kind: ImportKind,
+    import_id: uuid.UUID,
+    records: Iterable[RawRecord],
+    checkpoint: Optional[ImportCheckpoint] = None,
+    resumed: bool = False,
+    workers: int = 0,
+    chunk_size: int = 1000,
+    commit_size: int = 10_000,
+    on_reject: Optional[OnReject] = None,
+    on_skip: Optional[OnReject] = None,
+) -> ImportResult:
+    """Validate records in `workers` processes (in this one with 0) and
+    insert them from this process with one executemany per commit.
+
+    Records are committed in input order, about `commit_size` at a time,
+    and the checkpoint is saved after every commit. Records whose id is
+    taken are skipped when `resumed`, as an interrupted run may have
+    committed them, and rejected otherwise; skipped records are reported
+    to `on_skip` and counted in the checkpoint.
+    """
+    result = ImportResult()
+    on_reject = on_reject or (lambda number, error: None)
+    on_skip = on_skip or (lambda number, error: None)
+    skipped_before = checkpoint.skipped if checkpoint is not None else 0
+    pending: list[tuple[int, dict]] = []
+    last_number = None
+    for rows, errors, chunk_end in _validated_chunks(
+        kind, import_id, records, workers, chunk_size
+    ):
+        for number, error in errors:
+            result.rejected += 1
+            on_reject(number, error)
+        pending.extend(rows)
+        last_number = chunk_end
+        if len(pending) >= commit_size:
+            _write_rows(session, kind, pending, resumed, result, on_reject, on_skip)
+            pending = []
+            if checkpoint is not None:
+                checkpoint.save(last_number, skipped_before + result.skipped)
+    if pending:
+        _write_rows(session, kind, pending, resumed, result, on_reject, on_skip)
+    if checkpoint is not None:
+        checkpoint.save(
+            last_number if last_number is not None else checkpoint.records,
+            skipped_before + result.skipped,
+            done=True,
+        )
+    return result
+
+
+def _validated_chunks(
+    kind: ImportKind,
+    import_id: uuid.UUID,
+    records: Iterable[RawRecord],
+    workers: int,
+    chunk_size: int,
+) -> Iterator[tuple[list, list, int]]:
+    chunks = _chunked(records, chunk_size)
+    if not workers:
+        for chunk in chunks:
+            yield (*validate_records(kind, import_id, chunk), chunk[-1][0])
+        return
+    # Bounded read-ahead: only a few chunks per worker are in flight, so
+    # memory use does not depend on the size of the input, and results
+    # come back in input order.
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight: deque[tuple[Future, int]] = deque()
+        for chunk in chunks:
+            future = executor.submit(validate_records, kind, import_id, chunk)
+            in_flight.append((future, chunk[-1][0]))
+            if len(in_flight) >= 2 * workers:
+                future, chunk_end = in_flight.popleft()
+                yield (*future.result(), chunk_end)
+        while in_flight:
+            future, chunk_end = in_flight.popleft()
+            yield (*future.result(), chunk_end)
+
+
+def _chunked(records: Iterable[RawRecord], size: int) -> Iterator[list[RawRecord]]:
+    iterator = iter(records)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _chunked_lookup(session: Session, column, values: Iterable) -> set:
+    """The `values` present in `column`, looked up in IN lists of at most
+    LOOKUP_CHUNK_SIZE values."""
+    values = list(values)
+    found = set()
+    for start in range(0, len(values), LOOKUP_CHUNK_SIZE):
+        chunk = values[start : start + LOOKUP_CHUNK_SIZE]
+        found.update(session.exec(select(column).where(column.in_(chunk))).all())
+    return found
+
+
+def _write_rows(
+    session: Session,
+    kind: ImportKind,
+    rows: list[tuple[int, dict]],
+    resumed: bool,
+    result: ImportResult,
+    on_reject: OnReject,
+    on_skip: OnReject,
+) -> None:
+    model = User if kind == "users" else Message
+    existing = _chunked_lookup(session, model.id, [row["id"] for _, row in rows])
+    new_rows = []
+    for number, row in rows:
+        if row["id"] not in existing:
+            new_rows.append((number, row))
+        elif resumed:
+            result.skipped += 1
+            on_skip(number, res.ID_ALREADY_IMPORTED)
+        else:
+            result.rejected += 1
+            on_reject(number, res.ID_ALREADY_EXISTS)
+    if kind == "users":
+        new_rows = _reject_taken_emails(session, new_rows, result, on_reject)
+    else:
+        new_rows = _reject_unknown_senders(session, new_rows, result, on_reject)
+    values = [row for _, row in new_rows]
+    if values:
+        session.exec(insert(model), params=values)
+        if kind == "messages":
+            session.exec(
+                insert(MessageChange),
+                params=[
+                    {
+                        "user_id": row["sender_id"],
+                        "message_id": row["id"],
+                        "op": ChangeOperation.INSERT,
+                    }
+                    for row in values
+                ],
+            )
+            user_service.bump_user_versions(
+                session, {row["sender_id"] for row in values}
+            )
+    session.commit()
+    result.imported += len(values)
+
+
+def _reject_taken_emails(
+    session: Session,
+    rows: list[tuple[int, dict]],
+    result: ImportResult,
+    on_reject: OnReject,
+) -> list[tuple[int, dict]]:
+    taken = _chunked_lookup(session, User.email, {row["email"] for _, row in rows})
+    seen: set[str] = set()
+    accepted = []
+    for number, row in rows:
+        if row["email"] in taken or row["email"] in seen:
+            result.rejected += 1
+            on_reject(
+                number,
+                (
+                    res.EMAIL_ALREADY_EXISTS
+                    if row["email"] in taken
+                    else res.EMAIL_DUPLICATED_IN_BATCH
+                ),
+            )
+            continue
+        seen.add(row["email"])
+        accepted.append((number, row))
+    return accepted
+
+
+def _reject_unknown_senders(
+    session: Session,
+    rows: list[tuple[int, dict]],
+    result: ImportResult,
+    on_reject: OnReject,
+) -> list[tuple[int, dict]]:
+    sender_ids = {row["sender_id"] for _, row in rows}
+    known = _chunked_lookup(session, User.id, sender_ids)
+    accepted = []
+    for number, row in rows:
+        if row["sender_id"] not in known:
+            result.rejected += 1
+            on_reject(number, res.USER_NOT_FOUND)
+            continue
+        accepted.append((number, row))
+    return accepted
@@ -1,20 +1,221 @@
-from typing import Optional
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Iterator, Optional
 from uuid import UUID
 
-from sqlmodel import Session, select
+from sqlmodel import (
+    Session,
+    delete,
+    exists,
+    func,
+    insert,
+    literal_column,
+    or_,
+    select,
+    tuple_,
+)
+from sqlalchemy import Delete, Row
+from sqlalchemy.exc import IntegrityError
+from sqlmodel.sql.expression import Select
 
-from app.services.exceptions import NotFoundError
-from app.models import Message
-from app.models.message import MessageCreate
-from app.services import user_service
+from app.core.constants import (
+    DEFAULT_CHANGE_LIMIT,
+    DEFAULT_MESSAGE_LIMIT,
+    MESSAGE_DELETE_CHUNK_SIZE,
+    MESSAGE_EXPORT_BATCH_SIZE,
+)
+from app.core.pubsub import message_hub
+from app.services.exceptions import NotFoundError, BadRequestError, GoneError
+from app.services.pagination import Page, encode_cursor, decode_cursor
+from app.models import Message, MessageChange, MessageChangeHorizon, User
+from app.models.message import MessageCreate, MessagePublic
+from app.models.message_change import ChangeOperation
+from app.models.message_search import SEARCH_INDEX_TABLE, message_fts
+from app.services import group_commit, user_service
 import app.core.resources as res
 
+# Listings select only these columns: rows skip entity hydration and the
+# session identity map, and are all MessagePublic needs.
+MESSAGE_PUBLIC_COLUMNS = (
+    Message.id,
+    Message.sender_id,
+    Message.content,
+    Message.timestamp,
+)
 
-def get_user_messages(session: Session, user_id: UUID) -> list[Message]:
+
+def get_user_messages(
+    session: Session,
+    user_id: UUID,
+    limit: int = DEFAULT_MESSAGE_LIMIT,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+) -> Page[Row]:
+    if after and before:
+        raise BadRequestError(message=res.CONFLICTING_CURSORS)
     user = user_service.get_user_by_id(session=session, user_id=user_id)
-    query = select(Message).where(Message.sender_id == user.id)
-    results = session.exec(query)
-    return results.all()
+    query = _user_messages_query(
+        sender_id=user.id, limit=limit, after=after, before=before
+    )
+    rows = list(session.exec(query).all())
+    return _user_messages_page(messages=rows, limit=limit, after=after, before=before)
+
+
+def _user_messages_query(
+    sender_id: UUID,
+    limit: int,
+    after: Optional[str],
+    before: Optional[str],
+) -> Select:
+    # Keyset pagination: every page is a range scan over the
+    # (sender_id, timestamp, id) index, regardless of how deep it is.
+    key = tuple_(Message.timestamp, Message.id)
+    query = select(*MESSAGE_PUBLIC_COLUMNS).where(Message.sender_id == sender_id)
+    if before:
+        query = query.where(key < _decode_message_cursor(before)).order_by(
+            Message.timestamp.desc(), Message.id.desc()
+        )
+    else:
+        if after:
+            query = query.where(key > _decode_message_cursor(after))
+        query = query.order_by(Message.timestamp, Message.id)
+    # One extra row tells whether another page exists
+    return query.limit(limit + 1)
+
+
+def _user_messages_page(
+    messages: list[Row], limit: int, after: Optional[str], before: Optional[str]
+) -> Page[Row]:
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if before:
+        messages.reverse()
+
+    page = Page(items=messages)
+    if messages:
+        if has_more or before:
+            page.next_cursor = _encode_message_cursor(messages[-1])
+        if (has_more and before) or after:
+            page.prev_cursor = _encode_message_cursor(messages[0])
+    return page
+
+
+def _encode_message_cursor(message: Row) -> str:
+    return encode_cursor(message.timestamp.isoformat(), str(message.id))
+
+
+def _decode_message_cursor(cursor: str) -> tuple[datetime, UUID]:
+    timestamp, message_id = decode_cursor(cursor, size=2)
+    try:
+        return datetime.fromisoformat(timestamp), UUID(message_id)
+    except ValueError:
+        raise BadRequestError(message=res.INVALID_CURSOR)
+
+
+def iter_user_messages(
+    session: Session, user_id: UUID, batch_size: int = MESSAGE_EXPORT_BATCH_SIZE
+) -> Iterator[list[Row]]:
+    """All messages of a user, oldest first, in batches of `batch_size`.
+
+    Rows come from a server-side cursor (yield_per), so memory use does not
+    grow with the size of the history. Does not check that the user exists.
+    """
+    result = session.exec(_user_messages_export_query(user_id, batch_size))
+    yield from result.partitions()
+
+
+def _user_messages_export_query(sender_id: UUID, batch_size: int) -> Select:
+    return (
+        select(*MESSAGE_PUBLIC_COLUMNS)
+        .where(Message.sender_id == sender_id)
+        .order_by(Message.timestamp, Message.id)
+        .execution_options(yield_per=batch_size)
+    )
+
+
+def search_user_messages(
+    session: Session,
+    user_id: UUID,
+    q: str,
+    limit: int = DEFAULT_MESSAGE_LIMIT,
+    after: Optional[str] = None,
+) -> Page[Row]:
+    user = user_service.get_user_by_id(session=session, user_id=user_id)
+    query = _search_messages_query(sender_id=user.id, q=q, limit=limit, after=after)
+    rows = session.exec(query).all()
+    return _search_messages_page(rows=rows, limit=limit)
+
+
+def _search_messages_query(
+    sender_id: UUID, q: str, limit: int, after: Optional[str]
+) -> Select:
+    match_expression = _search_match_expression(sender_id=sender_id, q=q)
+    match = literal_column(SEARCH_INDEX_TABLE).op("MATCH")(match_expression)
+    # Best matches first (FTS5 rank is negated bm25), with the index rowid as
+    # a tie-breaker so that (rank, rowid) is a keyset cursor.
+    key = tuple_(message_fts.c.rank, message_fts.c.rowid)
+    query = (
+        select(*MESSAGE_PUBLIC_COLUMNS, message_fts.c.rank, message_fts.c.rowid)
+        .join(message_fts, message_fts.c.message_id == Message.id)
+        .where(match)
+    )
+    if after:
+        query = query.where(key > _search_cursor_key(match_expression, after))
+    return query.order_by(message_fts.c.rank, message_fts.c.rowid).limit(limit + 1)
+
+
+def _search_cursor_key(match_expression: str, cursor: str):
+    # bm25 depends on statistics of the whole index, so every insert or
+    # delete shifts the ranks of all messages and a rank kept in a cursor
+    # goes stale. The cursor's message is ranked again in the same statement
+    # instead, so the page continues after it within one snapshot of the
+    # index; only if that message no longer matches is its old rank used.
+    rank, rowid = _decode_search_cursor(cursor)
+    anchor = message_fts.alias("search_anchor")
+    anchor_rank = (
+        select(anchor.c.rank)
+        # The hidden column named after the table, which an alias keeps
+        .where(
+            literal_column(f"{anchor.name}.{SEARCH_INDEX_TABLE}").op("MATCH")(
+                match_expression
+            )
+        )
+        .where(anchor.c.rowid == rowid)
+        .scalar_subquery()
+    )
+    return tuple_(func.coalesce(anchor_rank, rank), rowid)
+
+
+def _search_match_expression(sender_id: UUID, q: str) -> str:
+    # User input is reduced to quoted terms, so FTS5 operators in it are taken
+    # literally; a trailing "*" on a term makes it a prefix query.
+    terms = []
+    for token in q.split():
+        term = token.rstrip("*")
+        if not term:
+            continue
+        phrase = '"' + term.replace('"', '""') + '"'
+        terms.append(phrase + "*" if token.endswith("*") else phrase)
+    if not terms:
+        raise BadRequestError(message=res.INVALID_SEARCH_QUERY)
+    return f'sender_id : "{sender_id.hex}" AND content : ({" ".join(terms)})'
+
+
+def _search_messages_page(rows: list[Row], limit: int) -> Page[Row]:
+    page = Page(items=rows[:limit])
+    if len(rows) > limit:
+        last_row = rows[limit - 1]
+        page.next_cursor = encode_cursor(repr(last_row.rank), str(last_row.rowid))
+    return page
+
+
+def _decode_search_cursor(cursor: str) -> tuple[float, int]:
+    rank, rowid = decode_cursor(cursor, size=2)
+    try:
+        return float(rank), int(rowid)
+    except ValueError:
+        raise BadRequestError(message=res.INVALID_CURSOR)
 
 
 def get_message_for_user(session: Session, user_id: UUID, message_id: UUID) -> Message:
@@ -38,18 +239,291 @@ def _get_message(session: Session, message_id: UUID) -> Optional[Message]:
 
 def create_message_for_user(
     session: Session, user_id: UUID, message_in: MessageCreate
+) -> Message:
+    message = group_commit.run_write(
+        session, insert_message, user_id=user_id, message_in=message_in
+    )
+    # Results of the coalescer's writer come detached and already loaded
+    if message in session:
+        session.refresh(message)
+    publish_messages(sender_id=user_id, messages=[message])
+    return message
+
+
+def insert_message(
+    session: Session, user_id: UUID, message_in: MessageCreate
 ) -> Message:
     user = user_service.get_user_by_id(session=session, user_id=user_id)
     message = Message(**message_in.dict(), sender_id=user.id)
     session.add(message)
-    session.commit()
-    session.refresh(message)
+    with _deleted_sender_not_found(user):
+        # Flushes the message first
+        session.exec(
+            insert(MessageChange),
+            params=_change_rows(user.id, [message.id], ChangeOperation.INSERT),
+        )
+    user_service.bump_user_versions(session, [user.id])
     return message
 
 
+def create_messages_for_user(
+    session: Session, user_id: UUID, messages_in: list[MessageCreate]
+) -> list[Message]:
+    messages = group_commit.run_write(
+        session, insert_messages, user_id=user_id, messages_in=messages_in
+    )
+    if messages:
+        publish_messages(sender_id=user_id, messages=messages)
+    return messages
+
+
+def insert_messages(
+    session: Session, user_id: UUID, messages_in: list[MessageCreate]
+) -> list[Message]:
+    user = user_service.get_user_by_id(session=session, user_id=user_id)
+    messages = _build_messages(sender_id=user.id, messages_in=messages_in)
+    if messages:
+        # A single executemany in one transaction; ids and timestamps are
+        # generated client-side, so nothing has to be re-selected afterwards.
+        with _deleted_sender_not_found(user):
+            session.exec(
+                insert(Message), params=[message.model_dump() for message in messages]
+            )
+        session.exec(
+            insert(MessageChange),
+            params=_change_rows(
+                user.id, [message.id for message in messages], ChangeOperation.INSERT
+            ),
+        )
+        user_service.bump_user_versions(session, [user.id])
+    return messages
+
+
+@contextmanager
+def _deleted_sender_not_found(user: User) -> Iterator[None]:
+    # Read now: a failed flush expires the user
+    user_id, email = user.id, user.email
+    try:
+        yield
+    except IntegrityError:
+        # A cached user may have been deleted by another worker since: the
+        # sender foreign key is the only constraint a message insert can break
+        user_service.invalidate_user(user_id, email)
+        raise NotFoundError(message=res.USER_NOT_FOUND)
+
+
+def message_topic(sender_id: UUID) -> str:
+    return str(sender_id)
+
+
+def publish_messages(sender_id: UUID, messages: list[Message]) -> None:
+    """Push committed messages to the sender's open message streams."""
+    topic = message_topic(sender_id)
+    if not message_hub.has_listeners(topic):
+        return
+    for message in messages:
+        data = MessagePublic.model_validate(message).model_dump(mode="json")
+        message_hub.publish(topic, data)
+
+
+def _build_messages(sender_id: UUID, messages_in: list[MessageCreate]) -> list[Message]:
+    return [
+        Message(**message_in.dict(), sender_id=sender_id) for message_in in messages_in
+    ]
+
+
 def delete_message_for_user(session: Session, user_id: UUID, message_id: UUID) -> None:
-    message = get_message_for_user(
-        session=session, user_id=user_id, message_id=message_id
+    group_commit.run_write(
+        session, delete_message_row, user_id=user_id, message_id=message_id
+    )
+
+
+def delete_message_row(session: Session, user_id: UUID, message_id: UUID) -> None:
+    # The ownership check is part of the DELETE, so a hit is one statement
+    deleted = session.exec(_delete_messages_query(user_id, [message_id])).rowcount
+    if not deleted:
+        # Only misses pay for telling a missing user from a missing message
+        user_service.get_user_by_id(session=session, user_id=user_id)
+        raise NotFoundError(message=res.MESSAGE_NOT_FOUND)
+    session.exec(
+        insert(MessageChange),
+        params=_change_rows(user_id, [message_id], ChangeOperation.DELETE),
+    )
+    user_service.bump_user_versions(session, [user_id])
+
+
+def delete_messages_for_user(
+    session: Session,
+    user_id: UUID,
+    message_ids: Optional[list[UUID]] = None,
+    before: Optional[datetime] = None,
+    chunk_size: int = MESSAGE_DELETE_CHUNK_SIZE,
+) -> int:
+    """Delete the given messages of a user, or all sent before `before`.
+
+    Every chunk of `chunk_size` messages is its own transaction, so a large
+    purge never holds the write lock for long. Returns the number deleted.
+    """
+    if (message_ids is None) == (before is None):
+        raise BadRequestError(message=res.CONFLICTING_DELETE_FILTERS)
+    user = user_service.get_user_by_id(session=session, user_id=user_id)
+    deleted = 0
+    if message_ids is not None:
+        for start in range(0, len(message_ids), chunk_size):
+            chunk = message_ids[start : start + chunk_size]
+            query = _message_ids_query(user.id).where(Message.id.in_(chunk))
+            deleted += group_commit.run_write(
+                session, delete_message_chunk, sender_id=user.id, query=query
+            )
+        return deleted
+    query = _messages_before_query(user.id, before).limit(chunk_size)
+    while True:
+        count = group_commit.run_write(
+            session, delete_message_chunk, sender_id=user.id, query=query
+        )
+        deleted += count
+        if count < chunk_size:
+            return deleted
+
+
+def _delete_messages_query(sender_id: UUID, message_ids: list[UUID]) -> Delete:
+    return (
+        delete(Message)
+        .where(Message.sender_id == sender_id)
+        .where(Message.id.in_(message_ids))
+    )
+
+
+def _message_ids_query(sender_id: UUID) -> Select:
+    return select(Message.id).where(Message.sender_id == sender_id)
+
+
+def _messages_before_query(sender_id: UUID, before: datetime) -> Select:
+    # Oldest first, a range scan over (sender_id, timestamp, id)
+    return (
+        _message_ids_query(sender_id)
+        .where(Message.timestamp < before)
+        .order_by(Message.timestamp, Message.id)
     )
-    session.delete(message)
+
+
+def delete_message_chunk(session: Session, sender_id: UUID, query: Select) -> int:
+    message_ids = list(session.exec(query).all())
+    if message_ids:
+        session.exec(_delete_messages_query(sender_id, message_ids))
+        session.exec(
+            insert(MessageChange),
+            params=_change_rows(sender_id, message_ids, ChangeOperation.DELETE),
+        )
+        user_service.bump_user_versions(session, [sender_id])
+    return len(message_ids)
+
+
+@dataclass
+class ChangesPage:
+    # (change, message) pairs; message is None for deletes
+    items: list[tuple[MessageChange, Optional[Message]]] = field(default_factory=list)
+    next_since: int = 0
+    has_more: bool = False
+
+
+def get_message_changes(
+    session: Session,
+    user_id: UUID,
+    since: Optional[int] = None,
+    limit: int = DEFAULT_CHANGE_LIMIT,
+) -> ChangesPage:
+    """Message inserts and deletes of a user after `since`, in order.
+
+    Without `since` no changes are returned, only the current sequence
+    number, to start syncing from after a full reload of the messages.
+    """
+    user = user_service.get_user_by_id(session=session, user_id=user_id)
+    horizon = session.get(MessageChangeHorizon, 1)
+    horizon_seq = horizon.seq if horizon else 0
+    # Read before the changes: whatever is committed later gets a higher seq
+    latest_seq = session.exec(_latest_change_seq_query()).one() or 0
+    if since is None:
+        return ChangesPage(next_since=max(latest_seq, horizon_seq))
+    _check_changes_available(since=since, horizon_seq=horizon_seq)
+    rows = session.exec(_message_changes_query(user.id, since, limit)).all()
+    return _changes_page(rows=rows, since=since, limit=limit, latest_seq=latest_seq)
+
+
+def _change_rows(
+    sender_id: UUID, message_ids: list[UUID], op: ChangeOperation
+) -> list[dict]:
+    return [
+        {"user_id": sender_id, "message_id": message_id, "op": op}
+        for message_id in message_ids
+    ]
+
+
+def _latest_change_seq_query() -> Select:
+    # Of all users: the horizon of compactions is global too
+    return select(func.max(MessageChange.seq))
+
+
+def _check_changes_available(since: int, horizon_seq: int) -> None:
+    if since < horizon_seq:
+        raise GoneError(message=res.CHANGES_COMPACTED)
+
+
+def _message_changes_query(user_id: UUID, since: int, limit: int) -> Select:
+    # A range scan over (user_id, seq). Inserts of messages deleted since are
+    # skipped: their tombstone comes later in the log.
+    return (
+        select(MessageChange, Message)
+        .outerjoin(Message, Message.id == MessageChange.message_id)
+        .where(MessageChange.user_id == user_id)
+        .where(MessageChange.seq > since)
+        .where(or_(MessageChange.op == ChangeOperation.DELETE, Message.id.is_not(None)))
+        .order_by(MessageChange.seq)
+        .limit(limit + 1)
+    )
+
+
+def _changes_page(rows: list, since: int, limit: int, latest_seq: int) -> ChangesPage:
+    items = [tuple(row) for row in rows[:limit]]
+    has_more = len(rows) > limit
+    next_since = items[-1][0].seq if items else since
+    if not has_more:
+        # Caught up: the user's next change comes after every change so far,
+        # so clients of quiet users move past other users' changes and stay
+        # ahead of the compaction horizon
+        next_since = max(next_since, latest_seq)
+    return ChangesPage(items=items, next_since=next_since, has_more=has_more)
+
+
+def compact_message_changes(session: Session, older_than: datetime) -> int:
+    """Drop tombstones recorded before `older_than`, and the inserts of the
+    messages they deleted. Returns the number of removed log entries.
+
+    Clients that last synced before the newest dropped tombstone get a
+    GoneError and have to reload all messages.
+    """
+    if older_than.tzinfo is not None:
+        # changed_at holds naive UTC
+        older_than = older_than.astimezone(timezone.utc).replace(tzinfo=None)
+    horizon_seq = session.exec(
+        select(func.max(MessageChange.seq))
+        .where(MessageChange.op == ChangeOperation.DELETE)
+        .where(MessageChange.changed_at < older_than)
+    ).one()
+    if horizon_seq is None:
+        return 0
+    removed = session.exec(
+        delete(MessageChange)
+        .where(MessageChange.seq <= horizon_seq)
+        .where(
+            or_(
+                MessageChange.op == ChangeOperation.DELETE,
+                ~exists().where(Message.id == MessageChange.message_id),
+            )
+        )
+    ).rowcount
+    horizon = session.get(MessageChangeHorizon, 1) or MessageChangeHorizon()
+    horizon.seq = max(horizon.seq, horizon_seq)
+    session.add(horizon)
     session.commit()
+    return removed
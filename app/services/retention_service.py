@@ -0,0 +1,198 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+from uuid import UUID
+
+from sqlmodel import Session, delete, func, insert, select, tuple_
+from sqlmodel.sql.expression import Select
+
+from app.core import config
+from app.core.archive import PartitionArchive
+from app.core.constants import MESSAGE_DELETE_CHUNK_SIZE
+from app.models import Message, MessageChange, User
+from app.models.message import MessageRow
+from app.models.message_change import ChangeOperation
+from app.services import user_service
+from app.services.message_service import MESSAGE_PUBLIC_COLUMNS
+
+
+@dataclass
+class RetentionPolicy:
+    """Limits on kept messages; None disables a limit."""
+
+    max_age: Optional[timedelta] = None
+    max_messages_per_user: Optional[int] = None
+
+    @classmethod
+    def from_config(cls) -> "RetentionPolicy":
+        return cls(
+            max_age=(
+                timedelta(days=config.MESSAGE_RETENTION_MAX_AGE_DAYS)
+                if config.MESSAGE_RETENTION_MAX_AGE_DAYS > 0
+                else None
+            ),
+            max_messages_per_user=config.MESSAGE_RETENTION_MAX_PER_USER or None,
+        )
+
+
+@dataclass
+class RetentionResult:
+    expired: int = 0
+    over_limit: int = 0
+
+
+def create_message_archive(
+    directory: str = config.MESSAGE_ARCHIVE_DIR,
+    compression: str = config.MESSAGE_ARCHIVE_COMPRESSION,
+) -> PartitionArchive:
+    return PartitionArchive(
+        Path(directory), MessageRow, prefix="messages", compression=compression
+    )
+
+
+def apply_retention(
+    session: Session,
+    policy: RetentionPolicy,
+    archive: PartitionArchive,
+    now: Optional[datetime] = None,
+    batch_size: int = MESSAGE_DELETE_CHUNK_SIZE,
+) -> RetentionResult:
+    """Move messages outside of `policy` to `archive`, oldest first.
+
+    Each batch is appended to the archive, then deleted with its tombstones
+    in one short transaction. A crash in between leaves the batch in both
+    places, and in the archive twice once retention runs again; restoring
+    skips messages that still exist or were restored from an earlier copy.
+    """
+    result = RetentionResult()
+    if policy.max_age is not None:
+        cutoff = (now or datetime.utcnow()) - policy.max_age
+        query = _oldest_messages_query(batch_size).where(Message.timestamp < cutoff)
+        result.expired = _archive_in_batches(session, archive, query, batch_size)
+    if policy.max_messages_per_user is not None:
+        limit = policy.max_messages_per_user
+        for sender_id in session.exec(_users_over_limit_query(limit)).all():
+            oldest_kept = session.exec(_oldest_kept_query(sender_id, limit)).one()
+            query = (
+                _oldest_messages_query(batch_size)
+                .where(Message.sender_id == sender_id)
+                .where(tuple_(Message.timestamp, Message.id) < tuple(oldest_kept))
+            )
+            result.over_limit += _archive_in_batches(
+                session, archive, query, batch_size
+            )
+    return result
+
+
+def _oldest_messages_query(batch_size: int) -> Select:
+    return (
+        select(*MESSAGE_PUBLIC_COLUMNS)
+        .order_by(Message.timestamp, Message.id)
+        .limit(batch_size)
+    )
+
+
+def _users_over_limit_query(limit: int) -> Select:
+    return (
+        select(Message.sender_id)
+        .group_by(Message.sender_id)
+        .having(func.count() > limit)
+    )
+
+
+def _oldest_kept_query(sender_id: UUID, limit: int) -> Select:
+    # The limit-th newest message; a descending scan of (sender_id, timestamp, id)
+    return (
+        select(Message.timestamp, Message.id)
+        .where(Message.sender_id == sender_id)
+        .order_by(Message.timestamp.desc(), Message.id.desc())
+        .offset(limit - 1)
+        .limit(1)
+    )
+
+
+def _archive_in_batches(
+    session: Session, archive: PartitionArchive, query: Select, batch_size: int
+) -> int:
+    archived = 0
+    while True:
+        rows = [dict(row._mapping) for row in session.exec(query).all()]
+        if rows:
+            archive.write(rows, day_of=_message_day)
+            message_ids = [row["id"] for row in rows]
+            session.exec(delete(Message).where(Message.id.in_(message_ids)))
+            session.exec(
+                insert(MessageChange),
+                params=_change_rows(rows, ChangeOperation.DELETE),
+            )
+            user_service.bump_user_versions(session, _sender_ids(rows))
+            session.commit()
+        archived += len(rows)
+        if len(rows) < batch_size:
+            return archived
+
+
+def _change_rows(rows: list[dict], op: ChangeOperation) -> list[dict]:
+    # Rows of any number of senders, unlike message_service._change_rows
+    return [
+        {"user_id": row["sender_id"], "message_id": row["id"], "op": op} for row in rows
+    ]
+
+
+def _sender_ids(rows: list[dict]) -> set[UUID]:
+    return {row["sender_id"] for row in rows}
+
+
+def _message_day(row: dict) -> date:
+    return row["timestamp"].date()
+
+
+def restore_archived_messages(
+    session: Session,
+    archive: PartitionArchive,
+    day: date,
+    batch_size: int = MESSAGE_DELETE_CHUNK_SIZE,
+) -> int:
+    """Put the messages of an archive partition back, in batches.
+
+    Messages that exist already, or whose sender was deleted since, are
+    skipped, so a partition can be restored more than once. Returns the
+    number of restored messages.
+    """
+    restored = 0
+    for rows in _batched(archive.read(day), batch_size):
+        restored += _restore_batch(session, rows)
+    return restored
+
+
+def _restore_batch(session: Session, rows: list[dict]) -> int:
+    message_ids = [row["id"] for row in rows]
+    sender_ids = {row["sender_id"] for row in rows}
+    existing = set(
+        session.exec(select(Message.id).where(Message.id.in_(message_ids))).all()
+    )
+    senders = set(session.exec(select(User.id).where(User.id.in_(sender_ids))).all())
+    restorable = []
+    for row in rows:
+        if row["id"] in existing or row["sender_id"] not in senders:
+            continue
+        # Copies of a message in one batch: only the first one is inserted
+        existing.add(row["id"])
+        restorable.append(row)
+    rows = restorable
+    if rows:
+        session.exec(insert(Message), params=rows)
+        session.exec(
+            insert(MessageChange), params=_change_rows(rows, ChangeOperation.INSERT)
+        )
+        user_service.bump_user_versions(session, _sender_ids(rows))
+    session.commit()
+    return len(rows)
+
+
+def _batched(rows: Iterable[dict], size: int) -> Iterator[list[dict]]:
+    iterator = iter(rows)
+    while batch := list(islice(iterator, size)):
+        yield batch
@@ -1,22 +1,187 @@
 import uuid
-from typing import Optional
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
 
-from sqlmodel import Session, select
+from sqlalchemy import Row, Update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import make_transient_to_detached
+from sqlmodel import Session, delete, func, insert, select, text, update
+from sqlmodel.sql.expression import Select
 
-from app.services.exceptions import NotFoundError, AlreadyExistsError
-from app.models.user import UserCreate, User, UserUpdate
+from app.core.cache import user_cache
+from app.core.constants import DEFAULT_USER_LIMIT, USER_COUNT_EXACT_LIMIT
+
+from app.core.read_routing import record_session_writes
+from app.services import group_commit
+from app.services.exceptions import NotFoundError, AlreadyExistsError, BadRequestError
+from app.services.pagination import Page, encode_cursor, decode_cursor
+from app.models.user import UserCreate, User, UserUpdate, UserSortKey, UserVersion
 import app.core.resources as res
 
 
-def get_users(session: Session, limit: int) -> list[User]:
-    results = session.exec(select(User).limit(limit)).all()
-    return results
+@dataclass
+class UserCount:
+    value: int
+    # False when the value is a lower bound or a statistics-based estimate
+    exact: bool
+
+
+# Listings select only these columns: rows skip entity hydration and the
+# session identity map, and are all UserPublic needs.
+USER_PUBLIC_COLUMNS = (User.id, User.name, User.email)
+
+
+def get_users(
+    session: Session,
+    limit: int = DEFAULT_USER_LIMIT,
+    after: Optional[str] = None,
+    order_by: UserSortKey = "id",
+    email_prefix: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+) -> Page[Row]:
+    query = _users_query(
+        limit=limit,
+        after=after,
+        order_by=order_by,
+        email_prefix=email_prefix,
+        name_prefix=name_prefix,
+    )
+    rows = list(session.exec(query).all())
+    return _users_page(users=rows, limit=limit, order_by=order_by)
+
+
+def _users_query(
+    limit: int,
+    after: Optional[str],
+    order_by: UserSortKey,
+    email_prefix: Optional[str],
+    name_prefix: Optional[str],
+) -> Select:
+    # Keyset pagination over a unique column: id (primary key) or email
+    # (unique index), so every page is a range scan however deep it is.
+    column = _sort_column(order_by)
+    query = _filter_users(select(*USER_PUBLIC_COLUMNS), email_prefix, name_prefix)
+    if after:
+        query = query.where(column > _decode_users_cursor(after, order_by))
+    # One extra row tells whether another page exists
+    return query.order_by(column).limit(limit + 1)
+
+
+def _filter_users(
+    query: Select, email_prefix: Optional[str], name_prefix: Optional[str]
+) -> Select:
+    if email_prefix:
+        query = query.where(*_prefix_range(User.email, email_prefix))
+    if name_prefix:
+        query = query.where(*_prefix_range(User.name, name_prefix))
+    return query
+
+
+def _prefix_range(column, prefix: str) -> list:
+    # A half-open range rather than LIKE 'prefix%': LIKE is case-insensitive
+    # in SQLite and cannot use a regular index, a range always can.
+    conditions = [column >= prefix]
+    upper_bound = _prefix_upper_bound(prefix)
+    if upper_bound is not None:
+        conditions.append(column < upper_bound)
+    return conditions
+
+
+def _prefix_upper_bound(prefix: str) -> Optional[str]:
+    # The first string after all that start with `prefix`: its last
+    # character incremented, carrying into the previous one past U+10FFFF.
+    # Surrogates are skipped, they cannot be encoded.
+    chars = list(prefix)
+    while chars:
+        code = ord(chars.pop()) + 1
+        if 0xD800 <= code <= 0xDFFF:
+            code = 0xE000
+        if code <= 0x10FFFF:
+            return "".join(chars) + chr(code)
+    return None
+
+
+def _sort_column(order_by: UserSortKey):
+    return User.email if order_by == "email" else User.id
+
+
+def _users_page(users: list[Row], limit: int, order_by: UserSortKey) -> Page[Row]:
+    page = Page(items=users[:limit])
+    if len(users) > limit:
+        last_user = page.items[-1]
+        value = last_user.email if order_by == "email" else str(last_user.id)
+        page.next_cursor = encode_cursor(order_by, value)
+    return page
+
+
+def _decode_users_cursor(cursor: str, order_by: UserSortKey):
+    # Cursors carry their sort key, so one from another ordering is rejected
+    # instead of silently skipping rows.
+    cursor_order_by, value = decode_cursor(cursor, size=2)
+    if cursor_order_by != order_by:
+        raise BadRequestError(message=res.INVALID_CURSOR)
+    if order_by == "email":
+        return value
+    try:
+        return uuid.UUID(value)
+    except ValueError:
+        raise BadRequestError(message=res.INVALID_CURSOR)
+
+
+def estimate_user_count(
+    session: Session,
+    email_prefix: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+) -> UserCount:
+    count = session.exec(_bounded_count_query(email_prefix, name_prefix)).one()
+    if count <= USER_COUNT_EXACT_LIMIT:
+        return UserCount(value=count, exact=True)
+    estimate = None
+    if not email_prefix and not name_prefix:
+        estimate_query = _table_rows_estimate_query(session.get_bind().dialect.name)
+        if estimate_query is not None:
+            estimate = session.exec(estimate_query).scalar()
+    return _user_count_estimate(estimate)
+
+
+def _bounded_count_query(
+    email_prefix: Optional[str], name_prefix: Optional[str]
+) -> Select:
+    # Counting stops one row past the limit, so large tables cost a bounded
+    # index scan instead of a full COUNT(*).
+    rows = _filter_users(select(User.id), email_prefix, name_prefix)
+    return select(func.count()).select_from(
+        rows.limit(USER_COUNT_EXACT_LIMIT + 1).subquery()
+    )
+
+
+def _table_rows_estimate_query(dialect_name: str):
+    if dialect_name == "sqlite":
+        # Rowids only grow unless rows are deleted, so the largest one is an
+        # upper-bound estimate read from the end of the table b-tree.
+        return text(f'SELECT max(rowid) FROM "{User.__tablename__}"')
+    if dialect_name == "postgresql":
+        # Maintained by VACUUM and ANALYZE
+        return text(
+            "SELECT CAST(reltuples AS bigint) FROM pg_class "
+            "WHERE oid = CAST(:table AS regclass)"
+        ).bindparams(table=f'"{User.__tablename__}"')
+    return None
+
+
+def _user_count_estimate(estimate: Optional[int]) -> UserCount:
+    return UserCount(value=max(estimate or 0, USER_COUNT_EXACT_LIMIT), exact=False)
 
 
 def get_user_by_email(session: Session, email: str) -> User:
+    cached_user = _user_from_cache(key=_email_cache_key(email))
+    if cached_user:
+        return session.merge(cached_user, load=False)
     user = _get_user_by_email(session=session, email=email)
     if not user:
         raise NotFoundError(message=res.USER_NOT_FOUND)
+    _cache_user(user)
     return user
 
 
@@ -27,40 +192,249 @@ def _get_user_by_email(session: Session, email: str) -> Optional[User]:
 
 
 def get_user_by_id(session: Session, user_id: uuid.UUID) -> User:
+    cached_user = _user_from_cache(key=_id_cache_key(user_id))
+    if cached_user:
+        return session.merge(cached_user, load=False)
     user = session.get(User, user_id)
     if not user:
         raise NotFoundError(message=res.USER_NOT_FOUND)
+    _cache_user(user)
+    return user
+
+
+def _id_cache_key(user_id: uuid.UUID) -> str:
+    return f"id:{user_id}"
+
+
+def _email_cache_key(email: str) -> str:
+    return f"email:{email}"
+
+
+def _cache_user(user: User) -> None:
+    data = {"id": str(user.id), "name": user.name, "email": user.email}
+    user_cache.set(_id_cache_key(user.id), data)
+    user_cache.set(_email_cache_key(user.email), data)
+
+
+def _user_from_cache(key: str) -> Optional[User]:
+    data = user_cache.get(key)
+    if data is None:
+        return None
+    user = User(id=uuid.UUID(data["id"]), name=data["name"], email=data["email"])
+    # Merging a detached instance with load=False attaches it to the session
+    # as a persistent row without emitting a SELECT.
+    make_transient_to_detached(user)
     return user
 
 
+def invalidate_user(user_id: uuid.UUID, *emails: str) -> None:
+    user_cache.delete(
+        _id_cache_key(user_id), *(_email_cache_key(email) for email in emails)
+    )
+
+
+def get_user_version_by_email(session: Session, email: str) -> Optional[Row]:
+    """(user_id, version, modified_at) of a user, without loading the user;
+    None if there is no such user."""
+    return session.exec(_user_version_query().where(User.email == email)).first()
+
+
+def get_user_version_by_id(session: Session, user_id: uuid.UUID) -> Optional[Row]:
+    return session.exec(_user_version_query().where(User.id == user_id)).first()
+
+
+def _user_version_query() -> Select:
+    # Users without writes have no version row: version 0, no modified_at
+    return select(
+        User.id.label("user_id"),
+        func.coalesce(UserVersion.version, 0).label("version"),
+        UserVersion.modified_at,
+    ).outerjoin(UserVersion, UserVersion.user_id == User.id)
+
+
+# Keeps IN (...) lists below SQLite's bound parameter limit
+USER_VERSION_CHUNK_SIZE = 500
+
+
+def bump_user_versions(session: Session, user_ids: Iterable[uuid.UUID]) -> None:
+    """Count a write to the users or their messages, in the caller's
+    transaction; the validators of their conditional GETs change with it."""
+    now = datetime.utcnow()
+    for chunk in _user_version_chunks(user_ids):
+        updated = session.exec(_bump_versions_query(chunk, now)).rowcount
+        if updated < len(chunk):
+            versioned = set(session.exec(_versioned_users_query(chunk)).all())
+            session.exec(
+                insert(UserVersion), params=_new_version_rows(chunk, versioned, now)
+            )
+
+
+def _user_version_chunks(user_ids: Iterable[uuid.UUID]) -> Iterator[list[uuid.UUID]]:
+    user_ids = list(set(user_ids))
+    for start in range(0, len(user_ids), USER_VERSION_CHUNK_SIZE):
+        yield user_ids[start : start + USER_VERSION_CHUNK_SIZE]
+
+
+def _bump_versions_query(user_ids: list[uuid.UUID], now: datetime) -> Update:
+    # One UPDATE for users that have a version row. On SQLite it takes the
+    # write lock, so the rows inserted for the others cannot race.
+    return (
+        update(UserVersion)
+        .where(UserVersion.user_id.in_(user_ids))
+        .values(version=UserVersion.version + 1, modified_at=now)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _versioned_users_query(user_ids: list[uuid.UUID]) -> Select:
+    return select(UserVersion.user_id).where(UserVersion.user_id.in_(user_ids))
+
+
+def _new_version_rows(
+    user_ids: list[uuid.UUID], versioned: set[uuid.UUID], now: datetime
+) -> list[dict]:
+    return [
+        {"user_id": user_id, "version": 1, "modified_at": now}
+        for user_id in user_ids
+        if user_id not in versioned
+    ]
+
+
 def create_user(session: Session, user_in: UserCreate) -> User:
+    user = group_commit.run_write(session, insert_user, user_in=user_in)
+    # Results of the coalescer's writer come detached and already loaded
+    if user in session:
+        session.refresh(user)
+    record_session_writes(session, str(user.id), user.email)
+    return user
+
+
+def insert_user(session: Session, user_in: UserCreate) -> User:
     user = _get_user_by_email(session=session, email=user_in.email)
     if user:
         raise AlreadyExistsError(message=res.EMAIL_ALREADY_EXISTS)
     user = User.model_validate(user_in)
     session.add(user)
-    session.commit()
-    session.refresh(user)
     return user
 
 
+@dataclass
+class UserBatchItem:
+    index: int
+    user: Optional[User] = None
+    error: Optional[str] = None
+
+
+# Keeps IN (...) lists below SQLite's bound parameter limit
+EMAIL_LOOKUP_CHUNK_SIZE = 500
+
+
+def create_users(session: Session, users_in: list[UserCreate]) -> list[UserBatchItem]:
+    try:
+        items = group_commit.run_write(session, insert_users, users_in=users_in)
+    except IntegrityError:
+        # An email was taken concurrently after the conflict check. The insert
+        # was rolled back; checking again reports the conflict for its item.
+        try:
+            items = group_commit.run_write(session, insert_users, users_in=users_in)
+        except IntegrityError:
+            raise AlreadyExistsError(message=res.EMAIL_ALREADY_EXISTS)
+    record_session_writes(session, *written_user_keys([item.user for item in items]))
+    return items
+
+
+def insert_users(session: Session, users_in: list[UserCreate]) -> list[UserBatchItem]:
+    existing_emails: set[str] = set()
+    for query in _existing_emails_queries(users_in):
+        existing_emails.update(session.exec(query).all())
+    items = _build_user_batch(users_in=users_in, existing_emails=existing_emails)
+    users = [item.user for item in items if item.user]
+    if users:
+        session.exec(insert(User), params=[user.model_dump() for user in users])
+    return items
+
+
+def written_user_keys(users: list[Optional[User]]) -> list[str]:
+    users = [user for user in users if user]
+    return [str(user.id) for user in users] + [user.email for user in users]
+
+
+def _existing_emails_queries(users_in: list[UserCreate]) -> Iterator:
+    emails = list({user_in.email for user_in in users_in})
+    for start in range(0, len(emails), EMAIL_LOOKUP_CHUNK_SIZE):
+        chunk = emails[start : start + EMAIL_LOOKUP_CHUNK_SIZE]
+        yield select(User.email).where(User.email.in_(chunk))
+
+
+def _build_user_batch(
+    users_in: list[UserCreate], existing_emails: set[str]
+) -> list[UserBatchItem]:
+    items = []
+    seen_emails: set[str] = set()
+    for index, user_in in enumerate(users_in):
+        if user_in.email in existing_emails:
+            items.append(UserBatchItem(index=index, error=res.EMAIL_ALREADY_EXISTS))
+        elif user_in.email in seen_emails:
+            items.append(
+                UserBatchItem(index=index, error=res.EMAIL_DUPLICATED_IN_BATCH)
+            )
+        else:
+            seen_emails.add(user_in.email)
+            items.append(UserBatchItem(index=index, user=User.model_validate(user_in)))
+    return items
+
+
 def update_user(session: Session, user_id: uuid.UUID, user_in: UserUpdate) -> User:
-    user = get_user_by_id(session=session, user_id=user_id)
+    user, emails = group_commit.run_write(
+        session, update_user_row, user_id=user_id, user_in=user_in
+    )
+    if emails:
+        invalidate_user(user_id, *emails)
+        record_session_writes(session, str(user_id), *emails)
+        # Results of the coalescer's writer come detached and already loaded
+        if user in session:
+            session.refresh(user)
+    return user
+
+
+def update_user_row(
+    session: Session, user_id: uuid.UUID, user_in: UserUpdate
+) -> tuple[User, set[str]]:
+    """Returns the user and their old and new email, none if unchanged."""
+    # Not from the cache: the UPDATE of a user deleted since it was cached
+    # would match no row
+    user = session.get(User, user_id)
+    if not user:
+        raise NotFoundError(message=res.USER_NOT_FOUND)
     if user_in.email:
         user_by_email = _get_user_by_email(session=session, email=user_in.email)
         if user_by_email and user_by_email.id != user_id:
             raise AlreadyExistsError(message=res.EMAIL_ALREADY_EXISTS)
 
     user_update_data: dict = user_in.model_dump(exclude_unset=True)
-    if user_update_data:
-        user.sqlmodel_update(user_update_data)
-        session.add(user)
-        session.commit()
-        session.refresh(user)
-    return user
+    if not user_update_data:
+        return user, set()
+    emails = {user.email, user_update_data.get("email", user.email)}
+    user.sqlmodel_update(user_update_data)
+    session.add(user)
+    bump_user_versions(session, [user_id])
+    return user, emails
 
 
 def delete_user(session: Session, user_id: uuid.UUID) -> None:
+    email = group_commit.run_write(session, delete_user_row, user_id=user_id)
+    invalidate_user(user_id, email)
+    record_session_writes(session, str(user_id), email)
+
+
+def delete_user_row(session: Session, user_id: uuid.UUID) -> str:
     user = get_user_by_id(session=session, user_id=user_id)
-    session.delete(user)
-    session.commit()
+    email = user.email
+    # One statement: messages and change log entries go with the user by
+    # ON DELETE CASCADE, without being loaded
+    deleted = session.exec(delete(User).where(User.id == user.id)).rowcount
+    if not deleted:
+        # The user was cached, and deleted by another worker since
+        invalidate_user(user_id, email)
+        raise NotFoundError(message=res.USER_NOT_FOUND)
+    return email
@@ -1,9 +1,28 @@
 import pytest
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
 
-from app.api.dependencies import get_session
+from app.api.dependencies import get_session, get_async_session
+from app.api.routes import async_users, async_messages
+from app.core.exception_handlers import setup_exception_handlers
 from app.main import app
-from unittest.mock import Mock
+from unittest.mock import AsyncMock, Mock
+
+
+@pytest.fixture(autouse=True)
+def no_user_versions(mocker):
+    # Version lookups query the database behind conditional GETs; tests of
+    # them patch these again with a version row
+    mocker.patch(
+        "app.services.user_service.get_user_version_by_email", return_value=None
+    )
+    mocker.patch("app.services.user_service.get_user_version_by_id", return_value=None)
+    mocker.patch(
+        "app.services.async_user_service.get_user_version_by_email", return_value=None
+    )
+    mocker.patch(
+        "app.services.async_user_service.get_user_version_by_id", return_value=None
+    )
 
 
 @pytest.fixture(scope="module")
@@ -21,3 +40,29 @@ def test_client(mock_session):
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
+
+
+@pytest.fixture(scope="module")
+def mock_async_session():
+    return AsyncMock()
+
+
+@pytest.fixture(scope="module")
+def async_test_client(mock_async_session):
+    # The async routers are only mounted when DATABASE_ASYNC is enabled, so
+    # they are exercised through a dedicated application here.
+    async_app = FastAPI()
+    setup_exception_handlers(async_app)
+    async_app.include_router(async_users.router, prefix="/api/users")
+    async_app.include_router(
+        async_messages.router, prefix="/api/users/{user_id}/messages"
+    )
+
+    async def get_async_session_override():
+        return mock_async_session
+
+    async_app.dependency_overrides[get_async_session] = get_async_session_override
+
+    client = TestClient(async_app)
+    yield client
+    async_app.dependency_overrides.clear()
@@ -0,0 +1,178 @@
+import json
+from types import SimpleNamespace
+from uuid import UUID
+
+import app.core.resources as res
+
+from app.core.constants import DEFAULT_MESSAGE_LIMIT, DEFAULT_USER_LIMIT
+from app.services.exceptions import NotFoundError
+from app.services.pagination import Page
+from app.models import Message, User
+
+USER_ID = "b6f37031-672d-4770-b6e8-ca34fad01968"
+USERS_ROUTE_PATH = "/api/users"
+MESSAGES_ROUTE_PATH = f"/api/users/{USER_ID}/messages"
+
+
+def test_get_users__users_found__users_returned(
+    mocker, async_test_client, mock_async_session
+):
+    expected_users = [
+        {"email": "user1@test.com", "id": USER_ID, "name": "User 1"},
+    ]
+    mocked_get_users = mocker.patch(
+        "app.api.routes.async_users.user_service.get_users",
+        return_value=Page(items=[User(**expected_users[0])]),
+    )
+
+    response = async_test_client.get(f"{USERS_ROUTE_PATH}/")
+
+    mocked_get_users.assert_awaited_once_with(
+        session=mock_async_session,
+        limit=DEFAULT_USER_LIMIT,
+        after=None,
+        order_by="id",
+        email_prefix=None,
+        name_prefix=None,
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "data": expected_users,
+        "next_cursor": None,
+        "total": None,
+        "total_exact": None,
+    }
+
+
+def test_delete_user__user_not_found__404_error_response(
+    mocker, async_test_client, mock_async_session
+):
+    mocker.patch(
+        "app.api.routes.async_users.user_service.delete_user",
+        side_effect=NotFoundError(message=res.USER_NOT_FOUND),
+    )
+
+    response = async_test_client.delete(f"{USERS_ROUTE_PATH}/{USER_ID}")
+
+    assert response.status_code == 404
+    assert response.json() == {"message": res.USER_NOT_FOUND}
+
+
+def test_get_user_messages__messages_found__page_returned(
+    mocker, async_test_client, mock_async_session
+):
+    expected_message = {
+        "id": "131637b2-dc9a-4907-87b6-5c65eb9e9013",
+        "sender_id": USER_ID,
+        "content": "Message 1",
+        "timestamp": "2021-08-01T00:00:00Z",
+    }
+    mocked_get_user_messages = mocker.patch(
+        "app.api.routes.async_messages.message_service.get_user_messages",
+        return_value=Page(items=[Message(**expected_message)]),
+    )
+
+    response = async_test_client.get(f"{MESSAGES_ROUTE_PATH}/")
+
+    mocked_get_user_messages.assert_awaited_once_with(
+        session=mock_async_session,
+        user_id=UUID(USER_ID),
+        limit=DEFAULT_MESSAGE_LIMIT,
+        after=None,
+        before=None,
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "data": [expected_message],
+        "next_cursor": None,
+        "prev_cursor": None,
+    }
+
+
+def test_get_user_messages__etag_matches__304_without_loading_messages(
+    mocker, async_test_client, mock_async_session
+):
+    mocker.patch(
+        "app.api.routes.async_messages.user_service.get_user_version_by_id",
+        return_value=SimpleNamespace(
+            user_id=UUID(USER_ID), version=1, modified_at=None
+        ),
+    )
+    mocked_get_user_messages = mocker.patch(
+        "app.api.routes.async_messages.message_service.get_user_messages"
+    )
+
+    response = async_test_client.get(
+        f"{MESSAGES_ROUTE_PATH}/",
+        headers={"If-None-Match": f'W/"{UUID(USER_ID).hex}.1"'},
+    )
+
+    mocked_get_user_messages.assert_not_awaited()
+    assert response.status_code == 304
+
+
+def test_delete_messages_for_user__ids_given__deleted_count_returned(
+    mocker, async_test_client, mock_async_session
+):
+    message_id = "ed7f6f47-487d-4e09-977e-5ecc85cc3654"
+    mocked_delete_messages_for_user = mocker.patch(
+        "app.api.routes.async_messages.message_service.delete_messages_for_user",
+        return_value=1,
+    )
+
+    response = async_test_client.post(
+        f"{MESSAGES_ROUTE_PATH}/batch/delete", json={"ids": [message_id]}
+    )
+
+    mocked_delete_messages_for_user.assert_awaited_once_with(
+        session=mock_async_session,
+        user_id=UUID(USER_ID),
+        message_ids=[UUID(message_id)],
+        before=None,
+    )
+    assert response.json() == {"count": 1}
+
+
+def test_delete_message_for_user__message_deleted__success_response(
+    mocker, async_test_client, mock_async_session
+):
+    message_id = "ed7f6f47-487d-4e09-977e-5ecc85cc3654"
+    mocked_delete_message_for_user = mocker.patch(
+        "app.api.routes.async_messages.message_service.delete_message_for_user"
+    )
+
+    response = async_test_client.delete(f"{MESSAGES_ROUTE_PATH}/{message_id}")
+
+    mocked_delete_message_for_user.assert_awaited_once_with(
+        session=mock_async_session, user_id=UUID(USER_ID), message_id=UUID(message_id)
+    )
+    assert response.status_code == 200
+    assert response.json() == {"message": "Message deleted successfully."}
+
+
+def test_export_user_messages__ndjson__messages_streamed(mocker, async_test_client):
+    message = {
+        "id": "131637b2-dc9a-4907-87b6-5c65eb9e9013",
+        "sender_id": USER_ID,
+        "content": "Hi",
+        "timestamp": "2021-08-01T00:00:00",
+    }
+    mocker.patch("app.api.routes.async_messages.user_service.get_user_by_id")
+    mocker.patch(
+        "app.api.routes.async_messages.open_async_session",
+        return_value=mocker.AsyncMock(),
+    )
+
+    async def iter_user_messages(session, user_id):
+        yield [SimpleNamespace(_mapping=message)]
+        yield [SimpleNamespace(_mapping=message)]
+
+    mocker.patch(
+        "app.api.routes.async_messages.message_service.iter_user_messages",
+        iter_user_messages,
+    )
+
+    response = async_test_client.get(f"{MESSAGES_ROUTE_PATH}/export")
+
+    assert response.status_code == 200
+    assert [json.loads(line) for line in response.text.splitlines()] == [message] * 2
@@ -1,9 +1,23 @@
+import csv
+import io
+import json
+from datetime import datetime
+from types import SimpleNamespace
 from uuid import UUID
 
-import app.core.resources as res
+import pytest
+from starlette.websockets import WebSocketDisconnect
 
-from app.services.exceptions import NotFoundError
-from app.models import Message
+import app.core.resources as res
+from app.api.dependencies import get_session
+from app.core.pubsub import message_hub
+from app.core.rate_limit import InMemoryRateLimitBackend, RateLimit, RateLimiter
+
+from app.core.constants import DEFAULT_MESSAGE_LIMIT, MAXIMUM_MESSAGE_BATCH_SIZE
+from app.services.exceptions import NotFoundError, BadRequestError, GoneError
+from app.services.message_service import ChangesPage
+from app.services.pagination import Page
+from app.models import Message, MessageChange
 from app.models.message import MessageCreate
 
 USER_ID = "b6f37031-672d-4770-b6e8-ca34fad01968"
@@ -30,16 +44,24 @@ def test_get_user_messages__messages_found__messages_returned(
     mock_messaged = [Message(**expected_messages[0]), Message(**expected_messages[1])]
     mocked_get_user_messages = mocker.patch(
         "app.api.routes.messages.message_service.get_user_messages",
-        return_value=mock_messaged,
+        return_value=Page(items=mock_messaged, next_cursor="next"),
     )
 
     response = test_client.get(f"{MESSAGES_ROUTE_PATH}/")
 
     mocked_get_user_messages.assert_called_once_with(
-        session=mock_session, user_id=UUID(USER_ID)
+        session=mock_session,
+        user_id=UUID(USER_ID),
+        limit=DEFAULT_MESSAGE_LIMIT,
+        after=None,
+        before=None,
     )
     assert response.status_code == 200
-    assert response.json() == expected_messages
+    assert response.json() == {
+        "data": expected_messages,
+        "next_cursor": "next",
+        "prev_cursor": None,
+    }
 
 
 def test_get_user_messages__messages_not_found__empty_list_returned(
@@ -48,16 +70,58 @@ def test_get_user_messages__messages_not_found__empty_list_returned(
     mock_messaged = []
     mocked_get_user_messages = mocker.patch(
         "app.api.routes.messages.message_service.get_user_messages",
-        return_value=mock_messaged,
+        return_value=Page(items=mock_messaged),
     )
 
     response = test_client.get(f"{MESSAGES_ROUTE_PATH}/")
 
     mocked_get_user_messages.assert_called_once_with(
-        session=mock_session, user_id=UUID(USER_ID)
+        session=mock_session,
+        user_id=UUID(USER_ID),
+        limit=DEFAULT_MESSAGE_LIMIT,
+        after=None,
+        before=None,
     )
     assert response.status_code == 200
-    assert response.json() == []
+    assert response.json() == {"data": [], "next_cursor": None, "prev_cursor": None}
+
+
+def test_get_user_messages__cursor_and_limit_provided__passed_to_service(
+    mocker, test_client, mock_session
+):
+    mocked_get_user_messages = mocker.patch(
+        "app.api.routes.messages.message_service.get_user_messages",
+        return_value=Page(items=[]),
+    )
+
+    response = test_client.get(f"{MESSAGES_ROUTE_PATH}/?limit=5&after=abc")
+
+    mocked_get_user_messages.assert_called_once_with(
+        session=mock_session, user_id=UUID(USER_ID), limit=5, after="abc", before=None
+    )
+    assert response.status_code == 200
+
+
+def test_get_user_messages__invalid_cursor__400_error_response(
+    mocker, test_client, mock_session
+):
+    mocker.patch(
+        "app.api.routes.messages.message_service.get_user_messages",
+        side_effect=BadRequestError(message=res.INVALID_CURSOR),
+    )
+
+    response = test_client.get(f"{MESSAGES_ROUTE_PATH}/?after=abc")
+
+    assert response.status_code == 400
+    assert response.json() == {"message": res.INVALID_CURSOR}
+
+
+def test_get_user_messages__limit_too_large__400_validation_error_response(
+    test_client,
+):
+    response = test_client.get(f"{MESSAGES_ROUTE_PATH}/?limit=100000")
+
+    assert response.status_code == 400
 
 
 def test_get_user_messages__user_not_found__404_error_response(
@@ -71,12 +135,355 @@ def test_get_user_messages__user_not_found__404_error_response(
     response = test_client.get(f"{MESSAGES_ROUTE_PATH}/")
 
     mocked_get_user_messages.assert_called_once_with(
+        session=mock_session,
+        user_id=UUID(USER_ID),
+        limit=DEFAULT_MESSAGE_LIMIT,
+        after=None,
+        before=None,
+    )
+    assert response.status_code == 404
+    assert response.json() == {"message": res.USER_NOT_FOUND}
+
+
+def test_get_user_messages__fast_json_responses__rows_returned(
+    mocker, test_client, mock_session
+):
+    mocker.patch("app.api.routes.messages.config.FAST_JSON_RESPONSES", True)
+    row = {
+        "id": UUID("131637b2-dc9a-4907-87b6-5c65eb9e9013"),
+        "sender_id": UUID(USER_ID),
+        "content": "Message 1",
+        "timestamp": datetime(2021, 8, 1),
+    }
+    mocked_get_user_messages = mocker.patch(
+        "app.api.routes.messages.message_service.get_user_messages",
+        return_value=Page(items=[SimpleNamespace(_mapping=row)], next_cursor="next"),
+    )
+
+    response = test_client.get(f"{MESSAGES_ROUTE_PATH}/?limit=1")
+
+    mocked_get_user_messages.assert_called_once_with(
+        session=mock_session, user_id=UUID(USER_ID), limit=1, after=None, before=None
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "data": [
+            {
+                "id": "131637b2-dc9a-4907-87b6-5c65eb9e9013",
+                "sender_id": USER_ID,
+                "content": "Message 1",
+                "timestamp": "2021-08-01T00:00:00",
+            }
+        ],
+        "next_cursor": "next",
+        "prev_cursor": None,
+    }
+
+
+@pytest.mark.parametrize("fast_json_responses", [False, True])
+def test_get_user_messages__user_versioned__validators_returned(
+    mocker, test_client, mock_session, fast_json_responses
+):
+    mocker.patch(
+        "app.api.routes.messages.config.FAST_JSON_RESPONSES", fast_json_responses
+    )
+    mocker.patch(
+        "app.api.routes.messages.user_service.get_user_version_by_id",
+        return_value=SimpleNamespace(
+            user_id=UUID(USER_ID), version=0, modified_at=None
+        ),
+    )
+    mocker.patch(
+        "app.api.routes.messages.message_service.get_user_messages",
+        return_value=Page(items=[]),
+    )
+
+    response = test_client.get(f"{MESSAGES_ROUTE_PATH}/")
+
+    assert response.status_code == 200
+    assert response.headers["etag"] == f'W/"{UUID(USER_ID).hex}.0"'
+    assert response.headers["cache-control"] == "no-cache"
+    assert "last-modified" not in response.headers
+
+
+def test_get_user_messages__not_modified_since__304_without_loading_messages(
+    mocker, test_client, mock_session
+):
+    mocked_get_user_version = mocker.patch(
+        "app.api.routes.messages.user_service.get_user_version_by_id",
+        return_value=SimpleNamespace(
+            user_id=UUID(USER_ID), version=5, modified_at=datetime(2024, 1, 31)
+        ),
+    )
+    mocked_get_user_messages = mocker.patch(
+        "app.api.routes.messages.message_service.get_user_messages"
+    )
+
+    response = test_client.get(
+        f"{MESSAGES_ROUTE_PATH}/",
+        headers={"If-Modified-Since": "Wed, 31 Jan 2024 00:00:00 GMT"},
+    )
+
+    mocked_get_user_version.assert_called_once_with(
         session=mock_session, user_id=UUID(USER_ID)
     )
+    mocked_get_user_messages.assert_not_called()
+    assert response.status_code == 304
+    assert response.headers["etag"] == f'W/"{UUID(USER_ID).hex}.5"'
+
+
+def test_search_user_messages__query_provided__page_returned(
+    mocker, test_client, mock_session
+):
+    expected_message = {
+        "id": "131637b2-dc9a-4907-87b6-5c65eb9e9013",
+        "sender_id": USER_ID,
+        "content": "Message 1",
+        "timestamp": "2021-08-01T00:00:00Z",
+    }
+    mocked_search_user_messages = mocker.patch(
+        "app.api.routes.messages.message_service.search_user_messages",
+        return_value=Page(items=[Message(**expected_message)], next_cursor="next"),
+    )
+
+    response = test_client.get(f"{MESSAGES_ROUTE_PATH}/search?q=mess*&limit=1")
+
+    mocked_search_user_messages.assert_called_once_with(
+        session=mock_session, user_id=UUID(USER_ID), q="mess*", limit=1, after=None
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "data": [expected_message],
+        "next_cursor": "next",
+        "prev_cursor": None,
+    }
+
+
+def test_search_user_messages__fast_json_responses__rows_returned(mocker, test_client):
+    mocker.patch("app.api.routes.messages.config.FAST_JSON_RESPONSES", True)
+    row = {
+        "id": UUID("131637b2-dc9a-4907-87b6-5c65eb9e9013"),
+        "sender_id": UUID(USER_ID),
+        "content": "Message 1",
+        "timestamp": datetime(2021, 8, 1),
+        "rank": -1.5,
+        "rowid": 7,
+    }
+    mocker.patch(
+        "app.api.routes.messages.message_service.search_user_messages",
+        return_value=Page(items=[SimpleNamespace(_mapping=row)]),
+    )
+
+    response = test_client.get(f"{MESSAGES_ROUTE_PATH}/search?q=message")
+
+    assert response.status_code == 200
+    # The ranking columns stay out of the response
+    assert response.json() == {
+        "data": [
+            {
+                "id": "131637b2-dc9a-4907-87b6-5c65eb9e9013",
+                "sender_id": USER_ID,
+                "content": "Message 1",
+                "timestamp": "2021-08-01T00:00:00",
+            }
+        ],
+        "next_cursor": None,
+        "prev_cursor": None,
+    }
+
+
+def test_search_user_messages__query_missing__400_validation_error_response(
+    test_client,
+):
+    response = test_client.get(f"{MESSAGES_ROUTE_PATH}/search")
+
+    assert response.status_code == 400
+
+
+def test_get_message_changes__changes_found__changes_returned(
+    mocker, test_client, mock_session
+):
+    message = {
+        "id": "131637b2-dc9a-4907-87b6-5c65eb9e9013",
+        "sender_id": USER_ID,
+        "content": "Message 1",
+        "timestamp": "2021-08-01T00:00:00Z",
+    }
+    deleted_message_id = "55fab7d8-a109-433c-b2f9-98a5b89ddcef"
+    mocked_get_message_changes = mocker.patch(
+        "app.api.routes.messages.message_service.get_message_changes",
+        return_value=ChangesPage(
+            items=[
+                (
+                    MessageChange(seq=4, op="insert", message_id=UUID(message["id"])),
+                    Message(**message),
+                ),
+                (
+                    MessageChange(
+                        seq=7, op="delete", message_id=UUID(deleted_message_id)
+                    ),
+                    None,
+                ),
+            ],
+            next_since=7,
+            has_more=True,
+        ),
+    )
+
+    response = test_client.get(f"{MESSAGES_ROUTE_PATH}/changes?since=3&limit=2")
+
+    mocked_get_message_changes.assert_called_once_with(
+        session=mock_session, user_id=UUID(USER_ID), since=3, limit=2
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "data": [
+            {"seq": 4, "op": "insert", "message_id": message["id"], "message": message},
+            {
+                "seq": 7,
+                "op": "delete",
+                "message_id": deleted_message_id,
+                "message": None,
+            },
+        ],
+        "next_since": 7,
+        "has_more": True,
+    }
+
+
+def test_get_message_changes__changes_compacted__410_error_response(
+    mocker, test_client
+):
+    mocker.patch(
+        "app.api.routes.messages.message_service.get_message_changes",
+        side_effect=GoneError(message=res.CHANGES_COMPACTED),
+    )
+
+    response = test_client.get(f"{MESSAGES_ROUTE_PATH}/changes?since=3")
+
+    assert response.status_code == 410
+    assert response.json() == {"message": res.CHANGES_COMPACTED}
+
+
+def test_get_message_changes__negative_since__400_validation_error_response(
+    test_client,
+):
+    response = test_client.get(f"{MESSAGES_ROUTE_PATH}/changes?since=-1")
+
+    assert response.status_code == 400
+
+
+EXPORTED_MESSAGE = {
+    "id": "131637b2-dc9a-4907-87b6-5c65eb9e9013",
+    "sender_id": USER_ID,
+    "content": "Hi, there",
+    "timestamp": "2021-08-01T00:00:00",
+}
+
+
+def _mock_export(mocker):
+    mocker.patch("app.api.routes.messages.user_service.get_user_by_id")
+    open_session = mocker.patch("app.api.routes.messages.open_session")
+    row = SimpleNamespace(_mapping=EXPORTED_MESSAGE)
+    iter_user_messages = mocker.patch(
+        "app.api.routes.messages.message_service.iter_user_messages",
+        return_value=iter([[row, row], [row]]),
+    )
+    return open_session, iter_user_messages
+
+
+def test_export_user_messages__ndjson__messages_streamed(mocker, test_client):
+    open_session, iter_user_messages = _mock_export(mocker)
+
+    response = test_client.get(
+        f"{MESSAGES_ROUTE_PATH}/export", headers={"Accept-Encoding": "identity"}
+    )
+
+    iter_user_messages.assert_called_once_with(
+        session=open_session.return_value.__enter__.return_value,
+        user_id=UUID(USER_ID),
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["content-disposition"] == (
+        f'attachment; filename="messages-{USER_ID}.ndjson"'
+    )
+    lines = response.text.splitlines()
+    assert [json.loads(line) for line in lines] == [EXPORTED_MESSAGE] * 3
+
+
+def test_export_user_messages__csv_gzip_accepted__compressed_csv_streamed(
+    mocker, test_client
+):
+    _mock_export(mocker)
+
+    response = test_client.get(
+        f"{MESSAGES_ROUTE_PATH}/export?format=csv",
+        headers={"Accept-Encoding": "gzip"},
+    )
+
+    assert response.headers["content-type"] == "text/csv; charset=utf-8"
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    # Decompressed by the client
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert rows == [EXPORTED_MESSAGE] * 3
+
+
+def test_export_user_messages__user_not_found__404_error_response(mocker, test_client):
+    mocker.patch(
+        "app.api.routes.messages.user_service.get_user_by_id",
+        side_effect=NotFoundError(message=res.USER_NOT_FOUND),
+    )
+
+    response = test_client.get(f"{MESSAGES_ROUTE_PATH}/export")
+
     assert response.status_code == 404
     assert response.json() == {"message": res.USER_NOT_FOUND}
 
 
+def test_stream_user_messages__user_not_found__404_error_response(mocker, test_client):
+    mocker.patch(
+        "app.api.routes.messages.user_service.get_user_by_id",
+        side_effect=NotFoundError(message=res.USER_NOT_FOUND),
+    )
+
+    response = test_client.get(f"{MESSAGES_ROUTE_PATH}/stream")
+
+    assert response.status_code == 404
+    assert response.json() == {"message": res.USER_NOT_FOUND}
+
+
+def test_stream_user_messages_websocket__message_published__message_sent(
+    mocker, test_client
+):
+    mocker.patch("app.api.routes.messages.user_service.get_user_by_id")
+    message = {"id": "131637b2-dc9a-4907-87b6-5c65eb9e9013", "content": "Hi"}
+
+    with test_client.websocket_connect(f"{MESSAGES_ROUTE_PATH}/stream") as websocket:
+        message_hub.publish(USER_ID, message)
+        assert websocket.receive_json() == message
+
+    assert not message_hub.has_listeners(USER_ID)
+
+
+def test_stream_user_messages_websocket__user_not_found__connection_rejected(
+    mocker, test_client
+):
+    mocker.patch(
+        "app.api.routes.messages.user_service.get_user_by_id",
+        side_effect=NotFoundError(message=res.USER_NOT_FOUND),
+    )
+
+    with pytest.raises(WebSocketDisconnect) as err:
+        with test_client.websocket_connect(f"{MESSAGES_ROUTE_PATH}/stream"):
+            pass
+
+    assert err.value.code == 1008
+
+
 def test_create_message_for_user__message_created__new_message_with_id_returned(
     mocker, test_client, mock_session
 ):
@@ -127,6 +534,200 @@ def test_create_message_for_user__user_not_found__404_error_response(
     assert response.json() == {"message": res.USER_NOT_FOUND}
 
 
+def test_create_message_for_user__rate_limited__429_before_session_opened(
+    mocker, test_client, mock_session
+):
+    route = "/api/users/{user_id}/messages/"
+    mocker.patch(
+        "app.api.dependencies.rate_limiter",
+        RateLimiter(
+            InMemoryRateLimitBackend(max_buckets=10),
+            [RateLimit("POST", route, rate=1 / 60, burst=1, per_user=True)],
+        ),
+    )
+    mocked_create_message_for_user = mocker.patch(
+        "app.api.routes.messages.message_service.create_message_for_user",
+        return_value=Message(content="Hey there!", sender_id=UUID(USER_ID)),
+    )
+    opened_sessions = []
+    mocker.patch.dict(
+        test_client.app.dependency_overrides,
+        {get_session: lambda: opened_sessions.append(1) or mock_session},
+    )
+
+    first = test_client.post(f"{MESSAGES_ROUTE_PATH}/", json={"content": "Hi"})
+    # Another spelling of the same user_id shares the bucket
+    second = test_client.post(
+        f"/api/users/{USER_ID.upper()}/messages/", json={"content": "Hi"}
+    )
+
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert second.headers["retry-after"] == "60"
+    assert second.json() == {"message": res.RATE_LIMITED}
+    assert mocked_create_message_for_user.call_count == 1
+    assert len(opened_sessions) == 1
+
+
+def test_create_messages_for_user__json_batch__created_ids_returned(
+    mocker, test_client, mock_session
+):
+    messages_create = [{"content": "Message 1"}, {"content": "Message 2"}]
+    expected_created = [
+        {
+            "id": "ed7f6f47-487d-4e09-977e-5ecc85cc3654",
+            "timestamp": "2021-08-01T00:00:00Z",
+        },
+        {
+            "id": "131637b2-dc9a-4907-87b6-5c65eb9e9013",
+            "timestamp": "2021-08-01T00:00:01Z",
+        },
+    ]
+    mocked_create_messages_for_user = mocker.patch(
+        "app.api.routes.messages.message_service.create_messages_for_user",
+        return_value=[
+            Message(**created, **message_create, sender_id=USER_ID)
+            for created, message_create in zip(expected_created, messages_create)
+        ],
+    )
+
+    response = test_client.post(f"{MESSAGES_ROUTE_PATH}/batch", json=messages_create)
+
+    mocked_create_messages_for_user.assert_called_once_with(
+        session=mock_session,
+        user_id=UUID(USER_ID),
+        messages_in=[MessageCreate(**message) for message in messages_create],
+    )
+    assert response.status_code == 200
+    assert response.json() == {"data": expected_created, "count": 2}
+
+
+def test_create_messages_for_user__ndjson_batch__messages_parsed(
+    mocker, test_client, mock_session
+):
+    mocked_create_messages_for_user = mocker.patch(
+        "app.api.routes.messages.message_service.create_messages_for_user",
+        return_value=[],
+    )
+
+    response = test_client.post(
+        f"{MESSAGES_ROUTE_PATH}/batch",
+        content=b'{"content": "Message 1"}\n\n{"content": "Message 2"}\n',
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+
+    mocked_create_messages_for_user.assert_called_once_with(
+        session=mock_session,
+        user_id=UUID(USER_ID),
+        messages_in=[
+            MessageCreate(content="Message 1"),
+            MessageCreate(content="Message 2"),
+        ],
+    )
+    assert response.status_code == 200
+    assert response.json() == {"data": [], "count": 0}
+
+
+def test_create_messages_for_user__batch_too_large__400_error_response(
+    mocker, test_client
+):
+    mocked_create_messages_for_user = mocker.patch(
+        "app.api.routes.messages.message_service.create_messages_for_user"
+    )
+
+    response = test_client.post(
+        f"{MESSAGES_ROUTE_PATH}/batch",
+        json=[{"content": "Message"}] * (MAXIMUM_MESSAGE_BATCH_SIZE + 1),
+    )
+
+    mocked_create_messages_for_user.assert_not_called()
+    assert response.status_code == 400
+    assert response.json() == {"message": res.MESSAGE_BATCH_TOO_LARGE}
+
+
+def test_create_messages_for_user__invalid_ndjson_line__400_validation_error_response(
+    mocker, test_client
+):
+    mocker.patch("app.api.routes.messages.message_service.create_messages_for_user")
+
+    response = test_client.post(
+        f"{MESSAGES_ROUTE_PATH}/batch",
+        content=b'{"content": "Message 1"}\n{"text": "Message 2"}',
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": ["body -> 2 -> content: Field required"]}
+
+
+def test_delete_messages_for_user__ids_given__deleted_count_returned(
+    mocker, test_client, mock_session
+):
+    message_id = "ed7f6f47-487d-4e09-977e-5ecc85cc3654"
+    mocked_delete_messages_for_user = mocker.patch(
+        "app.api.routes.messages.message_service.delete_messages_for_user",
+        return_value=1,
+    )
+
+    response = test_client.post(
+        f"{MESSAGES_ROUTE_PATH}/batch/delete", json={"ids": [message_id]}
+    )
+
+    mocked_delete_messages_for_user.assert_called_once_with(
+        session=mock_session,
+        user_id=UUID(USER_ID),
+        message_ids=[UUID(message_id)],
+        before=None,
+    )
+    assert response.status_code == 200
+    assert response.json() == {"count": 1}
+
+
+def test_delete_messages_for_user__before_given__deleted_count_returned(
+    mocker, test_client, mock_session
+):
+    mocked_delete_messages_for_user = mocker.patch(
+        "app.api.routes.messages.message_service.delete_messages_for_user",
+        return_value=250,
+    )
+
+    response = test_client.post(
+        f"{MESSAGES_ROUTE_PATH}/batch/delete", json={"before": "2024-01-01T00:00:00"}
+    )
+
+    mocked_delete_messages_for_user.assert_called_once_with(
+        session=mock_session,
+        user_id=UUID(USER_ID),
+        message_ids=None,
+        before=datetime(2024, 1, 1),
+    )
+    assert response.json() == {"count": 250}
+
+
+def test_delete_messages_for_user__conflicting_filters__400_error_response(
+    mocker, test_client
+):
+    mocker.patch(
+        "app.api.routes.messages.message_service.delete_messages_for_user",
+        side_effect=BadRequestError(res.CONFLICTING_DELETE_FILTERS),
+    )
+
+    response = test_client.post(f"{MESSAGES_ROUTE_PATH}/batch/delete", json={})
+
+    assert response.status_code == 400
+    assert response.json() == {"message": res.CONFLICTING_DELETE_FILTERS}
+
+
+def test_delete_messages_for_user__too_many_ids__400_error_response(test_client):
+    ids = ["ed7f6f47-487d-4e09-977e-5ecc85cc3654"] * (MAXIMUM_MESSAGE_BATCH_SIZE + 1)
+
+    response = test_client.post(
+        f"{MESSAGES_ROUTE_PATH}/batch/delete", json={"ids": ids}
+    )
+
+    assert response.status_code == 400
+
+
 def test_delete_message_for_user__message_deleted__success_response(
     mocker, test_client, mock_session
 ):
@@ -0,0 +1,10 @@
+def test_get_metrics__prometheus_text_returned(test_client):
+    test_client.get("/api/")
+
+    response = test_client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{method="GET",route="/api/",status_code="200"}' in (
+        response.text
+    )
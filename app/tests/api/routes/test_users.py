@@ -1,12 +1,17 @@
+from datetime import datetime
+from types import SimpleNamespace
 from uuid import UUID
 import pytest
 
-from app.core.constants import DEFAULT_USER_LIMIT
+from app.core.constants import DEFAULT_USER_LIMIT, MAXIMUM_USER_BATCH_SIZE
 from app.services.exceptions import NotFoundError, AlreadyExistsError
 from app.models import User
 from app.models.user import UserCreate, UserUpdate
+from app.services.pagination import Page
+from app.services.user_service import UserBatchItem, UserCount
 import app.core.resources as res
 
+USER_ID = "b6f37031-672d-4770-b6e8-ca34fad01968"
 USERS_ROUTE_PATH = "/api/users"
 
 
@@ -26,48 +31,118 @@ def test_get_users__users_found__users_returned(mocker, test_client, mock_sessio
     mock_users = [User(**expected_users[0]), User(**expected_users[1])]
 
     mocked_get_users = mocker.patch(
-        "app.api.routes.users.user_service.get_users", return_value=mock_users
+        "app.api.routes.users.user_service.get_users",
+        return_value=Page(items=mock_users, next_cursor="next"),
     )
 
     response = test_client.get(f"{USERS_ROUTE_PATH}/")
 
     mocked_get_users.assert_called_once_with(
-        limit=DEFAULT_USER_LIMIT, session=mock_session
+        session=mock_session,
+        limit=DEFAULT_USER_LIMIT,
+        after=None,
+        order_by="id",
+        email_prefix=None,
+        name_prefix=None,
     )
     assert response.status_code == 200
-    assert response.json() == expected_users
+    assert response.json() == {
+        "data": expected_users,
+        "next_cursor": "next",
+        "total": None,
+        "total_exact": None,
+    }
+
+
+def test_get_users__fast_json_responses__rows_returned(
+    mocker, test_client, mock_session
+):
+    mocker.patch("app.api.routes.users.config.FAST_JSON_RESPONSES", True)
+    expected_user = {
+        "id": "b6f37031-672d-4770-b6e8-ca34fad01968",
+        "name": "User 1",
+        "email": "user1@test.com",
+    }
+    row = {**expected_user, "id": UUID(expected_user["id"])}
+    mocker.patch(
+        "app.api.routes.users.user_service.get_users",
+        return_value=Page(items=[SimpleNamespace(_mapping=row)]),
+    )
+
+    response = test_client.get(f"{USERS_ROUTE_PATH}/")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "data": [expected_user],
+        "next_cursor": None,
+        "total": None,
+        "total_exact": None,
+    }
 
 
 def test_get_users__users_not_found__empty_list_returned(
     mocker, test_client, mock_session
 ):
-    mock_users = []
-    mocked_get_users = mocker.patch(
-        "app.api.routes.users.user_service.get_users", return_value=mock_users
+    mocker.patch(
+        "app.api.routes.users.user_service.get_users", return_value=Page(items=[])
     )
 
     response = test_client.get(f"{USERS_ROUTE_PATH}/")
 
+    assert response.status_code == 200
+    assert response.json()["data"] == []
+    assert response.json()["next_cursor"] is None
+
+
+def test_get_users__called_with_cursor_and_filters__filters_passed_to_service(
+    mocker, test_client, mock_session
+):
+    mocked_get_users = mocker.patch(
+        "app.api.routes.users.user_service.get_users", return_value=Page(items=[])
+    )
+
+    response = test_client.get(
+        f"{USERS_ROUTE_PATH}/?limit=1&after=cursor&order_by=email"
+        "&email_prefix=ann&name_prefix=An"
+    )
+
     mocked_get_users.assert_called_once_with(
-        limit=DEFAULT_USER_LIMIT, session=mock_session
+        session=mock_session,
+        limit=1,
+        after="cursor",
+        order_by="email",
+        email_prefix="ann",
+        name_prefix="An",
     )
     assert response.status_code == 200
-    assert response.json() == []
 
 
-def test_get_users__users_called_with_custom_limit__limited_users_returned(
+def test_get_users__total_requested__count_estimate_returned(
     mocker, test_client, mock_session
 ):
-    custom_limit = 1
-    mocked_get_users = mocker.patch(
-        "app.api.routes.users.user_service.get_users", return_value=[]
+    mocker.patch(
+        "app.api.routes.users.user_service.get_users", return_value=Page(items=[])
+    )
+    mocked_estimate_user_count = mocker.patch(
+        "app.api.routes.users.user_service.estimate_user_count",
+        return_value=UserCount(value=10000, exact=False),
     )
 
-    response = test_client.get(f"{USERS_ROUTE_PATH}/?limit={custom_limit}")
+    response = test_client.get(f"{USERS_ROUTE_PATH}/?include_total=true&email_prefix=a")
 
-    mocked_get_users.assert_called_once_with(limit=custom_limit, session=mock_session)
+    mocked_estimate_user_count.assert_called_once_with(
+        session=mock_session, email_prefix="a", name_prefix=None
+    )
     assert response.status_code == 200
-    assert response.json() == []
+    assert response.json()["total"] == 10000
+    assert response.json()["total_exact"] is False
+
+
+@pytest.mark.parametrize("query", ["order_by=name", "limit=0", "limit=101"])
+def test_get_users__invalid_query__400_validation_error_response(test_client, query):
+    response = test_client.get(f"{USERS_ROUTE_PATH}/?{query}")
+
+    assert response.status_code == 400
 
 
 def test_get_user_by_email__user_found__user_returned(
@@ -127,6 +202,53 @@ def test_get_user_by_email__user_not_found__404_error_response(
     assert response.json() == {"message": res.USER_NOT_FOUND}
 
 
+def test_get_user_by_email__user_found__validators_returned(
+    mocker, test_client, mock_session
+):
+    user = User(email="user1@test.com", id=UUID(USER_ID), name="User 1")
+    mocker.patch(
+        "app.api.routes.users.user_service.get_user_version_by_email",
+        return_value=SimpleNamespace(
+            user_id=user.id, version=2, modified_at=datetime(2024, 1, 31)
+        ),
+    )
+    mocker.patch(
+        "app.api.routes.users.user_service.get_user_by_email", return_value=user
+    )
+
+    response = test_client.get(f"{USERS_ROUTE_PATH}/{user.email}")
+
+    assert response.status_code == 200
+    assert response.headers["etag"] == f'W/"{user.id.hex}.2"'
+    assert response.headers["last-modified"] == "Wed, 31 Jan 2024 00:00:00 GMT"
+
+
+def test_get_user_by_email__etag_matches__304_without_loading_user(
+    mocker, test_client, mock_session
+):
+    mocked_get_user_version = mocker.patch(
+        "app.api.routes.users.user_service.get_user_version_by_email",
+        return_value=SimpleNamespace(
+            user_id=UUID(USER_ID), version=2, modified_at=datetime(2024, 1, 31)
+        ),
+    )
+    mocked_get_user_by_email = mocker.patch(
+        "app.api.routes.users.user_service.get_user_by_email"
+    )
+
+    response = test_client.get(
+        f"{USERS_ROUTE_PATH}/user1@test.com",
+        headers={"If-None-Match": f'W/"{UUID(USER_ID).hex}.2"'},
+    )
+
+    mocked_get_user_version.assert_called_once_with(
+        email="user1@test.com", session=mock_session
+    )
+    mocked_get_user_by_email.assert_not_called()
+    assert response.status_code == 304
+    assert response.content == b""
+
+
 def test_create_user__user_created__new_user_with_id_returned(
     mocker, test_client, mock_session
 ):
@@ -171,6 +293,53 @@ def test_create_user__email_already_exists__409_error_response(
     assert response.json() == {"message": res.EMAIL_ALREADY_EXISTS}
 
 
+def test_create_users__batch_with_conflict__per_item_results_returned(
+    mocker, test_client, mock_session
+):
+    users_create = [
+        {"email": "user1@test.com", "name": "User 1"},
+        {"email": "user2@test.com", "name": "User 2"},
+    ]
+    created_user = {**users_create[0], "id": "b6f37031-672d-4770-b6e8-ca34fad01968"}
+    mocked_create_users = mocker.patch(
+        "app.api.routes.users.user_service.create_users",
+        return_value=[
+            UserBatchItem(index=0, user=User(**created_user)),
+            UserBatchItem(index=1, error=res.EMAIL_ALREADY_EXISTS),
+        ],
+    )
+
+    response = test_client.post(f"{USERS_ROUTE_PATH}/batch", json=users_create)
+
+    mocked_create_users.assert_called_once_with(
+        session=mock_session, users_in=[UserCreate(**user) for user in users_create]
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "data": [
+            {"index": 0, "user": created_user, "error": None},
+            {"index": 1, "user": None, "error": res.EMAIL_ALREADY_EXISTS},
+        ],
+        "created": 1,
+        "conflicts": 1,
+    }
+
+
+def test_create_users__batch_too_large__400_validation_error_response(
+    mocker, test_client
+):
+    mocked_create_users = mocker.patch("app.api.routes.users.user_service.create_users")
+    users_create = [
+        {"email": f"user{i}@test.com", "name": "User"}
+        for i in range(MAXIMUM_USER_BATCH_SIZE + 1)
+    ]
+
+    response = test_client.post(f"{USERS_ROUTE_PATH}/batch", json=users_create)
+
+    mocked_create_users.assert_not_called()
+    assert response.status_code == 400
+
+
 def test_update_user__user_updated__updated_user_returned(
     mocker, test_client, mock_session
 ):
@@ -0,0 +1,69 @@
+from datetime import datetime
+from types import SimpleNamespace
+from uuid import UUID
+
+import pytest
+from starlette.requests import Request
+
+from app.api.conditional import not_modified, validator_headers
+
+VERSION = SimpleNamespace(
+    user_id=UUID("b6f37031-672d-4770-b6e8-ca34fad01968"),
+    version=3,
+    modified_at=datetime(2024, 1, 31, 12, 30, 15, 500000),
+)
+ETAG = 'W/"b6f37031672d4770b6e8ca34fad01968.3"'
+
+
+def _request(**headers) -> Request:
+    raw_headers = [
+        (name.replace("_", "-").encode(), value.encode())
+        for name, value in headers.items()
+    ]
+    return Request({"type": "http", "headers": raw_headers})
+
+
+def test_validator_headers__version__etag_and_last_modified():
+    assert validator_headers(VERSION) == {
+        "ETag": ETAG,
+        "Cache-Control": "no-cache",
+        "Last-Modified": "Wed, 31 Jan 2024 12:30:15 GMT",
+    }
+    assert "Last-Modified" not in validator_headers(
+        SimpleNamespace(user_id=VERSION.user_id, version=0, modified_at=None)
+    )
+    assert validator_headers(None) == {}
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        ({}, False),
+        ({"if_none_match": ETAG}, True),
+        ({"if_none_match": f'"other", {ETAG.removeprefix("W/")}'}, True),
+        ({"if_none_match": "*"}, True),
+        ({"if_none_match": 'W/"b6f37031672d4770b6e8ca34fad01968.2"'}, False),
+        ({"if_modified_since": "Wed, 31 Jan 2024 12:30:15 GMT"}, True),
+        ({"if_modified_since": "Wed, 31 Jan 2024 12:30:14 GMT"}, False),
+        ({"if_modified_since": "yesterday"}, False),
+        # If-None-Match wins over If-Modified-Since
+        (
+            {
+                "if_none_match": '"other"',
+                "if_modified_since": "Wed, 31 Jan 2024 12:30:15 GMT",
+            },
+            False,
+        ),
+    ],
+)
+def test_not_modified__request_validators__304_when_current(headers, expected):
+    response = not_modified(_request(**headers), VERSION)
+
+    assert (response is not None) == expected
+    if response is not None:
+        assert response.status_code == 304
+        assert response.headers["etag"] == ETAG
+
+
+def test_not_modified__no_such_user__none():
+    assert not_modified(_request(if_none_match="*"), None) is None
@@ -0,0 +1,62 @@
+import uuid
+
+from fastapi.requests import HTTPConnection
+
+from app.api.dependencies import get_session
+from app.core.read_routing import ReadRouter, record_session_writes
+
+
+def _connection(method, user_id=None, **path_params):
+    if user_id is not None:
+        path_params["user_id"] = str(user_id)
+    return HTTPConnection(
+        {"type": "http", "method": method, "path_params": path_params, "headers": []}
+    )
+
+
+def _session_engine(connection, *written_keys):
+    dependency = get_session(connection)
+    session = next(dependency)
+    bind = session.get_bind()
+    # What services record for the users they write
+    if written_keys:
+        record_session_writes(session, *written_keys)
+    next(dependency, None)
+    return bind
+
+
+def test_get_session__get_request__read_engine_used(mocker):
+    read_engine = mocker.Mock()
+    mocker.patch(
+        "app.api.dependencies.read_router", ReadRouter([read_engine], sticky_seconds=5)
+    )
+
+    assert _session_engine(_connection("GET", uuid.uuid4())) is read_engine
+
+
+def test_get_session__after_write__reads_of_user_use_primary(mocker):
+    read_engine = mocker.Mock()
+    mocker.patch(
+        "app.api.dependencies.read_router", ReadRouter([read_engine], sticky_seconds=5)
+    )
+    primary = mocker.patch("app.api.dependencies.engine")
+    user_id, other_user_id = uuid.uuid4(), uuid.uuid4()
+
+    assert _session_engine(_connection("POST", user_id)) is primary
+    assert _session_engine(_connection("GET", user_id)) is primary
+    assert _session_engine(_connection("GET", other_user_id)) is read_engine
+
+
+def test_get_session__after_user_created__lookups_by_email_use_primary(mocker):
+    read_engine = mocker.Mock()
+    mocker.patch(
+        "app.api.dependencies.read_router", ReadRouter([read_engine], sticky_seconds=5)
+    )
+    primary = mocker.patch("app.api.dependencies.engine")
+    user_id = str(uuid.uuid4())
+
+    _session_engine(_connection("POST"), user_id, "jo@test.com")
+
+    assert _session_engine(_connection("GET", email="jo@test.com")) is primary
+    assert _session_engine(_connection("GET", user_id)) is primary
+    assert _session_engine(_connection("GET", email="jan@test.com")) is read_engine
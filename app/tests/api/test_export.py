@@ -0,0 +1,62 @@
+import gzip
+from types import SimpleNamespace
+
+import pytest
+
+from app.api.export import ExportEncoder, accepts_gzip
+from app.models.message import MessageRow
+
+ROW = SimpleNamespace(
+    _mapping={
+        "id": "131637b2-dc9a-4907-87b6-5c65eb9e9013",
+        "sender_id": "b6f37031-672d-4770-b6e8-ca34fad01968",
+        "content": 'Say "hi", then',
+        "timestamp": "2021-08-01T00:00:00",
+    }
+)
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("gzip, deflate", True),
+        ("br;q=1.0, gzip;q=0.5", True),
+        ("*", True),
+        ("gzip;q=0", False),
+        ("identity", False),
+        ("", False),
+    ],
+)
+def test_accepts_gzip__accept_encoding__negotiated(accept_encoding, expected):
+    assert accepts_gzip(accept_encoding) is expected
+
+
+def test_export_encoder__csv_batches__header_written_once_and_values_quoted():
+    encoder = ExportEncoder("csv", MessageRow, name="messages", gzip=False)
+
+    body = encoder.encode([ROW]) + encoder.encode([ROW]) + encoder.finish()
+
+    assert body.decode().splitlines() == [
+        "id,sender_id,content,timestamp",
+        *[
+            "131637b2-dc9a-4907-87b6-5c65eb9e9013,b6f37031-672d-4770-b6e8-ca34fad01968,"
+            '"Say ""hi"", then",2021-08-01T00:00:00'
+        ]
+        * 2,
+    ]
+
+
+def test_export_encoder__csv_without_rows__header_only():
+    encoder = ExportEncoder("csv", MessageRow, name="messages", gzip=False)
+
+    assert encoder.finish() == b"id,sender_id,content,timestamp\r\n"
+
+
+def test_export_encoder__gzip__chunks_form_one_gzip_stream():
+    plain = ExportEncoder("ndjson", MessageRow, name="messages", gzip=False)
+    compressed = ExportEncoder("ndjson", MessageRow, name="messages", gzip=True)
+
+    chunks = [compressed.encode([ROW] * 10) for _ in range(3)] + [compressed.finish()]
+
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(b"".join(chunks)) == plain.encode([ROW] * 30)
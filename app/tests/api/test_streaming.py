@@ -0,0 +1,44 @@
+import pytest
+
+from app.api.streaming import sse_events
+from app.core.pubsub import LocalPubSubBackend, MessageHub
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_sse_events__message_published__message_event_yielded():
+    hub = MessageHub(backend=LocalPubSubBackend(), queue_size=10)
+    events = sse_events(hub.subscribe("user-1"))
+    assert await events.__anext__() == "retry: 3000\n\n"
+
+    hub.publish("user-1", {"id": "1", "content": "Hi"})
+
+    assert await events.__anext__() == (
+        'id: 1\nevent: message\ndata: {"id": "1", "content": "Hi"}\n\n'
+    )
+    await events.aclose()
+    assert hub.subscriber_count() == 0
+
+
+async def test_sse_events__nothing_published__keepalive_yielded(mocker):
+    mocker.patch("app.api.streaming.config.MESSAGE_STREAM_KEEPALIVE_SECONDS", 0.01)
+    hub = MessageHub(backend=LocalPubSubBackend(), queue_size=10)
+    events = sse_events(hub.subscribe("user-1"))
+    await events.__anext__()
+
+    assert await events.__anext__() == ": keepalive\n\n"
+    await events.aclose()
+
+
+async def test_sse_events__subscriber_fell_behind__overflow_event_ends_stream():
+    hub = MessageHub(backend=LocalPubSubBackend(), queue_size=1)
+    events = sse_events(hub.subscribe("user-1"))
+    await events.__anext__()
+
+    hub.publish("user-1", {"id": "1"})
+    hub.publish("user-1", {"id": "2"})
+
+    assert [event async for event in events] == [
+        'id: 1\nevent: message\ndata: {"id": "1"}\n\n',
+        "event: overflow\ndata: {}\n\n",
+    ]
@@ -0,0 +1,21 @@
+import pytest
+
+from app.core.cache import user_cache
+from app.core.rate_limit import rate_limiter
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def clear_user_cache():
+    user_cache.clear()
+    yield
+    user_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    rate_limiter.backend.reset()
@@ -0,0 +1,57 @@
+import gzip
+import uuid
+from datetime import date, datetime
+
+import pytest
+
+from app.core import archive as archive_module
+from app.core.archive import PartitionArchive
+from app.models.message import MessageRow
+
+SENDER_ID = uuid.UUID("b6f37031-672d-4770-b6e8-ca34fad01968")
+
+
+def _message(day: int, content: str) -> dict:
+    return {
+        "id": uuid.uuid4(),
+        "sender_id": SENDER_ID,
+        "content": content,
+        "timestamp": datetime(2024, 1, day, 12, 30),
+    }
+
+
+def _day_of(row: dict) -> date:
+    return row["timestamp"].date()
+
+
+def test_partition_archive__batches_written__rows_read_back_per_day(tmp_path):
+    archive = PartitionArchive(tmp_path, MessageRow, prefix="messages")
+    first_batch = [_message(1, "a"), _message(2, "b")]
+    second_batch = [_message(1, "c")]
+
+    archive.write(first_batch, day_of=_day_of)
+    archive.write(second_batch, day_of=_day_of)
+
+    assert archive.partitions() == [date(2024, 1, 1), date(2024, 1, 2)]
+    assert list(archive.read(date(2024, 1, 1))) == [first_batch[0], second_batch[0]]
+    assert list(archive.read(date(2024, 1, 2))) == [first_batch[1]]
+    # Appended batches are separate gzip members of one valid stream
+    path = archive.partition_path(date(2024, 1, 1))
+    assert path.name == "messages-2024-01-01.ndjson.gz"
+    assert gzip.decompress(path.read_bytes()).count(b"\n") == 2
+
+
+def test_partition_archive__partition_missing__file_not_found_error_raised(tmp_path):
+    archive = PartitionArchive(tmp_path, MessageRow, prefix="messages")
+
+    with pytest.raises(FileNotFoundError):
+        list(archive.read(date(2024, 1, 1)))
+
+
+def test_partition_archive__zstd_without_zstandard__runtime_error_raised(
+    tmp_path, mocker
+):
+    mocker.patch.object(archive_module, "zstandard", None)
+
+    with pytest.raises(RuntimeError):
+        PartitionArchive(tmp_path, MessageRow, prefix="messages", compression="zstd")
@@ -0,0 +1,101 @@
+import fnmatch
+
+from app.core.cache import InMemoryCache, NullCache, RedisCache, create_cache
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+        self.expirations = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, value, ex=None):
+        self.store[key] = value
+        self.expirations[key] = ex
+
+    def delete(self, *keys):
+        for key in keys:
+            self.store.pop(key, None)
+
+    def scan_iter(self, match):
+        return [key for key in list(self.store) if fnmatch.fnmatch(key, match)]
+
+
+def test_in_memory_cache__value_set__value_returned_and_hit_counted():
+    cache = InMemoryCache(ttl_seconds=60, max_size=10)
+
+    cache.set("key", {"value": 1})
+
+    assert cache.get("key") == {"value": 1}
+    assert cache.get("missing") is None
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 1
+
+
+def test_in_memory_cache__entry_expired__miss_returned(mocker):
+    monotonic = mocker.patch("app.core.cache.time.monotonic", return_value=100.0)
+    cache = InMemoryCache(ttl_seconds=5, max_size=10)
+    cache.set("key", {"value": 1})
+
+    monotonic.return_value = 106.0
+
+    assert cache.get("key") is None
+    assert cache.size() == 0
+
+
+def test_in_memory_cache__max_size_exceeded__least_recently_used_evicted():
+    cache = InMemoryCache(ttl_seconds=60, max_size=2)
+    cache.set("a", {"value": 1})
+    cache.set("b", {"value": 2})
+    cache.get("a")
+
+    cache.set("c", {"value": 3})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"value": 1}
+    assert cache.get("c") == {"value": 3}
+
+
+def test_in_memory_cache__keys_deleted__entries_invalidated():
+    cache = InMemoryCache(ttl_seconds=60, max_size=10)
+    cache.set("a", {"value": 1})
+    cache.set("b", {"value": 2})
+
+    cache.delete("a", "b")
+
+    assert cache.size() == 0
+    assert cache.stats.invalidations == 2
+
+
+def test_redis_cache__value_set__serialized_with_prefix_and_ttl():
+    client = FakeRedis()
+    cache = RedisCache(client=client, ttl_seconds=30, prefix="user:")
+
+    cache.set("id:1", {"name": "User"})
+
+    assert client.store == {"user:id:1": '{"name": "User"}'}
+    assert client.expirations == {"user:id:1": 30}
+    assert cache.get("id:1") == {"name": "User"}
+    assert cache.size() == 1
+
+
+def test_redis_cache__cleared__only_prefixed_keys_deleted():
+    client = FakeRedis()
+    client.set("other", "value")
+    cache = RedisCache(client=client, ttl_seconds=30, prefix="user:")
+    cache.set("id:1", {"name": "User"})
+
+    cache.clear()
+
+    assert list(client.store) == ["other"]
+
+
+def test_create_cache__none_backend__null_cache_returned():
+    cache = create_cache(backend="none", ttl_seconds=60, max_size=10)
+
+    cache.set("key", {"value": 1})
+
+    assert isinstance(cache, NullCache)
+    assert cache.get("key") is None
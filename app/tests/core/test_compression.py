@@ -0,0 +1,142 @@
+import gzip
+import zlib
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core.compression import CompressionMiddleware, negotiate_encoding
+
+LARGE_TEXT = "message " * 500
+
+
+def _create_app(**options) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, encodings=["gzip"], **options)
+
+    @app.get("/text")
+    def get_text(size: int = len(LARGE_TEXT)):
+        return PlainTextResponse(LARGE_TEXT[:size])
+
+    @app.get("/stream")
+    def get_stream(media_type: str = "application/x-ndjson"):
+        return StreamingResponse(
+            (f'{{"n": {n}}}\n' for n in range(100)), media_type=media_type
+        )
+
+    @app.get("/varied")
+    def get_varied():
+        return PlainTextResponse(LARGE_TEXT, headers={"Vary": "Accept-Encoding"})
+
+    @app.get("/encoded")
+    def get_encoded():
+        return PlainTextResponse(
+            gzip.compress(LARGE_TEXT.encode()), headers={"Content-Encoding": "gzip"}
+        )
+
+    return app
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("gzip, deflate", "gzip"),
+        ("br;q=1.0, gzip;q=0.5", "br"),
+        ("gzip, br", "br"),
+        ("*", "zstd"),
+        ("*;q=0, gzip", "gzip"),
+        ("gzip;q=0", None),
+        ("identity", None),
+        ("", None),
+    ],
+)
+def test_negotiate_encoding__accept_encoding__preferred_accepted_encoding(
+    accept_encoding, expected
+):
+    assert negotiate_encoding(accept_encoding, ["zstd", "br", "gzip"]) == expected
+
+
+def test_compression_middleware__large_body__compressed():
+    client = TestClient(_create_app(minimum_size=100))
+
+    response = client.get("/text", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(LARGE_TEXT)
+    assert response.text == LARGE_TEXT
+
+
+def test_compression_middleware__vary_already_sent__not_repeated():
+    client = TestClient(_create_app(minimum_size=100))
+
+    response = client.get("/varied", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+
+
+def test_compression_middleware__small_body_or_no_gzip__sent_as_is():
+    client = TestClient(_create_app(minimum_size=100))
+
+    small = client.get("/text?size=99", headers={"Accept-Encoding": "gzip"})
+    identity = client.get("/text", headers={"Accept-Encoding": "identity"})
+
+    assert "content-encoding" not in small.headers
+    assert small.text == LARGE_TEXT[:99]
+    assert "content-encoding" not in identity.headers
+    assert identity.text == LARGE_TEXT
+
+
+@pytest.mark.anyio
+async def test_compression_middleware__streamed_body__every_chunk_decodable():
+    async def stream_app(scope, receive, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/x-ndjson")],
+            }
+        )
+        for n in range(3):
+            body = f'{{"n": {n}}}\n'.encode()
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = CompressionMiddleware(stream_app, minimum_size=100_000)
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "headers": [(b"accept-encoding", b"gzip")],
+    }
+    await middleware(scope, None, send)
+
+    start, *bodies = messages
+    assert (b"content-encoding", b"gzip") in start["headers"]
+    assert [body.get("more_body", False) for body in bodies] == [True] * 3 + [False]
+    # Every chunk is flushed, so it decodes to its line as soon as it arrives
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    lines = [decompressor.decompress(body["body"]) for body in bodies]
+    assert lines == [b'{"n": 0}\n', b'{"n": 1}\n', b'{"n": 2}\n', b""]
+    assert decompressor.eof
+
+
+@pytest.mark.parametrize("path", ["/encoded", "/stream?media_type=text/event-stream"])
+def test_compression_middleware__encoded_or_event_stream__not_compressed(path):
+    client = TestClient(_create_app(minimum_size=1))
+
+    response = client.get(path, headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers.get("content-encoding", "gzip") == "gzip"
+    assert "vary" not in response.headers
+
+
+def test_compression_middleware__invalid_level__value_error():
+    with pytest.raises(ValueError):
+        CompressionMiddleware(app=None, encodings=["gzip"], levels={"gzip": 10})
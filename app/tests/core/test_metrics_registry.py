@@ -0,0 +1,104 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import create_engine
+
+from app.core import metrics
+from app.core.metrics import (
+    Counter,
+    Histogram,
+    MetricsRegistry,
+    RequestDatabaseStats,
+    instrument_engine,
+)
+from app.core.middleware import MetricsMiddleware
+
+
+def test_counter__incremented__rendered_with_labels():
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("requests_total", "Requests.", ("route",)))
+
+    counter.inc(route="/a")
+    counter.inc(2, route='/b"')
+
+    assert registry.render() == (
+        "# HELP requests_total Requests.\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{route="/a"} 1.0\n'
+        'requests_total{route="/b\\""} 2.0\n'
+    )
+
+
+def test_histogram__values_observed__cumulative_buckets_rendered():
+    histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    assert histogram.render()[2:] == [
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1.0"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        "latency_seconds_sum 5.55",
+        "latency_seconds_count 3",
+    ]
+
+
+def test_instrument_engine__queries_executed__counted_for_current_request():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    stats = RequestDatabaseStats()
+    token = metrics.request_db_stats.set(stats)
+
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            connection.execute(text("SELECT 2"))
+    finally:
+        metrics.request_db_stats.reset(token)
+
+    assert stats.queries == 2
+    assert stats.duration > 0
+
+
+def test_instrument_engine__statement_fails__next_query_timed_from_its_start(mocker):
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    mocker.patch.object(metrics.time, "perf_counter", side_effect=[1.0, 10.0, 10.5])
+    stats = RequestDatabaseStats()
+    token = metrics.request_db_stats.set(stats)
+
+    try:
+        with engine.connect() as connection:
+            with pytest.raises(OperationalError):
+                connection.execute(text("SELECT * FROM missing"))
+            connection.execute(text("SELECT 1"))
+            info = dict(connection.info)
+    finally:
+        metrics.request_db_stats.reset(token)
+
+    assert stats.queries == 1
+    assert stats.duration == 0.5
+    assert not info.get("query_start_time")
+
+
+def test_metrics_middleware__request_handled__recorded_by_route_template():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/things/{thing_id}")
+    def get_thing(thing_id: int):
+        return {"id": thing_id}
+
+    labels = {"method": "GET", "route": "/things/{thing_id}", "status_code": "200"}
+    requests_before = metrics.http_requests_total.value(**labels)
+
+    response = TestClient(app).get("/things/1")
+
+    assert response.status_code == 200
+    assert metrics.http_requests_total.value(**labels) == requests_before + 1
+    assert metrics.http_request_duration_seconds.count(**labels) >= 1
+    assert metrics.http_requests_in_progress.value(method="GET") == 0
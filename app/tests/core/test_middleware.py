@@ -0,0 +1,106 @@
+import io
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core import metrics, middleware
+from app.core.middleware import (
+    LoggingMiddleware,
+    MetricsMiddleware,
+    UNMATCHED_ROUTE,
+    start_request_logging,
+    stop_request_logging,
+)
+
+
+def _create_app(sample_rate: float = 1.0) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(LoggingMiddleware, sample_rate=sample_rate)
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    def get_item(item_id: int):
+        return {"id": item_id}
+
+    return app
+
+
+def test_logging_middleware__request_handled__route_template_logged(mocker):
+    mocked_logger = mocker.patch("app.core.middleware.logger")
+    client = TestClient(_create_app(sample_rate=1.0))
+
+    response = client.get("/items/42")
+
+    assert response.status_code == 200
+    mocked_logger.info.assert_called_once()
+    extra = mocked_logger.info.call_args.kwargs["extra"]
+    assert extra["method"] == "GET"
+    assert extra["route"] == "/items/{item_id}"
+    assert extra["status_code"] == 200
+    assert extra["duration_ms"] >= 0
+
+
+def test_logging_middleware__route_not_found__raw_path_logged(mocker):
+    mocked_logger = mocker.patch("app.core.middleware.logger")
+    client = TestClient(_create_app(sample_rate=1.0))
+
+    response = client.get("/missing")
+
+    assert response.status_code == 404
+    extra = mocked_logger.info.call_args.kwargs["extra"]
+    assert extra["route"] == "/missing"
+    assert extra["status_code"] == 404
+
+
+def test_logging_middleware__request_not_sampled__nothing_logged(mocker):
+    mocked_logger = mocker.patch("app.core.middleware.logger")
+    client = TestClient(_create_app(sample_rate=0.0))
+
+    response = client.get("/items/42")
+
+    assert response.status_code == 200
+    mocked_logger.info.assert_not_called()
+
+
+def test_metrics_middleware__routes_not_found__one_unmatched_series():
+    client = TestClient(_create_app())
+    before = metrics.http_requests_total.value(
+        method="GET", route=UNMATCHED_ROUTE, status_code=404
+    )
+
+    for path in ("/nope/0", "/nope/1", "/nope/2"):
+        client.get(path)
+
+    assert (
+        metrics.http_requests_total.value(
+            method="GET", route=UNMATCHED_ROUTE, status_code=404
+        )
+        == before + 3
+    )
+    assert 'route="/nope/0"' not in metrics.registry.render()
+
+
+def test_request_logging__listener_not_started__written_without_queueing(mocker):
+    stream = mocker.patch.object(middleware._stream_handler, "stream", io.StringIO())
+
+    middleware.logger.info("not queued")
+
+    assert "not queued" in stream.getvalue()
+    assert middleware._log_queue.empty()
+
+
+def test_request_logging__listener_stopped__queued_records_written(mocker):
+    stream = mocker.patch.object(middleware._stream_handler, "stream", io.StringIO())
+
+    start_request_logging()
+    try:
+        middleware.logger.info("queued")
+    finally:
+        stop_request_logging()
+    middleware.logger.info("after stop")
+
+    assert stream.getvalue().splitlines() == [
+        "INFO:app.core.middleware:queued",
+        "INFO:app.core.middleware:after stop",
+    ]
+    assert middleware._log_queue.empty()
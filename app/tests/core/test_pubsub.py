@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from app.core.pubsub import (
+    LocalPubSubBackend,
+    MessageHub,
+    RedisPubSubBackend,
+    SubscriptionOverflow,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeRedis:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, data):
+        self.published.append((channel, data))
+
+
+async def test_message_hub__item_published__delivered_to_topic_subscribers():
+    hub = MessageHub(backend=LocalPubSubBackend(), queue_size=10)
+    subscription = hub.subscribe("user-1")
+    other_subscription = hub.subscribe("user-2")
+
+    hub.publish("user-1", {"id": 1})
+
+    assert await subscription.get(timeout=1) == {"id": 1}
+    assert await other_subscription.get(timeout=0.01) is None
+
+
+async def test_message_hub__subscription_closed__listeners_removed():
+    hub = MessageHub(backend=LocalPubSubBackend(), queue_size=10)
+    subscription = hub.subscribe("user-1")
+    assert hub.has_listeners("user-1")
+
+    subscription.close()
+
+    assert not hub.has_listeners("user-1")
+    assert hub.subscriber_count() == 0
+
+
+async def test_message_hub__queue_full__subscriber_drained_then_dropped():
+    hub = MessageHub(backend=LocalPubSubBackend(), queue_size=2)
+    subscription = hub.subscribe("user-1")
+
+    for item in range(3):
+        hub.publish("user-1", {"id": item})
+
+    assert await subscription.get(timeout=1) == {"id": 0}
+    assert await subscription.get(timeout=1) == {"id": 1}
+    with pytest.raises(SubscriptionOverflow):
+        await subscription.get(timeout=1)
+    assert hub.subscriber_count() == 0
+    assert hub.overflows == 1
+
+
+async def test_redis_pubsub_backend__item_published__sent_and_received_over_redis():
+    client = FakeRedis()
+    hub = MessageHub(
+        backend=RedisPubSubBackend(client=client, prefix="messages:"), queue_size=10
+    )
+    subscription = hub.subscribe("user-1")
+
+    hub.publish("user-1", {"id": 1})
+    channel, data = client.published[0]
+    hub.backend._on_message({"channel": channel.encode(), "data": data.encode()})
+
+    assert (channel, json.loads(data)) == ("messages:user-1", {"id": 1})
+    assert await subscription.get(timeout=1) == {"id": 1}
+    assert hub.has_listeners("user-2")
@@ -0,0 +1,134 @@
+import pytest
+
+from app.core.rate_limit import (
+    InMemoryRateLimitBackend,
+    RateLimit,
+    RateLimiter,
+    RedisRateLimitBackend,
+    create_rate_limiter,
+    parse_rate_limits,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeRedisScript:
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        self.calls = []
+
+    async def __call__(self, keys, args):
+        self.calls.append((keys, args))
+        return self.retry_after
+
+
+class FakeRedis:
+    def __init__(self, script):
+        self.script = script
+
+    def register_script(self, source):
+        return self.script
+
+
+def test_parse_rate_limits__spec__limits_parsed():
+    limits = parse_rate_limits(
+        "POST /api/users/{user_id}/messages/=10/s:20@user; GET /api/users/=600/m;"
+    )
+
+    assert limits == [
+        RateLimit("POST", "/api/users/{user_id}/messages/", 10.0, 20, per_user=True),
+        RateLimit("GET", "/api/users/", 10.0, 600),
+    ]
+
+
+def test_parse_rate_limits__invalid_spec__value_error():
+    with pytest.raises(ValueError):
+        parse_rate_limits("POST /api/users/=10 per second")
+
+
+async def test_in_memory_backend__burst_used__retry_after_until_refilled(mocker):
+    monotonic = mocker.patch("app.core.rate_limit.time.monotonic", return_value=100.0)
+    backend = InMemoryRateLimitBackend(max_buckets=10)
+
+    allowed = [await backend.acquire([("key", 2, 3)]) for _ in range(3)]
+    rejected = await backend.acquire([("key", 2, 3)])
+    monotonic.return_value = 100.5
+    refilled = await backend.acquire([("key", 2, 3)])
+
+    assert allowed == [0.0, 0.0, 0.0]
+    assert rejected == 0.5
+    assert refilled == 0.0
+
+
+async def test_in_memory_backend__too_many_buckets__least_recent_evicted():
+    backend = InMemoryRateLimitBackend(max_buckets=2)
+
+    for key in ("a", "b", "a", "c"):
+        await backend.acquire([(key, 1, 1)])
+
+    # "b" was evicted and starts over with a full bucket
+    assert await backend.acquire([("b", 1, 1)]) == 0.0
+    assert await backend.acquire([("c", 1, 1)]) > 0
+
+
+async def test_in_memory_backend__one_bucket_empty__no_token_taken_from_others(
+    mocker,
+):
+    mocker.patch("app.core.rate_limit.time.monotonic", return_value=100.0)
+    backend = InMemoryRateLimitBackend(max_buckets=10)
+    await backend.acquire([("route", 1, 1)])
+
+    rejected = await backend.acquire([("user", 1, 2), ("route", 1, 1)])
+
+    assert rejected == 1.0
+    # Both of its tokens are left
+    assert await backend.acquire([("user", 1, 2)]) == 0.0
+    assert await backend.acquire([("user", 1, 2)]) == 0.0
+
+
+async def test_rate_limiter__per_user_limit__one_bucket_per_user():
+    route = "/api/users/{user_id}/messages/"
+    limiter = RateLimiter(
+        InMemoryRateLimitBackend(max_buckets=10),
+        [RateLimit("POST", route, rate=1, burst=1, per_user=True)],
+    )
+
+    first = await limiter.check("POST", route, "user-1")
+    second = await limiter.check("POST", route, "user-1")
+    other_user = await limiter.check("POST", route, "user-2")
+    other_method = await limiter.check("GET", route, "user-1")
+
+    assert (first, other_user, other_method) == (0.0, 0.0, 0.0)
+    assert second > 0
+
+
+async def test_rate_limiter__limits_of_one_route__separate_buckets():
+    route = "/api/users/"
+    limiter = RateLimiter(
+        InMemoryRateLimitBackend(max_buckets=10),
+        [
+            RateLimit("POST", route, rate=10, burst=2),
+            RateLimit("POST", route, rate=1 / 60, burst=3),
+        ],
+    )
+
+    results = [await limiter.check("POST", route, None) for _ in range(3)]
+
+    # Limited by the burst of the first limit, not by a bucket they share
+    assert results[:2] == [0.0, 0.0]
+    assert results[2] > 0
+
+
+async def test_redis_backend__script_result__retry_after_returned():
+    script = FakeRedisScript(b"0.25")
+    backend = RedisRateLimitBackend(client=FakeRedis(script), prefix="rl:")
+
+    retry_after = await backend.acquire([("a", 2, 5), ("b", 0.5, 1)])
+
+    assert retry_after == 0.25
+    assert script.calls == [(["rl:a", "rl:b"], [2, 5, 0.5, 1])]
+
+
+def test_create_rate_limiter__unknown_backend__value_error():
+    with pytest.raises(ValueError):
+        create_rate_limiter(backend="memcached", limits=[], max_buckets=10)
@@ -0,0 +1,68 @@
+import pytest
+
+from app.core.read_routing import ReadRouter
+
+
+def test_route__round_robin__replicas_taken_in_turn():
+    router = ReadRouter(["a", "b"], policy="round_robin")
+    chosen = []
+
+    for _ in range(4):
+        with router.route(None) as replica:
+            chosen.append(replica)
+
+    assert chosen == ["a", "b", "a", "b"]
+
+
+def test_route__least_load__replica_with_fewest_reads_chosen():
+    router = ReadRouter(["a", "b", "c"], policy="least_load")
+
+    with router.route(None) as first, router.route(None) as second:
+        with router.route(None) as third:
+            pass
+        with router.route(None) as fourth:
+            pass
+
+    assert {first, second} == {"a", "b"}
+    assert third == fourth == "c"
+
+
+def test_route__no_replicas__primary_used():
+    router = ReadRouter([], sticky_seconds=1)
+    router.record_write("user")
+
+    with router.route("user") as replica:
+        assert replica is None
+
+
+def test_route__recently_written_key__primary_used_until_window_ends(mocker):
+    now = mocker.patch("app.core.read_routing.time.monotonic", return_value=100.0)
+    router = ReadRouter(["a"], sticky_seconds=2)
+    router.record_write("user")
+
+    with router.route("user") as sticky, router.route("other") as other:
+        pass
+    now.return_value = 102.0
+    with router.route("user") as expired:
+        pass
+
+    assert sticky is None
+    assert other == "a"
+    assert expired == "a"
+
+
+def test_record_write__max_sticky_keys__oldest_forgotten():
+    router = ReadRouter(["a"], sticky_seconds=60, max_sticky_keys=1)
+    router.record_write("first")
+    router.record_write("second")
+
+    with router.route("first") as first, router.route("second") as second:
+        pass
+
+    assert first == "a"
+    assert second is None
+
+
+def test_read_router__unknown_policy__raises():
+    with pytest.raises(ValueError):
+        ReadRouter(["a"], policy="random")
@@ -0,0 +1,43 @@
+import json
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+from app.core import responses
+from app.core.responses import ORJSONResponse, RowSerializer
+from app.models.message import MessageRow
+
+MESSAGE = {
+    "id": uuid.UUID("131637b2-dc9a-4907-87b6-5c65eb9e9013"),
+    "sender_id": uuid.UUID("b6f37031-672d-4770-b6e8-ca34fad01968"),
+    "content": "Message 1",
+    "timestamp": datetime(2021, 8, 1, 12, 30, 15, 250),
+}
+MESSAGE_JSON = {
+    "id": "131637b2-dc9a-4907-87b6-5c65eb9e9013",
+    "sender_id": "b6f37031-672d-4770-b6e8-ca34fad01968",
+    "content": "Message 1",
+    "timestamp": "2021-08-01T12:30:15.000250",
+}
+
+
+def test_orjson_response__uuids_and_datetimes__rendered_as_strings():
+    response = ORJSONResponse({"data": [MESSAGE]})
+
+    assert json.loads(response.body) == {"data": [MESSAGE_JSON]}
+
+
+def test_orjson_response__orjson_missing__rendered_by_pydantic(mocker):
+    mocker.patch.object(responses, "orjson", None)
+
+    response = ORJSONResponse({"data": [MESSAGE]})
+
+    assert json.loads(response.body) == {"data": [MESSAGE_JSON]}
+
+
+def test_row_serializer__rows__validated_into_dicts():
+    serialize = RowSerializer(MessageRow)
+
+    items = serialize([SimpleNamespace(_mapping=MESSAGE)])
+
+    assert items == [MESSAGE]
@@ -0,0 +1,166 @@
+import pytest
+from sqlmodel import select
+
+from app.models import Message
+from app.models.message import MessageCreate
+from app.models.user import UserCreate
+from app.services.async_message_service import (
+    create_message_for_user,
+    create_messages_for_user,
+    get_user_messages,
+    iter_user_messages,
+    get_message_for_user,
+    delete_message_for_user,
+    delete_messages_for_user,
+    get_message_changes,
+)
+from app.models.message_change import ChangeOperation
+from app.services.async_user_service import create_user
+from app.services.exceptions import NotFoundError
+from app.tests.utils import generate_random_email, generate_random_name, generate_uuid
+import app.core.resources as res
+
+pytestmark = pytest.mark.anyio
+
+
+async def _create_user(session):
+    return await create_user(
+        session=session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+
+
+async def test_create_message_for_user__message_created__message_returned(
+    async_session,
+):
+    user = await _create_user(async_session)
+
+    message = await create_message_for_user(
+        session=async_session,
+        user_id=user.id,
+        message_in=MessageCreate(content="Test message"),
+    )
+
+    assert message.content == "Test message"
+    assert message.sender_id == user.id
+    assert message.timestamp is not None
+
+
+async def test_create_message_for_user__user_not_found__not_found_error_raised(
+    async_session,
+):
+    with pytest.raises(NotFoundError) as err:
+        await create_message_for_user(
+            session=async_session,
+            user_id=generate_uuid(),
+            message_in=MessageCreate(content="Test message"),
+        )
+
+    assert err.value.message == res.USER_NOT_FOUND
+
+
+async def test_get_user_messages__more_than_limit__pages_walked_with_cursors(
+    async_session,
+):
+    user = await _create_user(async_session)
+    messages = [
+        await create_message_for_user(
+            session=async_session,
+            user_id=user.id,
+            message_in=MessageCreate(content=f"Test Message {i}"),
+        )
+        for i in range(3)
+    ]
+
+    first_page = await get_user_messages(
+        session=async_session, user_id=user.id, limit=2
+    )
+    second_page = await get_user_messages(
+        session=async_session, user_id=user.id, limit=2, after=first_page.next_cursor
+    )
+
+    assert [m.id for m in first_page.items] == [m.id for m in messages[:2]]
+    assert [m.id for m in second_page.items] == [messages[2].id]
+    assert second_page.next_cursor is None
+
+
+async def test_iter_user_messages__messages_found__all_returned_in_batches(
+    async_session,
+):
+    user = await _create_user(async_session)
+    messages = await create_messages_for_user(
+        session=async_session,
+        user_id=user.id,
+        messages_in=[MessageCreate(content=content) for content in "abc"],
+    )
+
+    batches = [
+        batch
+        async for batch in iter_user_messages(
+            session=async_session, user_id=user.id, batch_size=2
+        )
+    ]
+
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert [row.id for batch in batches for row in batch] == [m.id for m in messages]
+
+
+async def test_delete_message_for_user__message_deleted__no_return(async_session):
+    user = await _create_user(async_session)
+    message = await create_message_for_user(
+        session=async_session,
+        user_id=user.id,
+        message_in=MessageCreate(content="Test message"),
+    )
+
+    await delete_message_for_user(
+        session=async_session, user_id=user.id, message_id=message.id
+    )
+
+    with pytest.raises(NotFoundError) as err:
+        await get_message_for_user(
+            session=async_session, user_id=user.id, message_id=message.id
+        )
+
+    assert err.value.message == res.MESSAGE_NOT_FOUND
+
+
+async def test_delete_messages_for_user__ids_given__messages_deleted(async_session):
+    user = await _create_user(async_session)
+    messages = await create_messages_for_user(
+        session=async_session,
+        user_id=user.id,
+        messages_in=[MessageCreate(content=content) for content in "abc"],
+    )
+
+    deleted = await delete_messages_for_user(
+        session=async_session,
+        user_id=user.id,
+        message_ids=[messages[0].id, messages[1].id],
+        chunk_size=1,
+    )
+
+    assert deleted == 2
+    remaining = (await async_session.exec(select(Message.id))).all()
+    assert remaining == [messages[2].id]
+
+
+async def test_get_message_changes__message_created_and_deleted__changes_returned(
+    async_session,
+):
+    user = await _create_user(async_session)
+    message = await create_message_for_user(
+        session=async_session, user_id=user.id, message_in=MessageCreate(content="Hi")
+    )
+    watermark = await get_message_changes(session=async_session, user_id=user.id)
+    await delete_message_for_user(
+        session=async_session, user_id=user.id, message_id=message.id
+    )
+
+    page = await get_message_changes(
+        session=async_session, user_id=user.id, since=watermark.next_since
+    )
+
+    assert [(change.op, change.message_id) for change, _ in page.items] == [
+        (ChangeOperation.DELETE, message.id)
+    ]
@@ -0,0 +1,177 @@
+import pytest
+from sqlmodel import select
+
+from app.models import Message
+from app.models.message import MessageCreate
+from app.models.user import UserCreate, UserUpdate
+from app.services.async_message_service import create_message_for_user
+from app.services.async_user_service import (
+    get_users,
+    estimate_user_count,
+    create_user,
+    create_users,
+    get_user_by_email,
+    get_user_by_id,
+    update_user,
+    delete_user,
+    get_user_version_by_email,
+    get_user_version_by_id,
+)
+from app.services import user_service
+from app.services.exceptions import AlreadyExistsError, NotFoundError
+from app.tests.utils import generate_random_name, generate_random_email, generate_uuid
+import app.core.resources as res
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_create_user__user_created__user_returned(async_session):
+    user_in = UserCreate(email=generate_random_email(), name=generate_random_name())
+
+    user = await create_user(session=async_session, user_in=user_in)
+
+    assert user.email == user_in.email
+    assert user.name == user_in.name
+    assert user.id is not None
+
+
+async def test_create_users__email_taken_after_check__conflict_reported_per_item(
+    async_session, mocker
+):
+    taken_email = generate_random_email()
+    await create_user(
+        session=async_session,
+        user_in=UserCreate(email=taken_email, name=generate_random_name()),
+    )
+    existing_emails_queries = user_service._existing_emails_queries
+    checks = []
+
+    def check_before_email_taken(users_in):
+        # The first check runs before another request takes the email
+        checks.append(users_in)
+        return existing_emails_queries(users_in) if len(checks) > 1 else iter(())
+
+    mocker.patch.object(
+        user_service, "_existing_emails_queries", check_before_email_taken
+    )
+    new_email = generate_random_email()
+
+    items = await create_users(
+        session=async_session,
+        users_in=[
+            UserCreate(email=taken_email, name=generate_random_name()),
+            UserCreate(email=new_email, name=generate_random_name()),
+        ],
+    )
+
+    assert len(checks) == 2
+    assert items[0].error == res.EMAIL_ALREADY_EXISTS
+    assert items[1].user.email == new_email
+
+
+async def test_create_user__email_exists__already_exists_error_raised(async_session):
+    user_in = UserCreate(email=generate_random_email(), name=generate_random_name())
+    await create_user(session=async_session, user_in=user_in)
+
+    with pytest.raises(AlreadyExistsError) as err:
+        await create_user(session=async_session, user_in=user_in)
+
+    assert err.value.message == res.EMAIL_ALREADY_EXISTS
+
+
+async def test_get_users__users_found__limited_users_returned(async_session):
+    for _ in range(3):
+        await create_user(
+            session=async_session,
+            user_in=UserCreate(
+                email=generate_random_email(), name=generate_random_name()
+            ),
+        )
+
+    page = await get_users(session=async_session, limit=2)
+    next_page = await get_users(session=async_session, limit=2, after=page.next_cursor)
+
+    assert len(page.items) == 2
+    assert len(next_page.items) == 1
+    assert next_page.next_cursor is None
+
+
+async def test_estimate_user_count__users_found__exact_count_returned(async_session):
+    await create_user(
+        session=async_session,
+        user_in=UserCreate(email="kim@test.com", name=generate_random_name()),
+    )
+
+    count = await estimate_user_count(session=async_session, email_prefix="ki")
+
+    assert (count.value, count.exact) == (1, True)
+
+
+async def test_get_user_by_email__user_not_found__not_found_error_raised(
+    async_session,
+):
+    with pytest.raises(NotFoundError) as err:
+        await get_user_by_email(session=async_session, email=generate_random_email())
+
+    assert err.value.message == res.USER_NOT_FOUND
+
+
+async def test_update_user__user_updated__updated_user_returned(async_session):
+    user = await create_user(
+        session=async_session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+    new_name = generate_random_name()
+
+    updated_user = await update_user(
+        session=async_session, user_id=user.id, user_in=UserUpdate(name=new_name)
+    )
+
+    assert updated_user.name == new_name
+    assert updated_user.email == user.email
+
+
+async def test_get_user_version_by_id__messages_written__version_bumped(
+    async_session,
+):
+    user = await create_user(
+        session=async_session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+    await update_user(
+        session=async_session, user_id=user.id, user_in=UserUpdate(name="New")
+    )
+    await create_message_for_user(
+        session=async_session, user_id=user.id, message_in=MessageCreate(content="Hi")
+    )
+
+    version = await get_user_version_by_id(session=async_session, user_id=user.id)
+    by_email = await get_user_version_by_email(session=async_session, email=user.email)
+
+    assert version.version == 2
+    assert tuple(by_email) == tuple(version)
+
+
+async def test_delete_user__user_deleted__user_and_messages_deleted(async_session):
+    user = await create_user(
+        session=async_session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+    await create_message_for_user(
+        session=async_session,
+        user_id=user.id,
+        message_in=MessageCreate(content="Test message"),
+    )
+
+    await delete_user(session=async_session, user_id=user.id)
+
+    with pytest.raises(NotFoundError):
+        await get_user_by_id(session=async_session, user_id=user.id)
+    assert (await async_session.exec(select(Message))).all() == []
+
+
+async def test_delete_user__user_not_found__not_found_error_raised(async_session):
+    with pytest.raises(NotFoundError) as err:
+        await delete_user(session=async_session, user_id=generate_uuid())
+
+    assert err.value.message == res.USER_NOT_FOUND
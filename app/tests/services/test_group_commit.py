@@ -0,0 +1,175 @@
+import pytest
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import SQLModel, Session, create_engine, select
+
+from app.database import set_sqlite_pragmas
+from app.models import Message, User
+from app.models.message import MessageCreate
+from app.models.user import UserCreate
+from app.services import async_user_service
+from app.services.exceptions import AlreadyExistsError
+from app.services.group_commit import WriteCoalescer, run_write, run_write_async
+from app.models.user import UserUpdate
+from app.services.message_service import (
+    create_message_for_user,
+    create_messages_for_user,
+    delete_messages_for_user,
+)
+from app.services.user_service import (
+    create_users,
+    delete_user,
+    get_user_version_by_id,
+    insert_user,
+    update_user,
+)
+from app.tests.utils import generate_random_email, generate_random_name
+
+
+@pytest.fixture
+def engine(tmp_path):
+    # A file, not StaticPool: the writer thread needs a connection of its own
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False}
+    )
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def coalescer(engine):
+    coalescer = WriteCoalescer(engine, max_batch_size=3, max_delay=0.1)
+    yield coalescer
+    coalescer.stop()
+
+
+def _user_in(email=None):
+    return UserCreate(
+        email=email or generate_random_email(), name=generate_random_name()
+    )
+
+
+def test_submit__concurrent_writes__committed_in_one_transaction(engine, coalescer):
+    futures = [coalescer.submit(insert_user, user_in=_user_in()) for _ in range(3)]
+
+    users = [future.result() for future in futures]
+
+    assert coalescer.stats.batches == 1
+    assert coalescer.stats.writes == 3
+    with Session(engine) as session:
+        assert set(session.exec(select(User.id)).all()) == {user.id for user in users}
+
+
+def test_submit__one_write_fails__others_committed(engine, coalescer):
+    email = generate_random_email()
+    futures = [
+        coalescer.submit(insert_user, user_in=_user_in(email)),
+        coalescer.submit(insert_user, user_in=_user_in(email)),
+        coalescer.submit(insert_user, user_in=_user_in()),
+    ]
+
+    assert futures[0].result().email == email
+    with pytest.raises(AlreadyExistsError):
+        futures[1].result()
+    futures[2].result()
+    assert coalescer.stats.batches == 1
+    with Session(engine) as session:
+        assert len(session.exec(select(User)).all()) == 2
+
+
+def test_run__result__detached_with_attributes_loaded(coalescer):
+    user_in = _user_in()
+
+    user = coalescer.run(insert_user, user_in=user_in)
+
+    assert inspect(user).detached
+    assert user.email == user_in.email
+
+
+def test_create_message_for_user__coalescing_enabled__written_by_writer(
+    mocker, engine, coalescer
+):
+    mocker.patch("app.services.group_commit.write_coalescer", coalescer)
+    user = coalescer.run(insert_user, user_in=_user_in())
+
+    with Session(engine) as session:
+        message = create_message_for_user(
+            session=session, user_id=user.id, message_in=MessageCreate(content="hi")
+        )
+
+        assert session.get(Message, message.id).content == "hi"
+        assert get_user_version_by_id(session, user.id).version == 1
+    assert coalescer.stats.writes == 2
+
+
+def test_user_and_bulk_writes__coalescing_enabled__written_by_writer(
+    mocker, engine, coalescer
+):
+    mocker.patch("app.services.group_commit.write_coalescer", coalescer)
+
+    with Session(engine) as session:
+        items = create_users(session=session, users_in=[_user_in(), _user_in()])
+        user_id, other_user_id = (item.user.id for item in items)
+        create_messages_for_user(
+            session=session,
+            user_id=user_id,
+            messages_in=[MessageCreate(content="a"), MessageCreate(content="b")],
+        )
+        deleted = delete_messages_for_user(
+            session=session,
+            user_id=user_id,
+            message_ids=list(session.exec(select(Message.id)).all()),
+        )
+        updated = update_user(
+            session=session, user_id=user_id, user_in=UserUpdate(name="Renamed")
+        )
+        delete_user(session=session, user_id=other_user_id)
+
+        assert deleted == 2
+        assert updated.name == "Renamed"
+        assert session.exec(select(User.id)).all() == [user_id]
+    assert coalescer.stats.writes == 5
+
+
+@pytest.mark.anyio
+async def test_async_create_user__coalescing_enabled__written_by_writer(
+    mocker, engine, coalescer
+):
+    mocker.patch("app.services.group_commit.write_coalescer", coalescer)
+    session = mocker.AsyncMock(info={})
+    user_in = _user_in()
+
+    user = await async_user_service.create_user(session=session, user_in=user_in)
+
+    assert user.email == user_in.email
+    session.commit.assert_not_called()
+    with Session(engine) as sync_session:
+        assert sync_session.get(User, user.id) is not None
+
+
+def _add_user(session, email):
+    # Unlike insert_user, nothing is written before the commit's flush
+    session.add(User.model_validate(_user_in(email)))
+
+
+def test_run_write__commit_fails__rolled_back(session):
+    email = generate_random_email()
+    run_write(session, _add_user, email=email)
+
+    with pytest.raises(IntegrityError):
+        run_write(session, _add_user, email=email)
+
+    assert len(session.exec(select(User)).all()) == 1
+
+
+@pytest.mark.anyio
+async def test_run_write_async__commit_fails__rolled_back(async_session):
+    email = generate_random_email()
+    await run_write_async(async_session, _add_user, email=email)
+
+    with pytest.raises(IntegrityError):
+        await run_write_async(async_session, _add_user, email=email)
+
+    assert len((await async_session.exec(select(User))).all()) == 1
@@ -0,0 +1,237 @@
+import io
+import json
+import uuid
+
+from sqlmodel import select
+
+from app.models import Message, User
+from app.services import import_service
+from app.services.import_service import (
+    ImportCheckpoint,
+    import_records,
+    read_records,
+    validate_records,
+)
+import app.core.resources as res
+
+
+def _ndjson(*records) -> io.StringIO:
+    return io.StringIO("".join(json.dumps(record) + "\n" for record in records))
+
+
+def test_read_records__csv_with_header__numbered_rows_after_skip():
+    stream = io.StringIO("name,email\nJo,jo@test.com\nJan,jan@test.com\n")
+
+    records = list(read_records(stream, "csv", skip=1))
+
+    assert records == [(2, {"name": "Jan", "email": "jan@test.com"})]
+
+
+def test_validate_records__valid_and_invalid__rows_and_errors_returned():
+    records = [
+        (1, json.dumps({"name": "Jo", "email": "jo@test.com"})),
+        (2, json.dumps({"name": "Jan"})),
+        (3, "not json"),
+    ]
+
+    import_id = uuid.uuid4()
+
+    rows, errors = validate_records("users", import_id, records)
+    rows_again, _ = validate_records("users", import_id, records)
+    rows_of_other_import, _ = validate_records("users", uuid.uuid4(), records)
+
+    assert [(number, row["email"]) for number, row in rows] == [(1, "jo@test.com")]
+    # Generated ids are stable within an import, so resuming skips what is
+    # already there, and differ between imports
+    assert rows[0][1]["id"] == rows_again[0][1]["id"]
+    assert rows[0][1]["id"] != rows_of_other_import[0][1]["id"]
+    assert [number for number, _ in errors] == [2, 3]
+    assert errors[0][1] == "email: Field required"
+
+
+def test_import_records__users__inserted_in_commits_with_checkpoints(session, tmp_path):
+    checkpoint = ImportCheckpoint(tmp_path / "users.checkpoint", "users", "users")
+    stream = _ndjson(*({"name": f"U{i}", "email": f"u{i}@test.com"} for i in range(5)))
+    saves = []
+    original_save = checkpoint.save
+    checkpoint.save = lambda records, skipped=0, done=False: saves.append(
+        (records, done)
+    ) or original_save(records, skipped, done)
+
+    result = import_records(
+        session=session,
+        kind="users",
+        import_id=checkpoint.import_id,
+        records=read_records(stream, "ndjson"),
+        checkpoint=checkpoint,
+        chunk_size=1,
+        commit_size=2,
+    )
+
+    assert result.imported == 5
+    assert len(session.exec(select(User)).all()) == 5
+    assert saves == [(2, False), (4, False), (5, True)]
+    # Finished: running the import again starts a new one
+    assert not checkpoint.resumable()
+    resumed_checkpoint = ImportCheckpoint(checkpoint.path, "users", "users")
+    assert resumed_checkpoint.load() == 5
+    assert resumed_checkpoint.import_id == checkpoint.import_id
+
+
+def test_import_records__resumed__committed_records_skipped(session, tmp_path):
+    records = [{"name": f"U{i}", "email": f"u{i}@test.com"} for i in range(3)]
+    import_id = uuid.uuid4()
+    import_records(
+        session=session,
+        kind="users",
+        import_id=import_id,
+        records=read_records(_ndjson(*records[:2]), "ndjson"),
+    )
+
+    # An interrupted run committed two records but not its checkpoint
+    result = import_records(
+        session=session,
+        kind="users",
+        import_id=import_id,
+        records=read_records(_ndjson(*records), "ndjson"),
+        resumed=True,
+    )
+
+    assert (result.imported, result.skipped) == (1, 2)
+
+
+def test_import_records__resumed_with_taken_ids__skips_reported_and_checkpointed(
+    session, tmp_path
+):
+    records = [
+        {"id": str(uuid.uuid4()), "name": f"U{i}", "email": f"u{i}@test.com"}
+        for i in range(3)
+    ]
+    checkpoint = ImportCheckpoint(tmp_path / "users.checkpoint", "users", "users")
+    import_records(
+        session=session,
+        kind="users",
+        import_id=checkpoint.import_id,
+        records=read_records(_ndjson(*records[:2]), "ndjson"),
+    )
+    checkpoint.save(0, skipped=1)
+    skipped = []
+
+    result = import_records(
+        session=session,
+        kind="users",
+        import_id=checkpoint.import_id,
+        records=read_records(_ndjson(*records), "ndjson"),
+        checkpoint=checkpoint,
+        resumed=True,
+        on_skip=lambda number, error: skipped.append((number, error)),
+    )
+
+    assert (result.imported, result.skipped) == (1, 2)
+    assert skipped == [(1, res.ID_ALREADY_IMPORTED), (2, res.ID_ALREADY_IMPORTED)]
+    resumed_checkpoint = ImportCheckpoint(checkpoint.path, "users", "users")
+    resumed_checkpoint.load()
+    assert resumed_checkpoint.skipped == 3
+
+
+def test_import_records__new_import_of_same_source__records_imported(session):
+    for emails in (["a@test.com", "b@test.com"], ["c@test.com", "d@test.com"]):
+        result = import_records(
+            session=session,
+            kind="users",
+            import_id=uuid.uuid4(),
+            records=read_records(
+                _ndjson(*({"name": "U", "email": email} for email in emails)),
+                "ndjson",
+            ),
+        )
+
+        assert (result.imported, result.skipped) == (2, 0)
+    assert len(session.exec(select(User)).all()) == 4
+
+
+def test_import_records__taken_id_not_resumed__record_rejected(session):
+    user_id = str(uuid.uuid4())
+    rejected = []
+
+    results = [
+        import_records(
+            session=session,
+            kind="users",
+            import_id=uuid.uuid4(),
+            records=read_records(
+                _ndjson({"id": user_id, "name": "U", "email": email}), "ndjson"
+            ),
+            on_reject=lambda number, error: rejected.append((number, error)),
+        )
+        for email in ("a@test.com", "b@test.com")
+    ]
+
+    assert [(result.imported, result.rejected) for result in results] == [
+        (1, 0),
+        (0, 1),
+    ]
+    assert rejected == [(1, res.ID_ALREADY_EXISTS)]
+
+
+def test_import_records__more_rows_than_lookup_chunk__all_imported(session, mocker):
+    mocker.patch.object(import_service, "LOOKUP_CHUNK_SIZE", 2)
+    statements = []
+    original_exec = session.exec
+    mocker.patch.object(
+        session,
+        "exec",
+        side_effect=lambda statement, **kwargs: statements.append(statement)
+        or original_exec(statement, **kwargs),
+    )
+
+    result = import_records(
+        session=session,
+        kind="users",
+        import_id=uuid.uuid4(),
+        records=read_records(
+            _ndjson(*({"name": "U", "email": f"u{i}@test.com"} for i in range(5))),
+            "ndjson",
+        ),
+    )
+
+    assert result.imported == 5
+    # Ids and emails, three IN lists each
+    assert sum(1 for statement in statements if statement.is_select) == 6
+
+
+def test_import_records__conflicts_and_unknown_senders__records_rejected(session):
+    rejected = []
+    import_records(
+        session=session,
+        kind="users",
+        import_id=uuid.uuid4(),
+        records=read_records(
+            _ndjson(
+                {"name": "Jo", "email": "jo@test.com"},
+                {"name": "Jo again", "email": "jo@test.com"},
+            ),
+            "ndjson",
+        ),
+        on_reject=lambda number, error: rejected.append((number, error)),
+    )
+    user_id = session.exec(select(User.id)).one()
+
+    result = import_records(
+        session=session,
+        kind="messages",
+        import_id=uuid.uuid4(),
+        records=read_records(
+            _ndjson(
+                {"sender_id": str(user_id), "content": "Hi"},
+                {"sender_id": "b6f37031-672d-4770-b6e8-ca34fad01968", "content": "?"},
+            ),
+            "ndjson",
+        ),
+        workers=1,
+        on_reject=lambda number, error: rejected.append((number, error)),
+    )
+
+    assert result.imported == 1
+    assert session.exec(select(Message.content)).all() == ["Hi"]
+    assert rejected == [(2, res.EMAIL_DUPLICATED_IN_BATCH), (2, res.USER_NOT_FOUND)]
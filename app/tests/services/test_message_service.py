@@ -1,14 +1,33 @@
-from app.services.exceptions import NotFoundError
+from datetime import datetime, timedelta, timezone
+
+from sqlmodel import delete, select
+
+from app.core.pubsub import message_hub
+from app.services.exceptions import NotFoundError, BadRequestError, GoneError
 from app.models.message import MessageCreate
 from app.models.user import UserCreate
 from app.services.message_service import (
     create_message_for_user,
+    create_messages_for_user,
     get_user_messages,
+    iter_user_messages,
+    search_user_messages,
     get_message_for_user,
     delete_message_for_user,
+    delete_messages_for_user,
+    get_message_changes,
+    compact_message_changes,
     _get_message,
 )
-from app.services.user_service import create_user
+from app.models import Message, MessageChange, User
+from app.models.message_change import ChangeOperation
+from app.core.cache import user_cache
+from app.services.user_service import (
+    create_user,
+    get_user_by_id,
+    get_user_version_by_id,
+)
+from app.models.message_search import rebuild_search_index
 from app.tests.utils import generate_random_email, generate_random_name, generate_uuid
 import pytest
 import app.core.resources as res
@@ -33,6 +52,43 @@ def test_create_message_for_user__message_created__message_returned(session):
     assert message.timestamp is not None
 
 
+def test_create_message_for_user__stream_open__message_published(session, mocker):
+    message_hub = mocker.patch("app.services.message_service.message_hub")
+    message_hub.has_listeners.return_value = True
+    user = create_user(
+        session=session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+
+    message = create_message_for_user(
+        session=session, user_id=user.id, message_in=MessageCreate(content="Hi")
+    )
+
+    message_hub.publish.assert_called_once_with(
+        str(user.id),
+        {
+            "id": str(message.id),
+            "sender_id": str(user.id),
+            "content": "Hi",
+            "timestamp": message.timestamp.isoformat(),
+        },
+    )
+
+
+def test_create_messages_for_user__no_stream_open__nothing_published(session, mocker):
+    publish = mocker.spy(message_hub, "publish")
+    user = create_user(
+        session=session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+
+    create_messages_for_user(
+        session=session, user_id=user.id, messages_in=[MessageCreate(content="Hi")]
+    )
+
+    publish.assert_not_called()
+
+
 def test_create_message_for_user__user_not_found__not_found_error_raised(session):
     user_id = generate_uuid()
 
@@ -46,15 +102,59 @@ def test_create_message_for_user__user_not_found__not_found_error_raised(session
     assert err.value.message == res.USER_NOT_FOUND
 
 
+def _cache_deleted_user(session):
+    # Cached here, then deleted by another worker, which leaves the cache be
+    user = create_user(
+        session=session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+    get_user_by_id(session=session, user_id=user.id)
+    session.exec(delete(User).where(User.id == user.id))
+    session.commit()
+    session.expunge_all()
+    return user
+
+
+def test_create_message_for_user__cached_user_deleted__not_found_error_raised(
+    session,
+):
+    user = _cache_deleted_user(session)
+
+    with pytest.raises(NotFoundError) as err:
+        create_message_for_user(
+            session=session, user_id=user.id, message_in=MessageCreate(content="Hi")
+        )
+
+    assert err.value.message == res.USER_NOT_FOUND
+    assert user_cache.get(f"id:{user.id}") is None
+    assert session.exec(select(Message)).all() == []
+
+
+def test_create_messages_for_user__cached_user_deleted__not_found_error_raised(
+    session,
+):
+    user = _cache_deleted_user(session)
+
+    with pytest.raises(NotFoundError) as err:
+        create_messages_for_user(
+            session=session, user_id=user.id, messages_in=[MessageCreate(content="Hi")]
+        )
+
+    assert err.value.message == res.USER_NOT_FOUND
+    assert user_cache.get(f"id:{user.id}") is None
+
+
 def test_get_user_messages__no_messages_found__empty_list_returned(session):
     user = create_user(
         session=session,
         user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
     )
 
-    result_messages = get_user_messages(session=session, user_id=user.id)
+    result_page = get_user_messages(session=session, user_id=user.id)
 
-    assert result_messages == []
+    assert result_page.items == []
+    assert result_page.next_cursor is None
+    assert result_page.prev_cursor is None
 
 
 def test_get_user_messages__messages_found__messages_returned(session):
@@ -71,11 +171,66 @@ def test_get_user_messages__messages_found__messages_returned(session):
         for i in range(3)
     ]
 
-    result_messages = get_user_messages(session=session, user_id=user.id)
+    result_page = get_user_messages(session=session, user_id=user.id)
+
+    assert [row.id for row in result_page.items] == [m.id for m in messages]
+    assert result_page.next_cursor is None
 
-    assert len(result_messages) == 3
-    for message in messages:
-        assert message in result_messages
+
+def test_get_user_messages__more_than_limit__pages_walked_with_cursors(session):
+    user = create_user(
+        session=session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+    messages = [
+        create_message_for_user(
+            session=session,
+            user_id=user.id,
+            message_in=MessageCreate(content=f"Test Message {i}"),
+        )
+        for i in range(5)
+    ]
+
+    first_page = get_user_messages(session=session, user_id=user.id, limit=2)
+    second_page = get_user_messages(
+        session=session, user_id=user.id, limit=2, after=first_page.next_cursor
+    )
+    last_page = get_user_messages(
+        session=session, user_id=user.id, limit=2, after=second_page.next_cursor
+    )
+    previous_page = get_user_messages(
+        session=session, user_id=user.id, limit=2, before=last_page.prev_cursor
+    )
+
+    message_ids = [message.id for message in messages]
+    assert [row.id for row in first_page.items] == message_ids[0:2]
+    assert first_page.prev_cursor is None
+    assert [row.id for row in second_page.items] == message_ids[2:4]
+    assert [row.id for row in last_page.items] == message_ids[4:]
+    assert last_page.next_cursor is None
+    assert [row.id for row in previous_page.items] == message_ids[2:4]
+    assert previous_page.prev_cursor is not None
+
+
+def test_get_user_messages__invalid_cursor__bad_request_error_raised(session):
+    user = create_user(
+        session=session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+
+    with pytest.raises(BadRequestError) as err:
+        get_user_messages(session=session, user_id=user.id, after="not-a-cursor")
+
+    assert err.value.message == res.INVALID_CURSOR
+
+
+def test_get_user_messages__both_cursors__bad_request_error_raised(session):
+    with pytest.raises(BadRequestError) as err:
+        get_user_messages(
+            session=session, user_id=generate_uuid(), after="a", before="b"
+        )
+
+    assert err.value.message == res.CONFLICTING_CURSORS
 
 
 def test_get_message_for_user__message_found__message_returned(session):
@@ -167,6 +322,22 @@ def test_delete_message_for_user__message_deleted__no_return(session):
     assert err.value.message == res.MESSAGE_NOT_FOUND
 
 
+def test_delete_message_for_user__message_deleted__user_version_bumped(session):
+    user = create_user(
+        session=session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+    message = create_message_for_user(
+        session=session, user_id=user.id, message_in=MessageCreate(content="Hi")
+    )
+    delete_messages_for_user(session=session, user_id=user.id, message_ids=[])
+
+    delete_message_for_user(session=session, user_id=user.id, message_id=message.id)
+
+    # Empty deletes are not writes
+    assert get_user_version_by_id(session=session, user_id=user.id).version == 2
+
+
 def test_delete_message_for_user__user_not_found__not_found_error_raised(session):
     user_id = generate_uuid()
     message_id = generate_uuid()
@@ -188,3 +359,406 @@ def test_delete_message_for_user__message_not_found__not_found_error_raised(sess
         delete_message_for_user(session=session, user_id=user.id, message_id=message_id)
 
     assert err.value.message == res.MESSAGE_NOT_FOUND
+
+
+def test_delete_message_for_user__message_of_other_user__not_found_error_raised(
+    session,
+):
+    _, (message,) = _create_user_with_messages(session, ["Not yours"])
+    user, _ = _create_user_with_messages(session, [])
+
+    with pytest.raises(NotFoundError) as err:
+        delete_message_for_user(session=session, user_id=user.id, message_id=message.id)
+
+    assert err.value.message == res.MESSAGE_NOT_FOUND
+    assert _get_message(session=session, message_id=message.id) is not None
+
+
+def test_delete_messages_for_user__ids_given__own_messages_deleted_in_chunks(
+    session,
+):
+    user, messages = _create_user_with_messages(session, ["a", "b", "c", "d"])
+    _, (other_message,) = _create_user_with_messages(session, ["not yours"])
+    message_ids = [messages[0].id, messages[1].id, messages[2].id, other_message.id]
+
+    deleted = delete_messages_for_user(
+        session=session, user_id=user.id, message_ids=message_ids, chunk_size=2
+    )
+
+    assert deleted == 3
+    remaining = session.exec(select(Message.id)).all()
+    assert sorted(remaining) == sorted([messages[3].id, other_message.id])
+    tombstones = session.exec(
+        select(MessageChange.message_id).where(
+            MessageChange.op == ChangeOperation.DELETE
+        )
+    ).all()
+    assert sorted(tombstones) == sorted(message_ids[:3])
+
+
+def test_delete_messages_for_user__before_given__older_messages_deleted_in_chunks(
+    session,
+):
+    user, _ = _create_user_with_messages(session, [])
+    start_time = datetime(2024, 1, 1)
+    messages = [
+        Message(
+            content=str(day),
+            sender_id=user.id,
+            timestamp=start_time + timedelta(days=day),
+        )
+        for day in range(5)
+    ]
+    session.add_all(messages)
+    session.commit()
+    newest_id = messages[4].id
+
+    deleted = delete_messages_for_user(
+        session=session,
+        user_id=user.id,
+        before=start_time + timedelta(days=4),
+        chunk_size=2,
+    )
+
+    assert deleted == 4
+    assert session.exec(select(Message.id)).all() == [newest_id]
+
+
+@pytest.mark.parametrize(
+    "filters", [{}, {"message_ids": [], "before": datetime(2024, 1, 1)}]
+)
+def test_delete_messages_for_user__not_exactly_one_filter__bad_request_error_raised(
+    session, filters
+):
+    user, _ = _create_user_with_messages(session, [])
+
+    with pytest.raises(BadRequestError) as err:
+        delete_messages_for_user(session=session, user_id=user.id, **filters)
+
+    assert err.value.message == res.CONFLICTING_DELETE_FILTERS
+
+
+def test_create_messages_for_user__messages_created__ids_and_timestamps_returned(
+    session,
+):
+    user = create_user(
+        session=session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+    messages_in = [MessageCreate(content=f"Test Message {i}") for i in range(3)]
+
+    messages = create_messages_for_user(
+        session=session, user_id=user.id, messages_in=messages_in
+    )
+
+    assert [message.content for message in messages] == [
+        message_in.content for message_in in messages_in
+    ]
+    for message in messages:
+        assert message.sender_id == user.id
+        stored_message = _get_message(session=session, message_id=message.id)
+        assert stored_message.timestamp == message.timestamp
+
+
+def test_create_messages_for_user__empty_batch__empty_list_returned(session):
+    user = create_user(
+        session=session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+
+    messages = create_messages_for_user(
+        session=session, user_id=user.id, messages_in=[]
+    )
+
+    assert messages == []
+
+
+def test_create_messages_for_user__user_not_found__not_found_error_raised(session):
+    with pytest.raises(NotFoundError) as err:
+        create_messages_for_user(
+            session=session,
+            user_id=generate_uuid(),
+            messages_in=[MessageCreate(content="Test message")],
+        )
+
+    assert err.value.message == res.USER_NOT_FOUND
+
+
+def _create_user_with_messages(session, contents):
+    user = create_user(
+        session=session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+    messages = [
+        create_message_for_user(
+            session=session, user_id=user.id, message_in=MessageCreate(content=content)
+        )
+        for content in contents
+    ]
+    return user, messages
+
+
+def test_iter_user_messages__messages_found__all_returned_in_batches(session):
+    user, messages = _create_user_with_messages(session, ["a", "b", "c"])
+    _create_user_with_messages(session, ["not yours"])
+
+    batches = list(iter_user_messages(session=session, user_id=user.id, batch_size=2))
+
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert [row.id for batch in batches for row in batch] == [m.id for m in messages]
+
+
+def test_search_user_messages__terms_match__best_matches_returned_first(session):
+    user, messages = _create_user_with_messages(
+        session,
+        ["nothing relevant", "pizza tonight?", "pizza pizza pizza", "pasta maybe"],
+    )
+    _create_user_with_messages(session, ["pizza from another user"])
+
+    page = search_user_messages(session=session, user_id=user.id, q="pizza")
+
+    assert [row.id for row in page.items] == [messages[2].id, messages[1].id]
+    assert page.items[0].content == "pizza pizza pizza"
+    assert page.next_cursor is None
+
+
+def test_search_user_messages__prefix_query__prefixed_terms_matched(session):
+    user, messages = _create_user_with_messages(
+        session, ["deployment finished", "deploy now", "unrelated"]
+    )
+
+    page = search_user_messages(session=session, user_id=user.id, q="depl*")
+
+    assert sorted(message.content for message in page.items) == [
+        "deploy now",
+        "deployment finished",
+    ]
+
+
+def test_search_user_messages__more_than_limit__pages_walked_with_cursor(session):
+    user, messages = _create_user_with_messages(
+        session, [f"report number {i}" for i in range(5)]
+    )
+
+    first_page = search_user_messages(
+        session=session, user_id=user.id, q="report", limit=3
+    )
+    second_page = search_user_messages(
+        session=session,
+        user_id=user.id,
+        q="report",
+        limit=3,
+        after=first_page.next_cursor,
+    )
+
+    assert len(first_page.items) == 3
+    assert len(second_page.items) == 2
+    assert second_page.next_cursor is None
+    assert {message.id for message in first_page.items + second_page.items} == {
+        message.id for message in messages
+    }
+
+
+def test_search_user_messages__index_changed_between_pages__rest_returned_once(
+    session,
+):
+    user, messages = _create_user_with_messages(
+        session, [f"report number {i}" for i in range(5)]
+    )
+    first_page = search_user_messages(
+        session=session, user_id=user.id, q="report", limit=3
+    )
+    # Shifts the bm25 ranks of all messages, including the cursor's
+    _create_user_with_messages(session, [f"unrelated note {i}" for i in range(20)])
+
+    second_page = search_user_messages(
+        session=session,
+        user_id=user.id,
+        q="report",
+        limit=3,
+        after=first_page.next_cursor,
+    )
+
+    assert len(second_page.items) == 2
+    assert {row.id for row in first_page.items + second_page.items} == {
+        message.id for message in messages
+    }
+
+
+def test_search_user_messages__fts_syntax_in_query__taken_literally(session):
+    user, messages = _create_user_with_messages(session, ['say "hi" OR NOT'])
+
+    page = search_user_messages(session=session, user_id=user.id, q='"hi" OR')
+
+    assert [row.id for row in page.items] == [messages[0].id]
+
+
+def test_search_user_messages__message_deleted__no_longer_found(session):
+    user, messages = _create_user_with_messages(session, ["secret plan"])
+
+    delete_message_for_user(session=session, user_id=user.id, message_id=messages[0].id)
+
+    page = search_user_messages(session=session, user_id=user.id, q="secret")
+    assert page.items == []
+
+
+def test_search_user_messages__no_terms__bad_request_error_raised(session):
+    user, _ = _create_user_with_messages(session, [])
+
+    with pytest.raises(BadRequestError) as err:
+        search_user_messages(session=session, user_id=user.id, q=" * ")
+
+    assert err.value.message == res.INVALID_SEARCH_QUERY
+
+
+def test_rebuild_search_index__index_emptied__messages_searchable_again(session):
+    user, messages = _create_user_with_messages(session, ["lost and found"])
+    connection = session.connection()
+    connection.exec_driver_sql("DELETE FROM message_fts")
+
+    indexed = rebuild_search_index(connection)
+
+    page = search_user_messages(session=session, user_id=user.id, q="found")
+    assert indexed == 1
+    assert [row.id for row in page.items] == [messages[0].id]
+
+
+def _changes(page):
+    return [(change.op, change.message_id) for change, _ in page.items]
+
+
+def test_get_message_changes__messages_created_and_deleted__changes_in_order(
+    session,
+):
+    user, (kept, deleted) = _create_user_with_messages(session, ["kept", "deleted"])
+    delete_message_for_user(session=session, user_id=user.id, message_id=deleted.id)
+    (added,) = create_messages_for_user(
+        session=session, user_id=user.id, messages_in=[MessageCreate(content="new")]
+    )
+
+    page = get_message_changes(session=session, user_id=user.id, since=0)
+
+    # The insert of the deleted message is skipped, its tombstone follows
+    assert _changes(page) == [
+        (ChangeOperation.INSERT, kept.id),
+        (ChangeOperation.DELETE, deleted.id),
+        (ChangeOperation.INSERT, added.id),
+    ]
+    assert page.items[0][1] == kept
+    assert page.items[1][1] is None
+    assert page.next_since == page.items[-1][0].seq
+    assert not page.has_more
+
+
+def test_get_message_changes__since_last_change__only_newer_changes_returned(
+    session,
+):
+    user, _ = _create_user_with_messages(session, ["first"])
+    _create_user_with_messages(session, ["someone else's"])
+    watermark = get_message_changes(session=session, user_id=user.id)
+    message = create_message_for_user(
+        session=session, user_id=user.id, message_in=MessageCreate(content="second")
+    )
+
+    page = get_message_changes(
+        session=session, user_id=user.id, since=watermark.next_since
+    )
+
+    assert watermark.items == []
+    assert _changes(page) == [(ChangeOperation.INSERT, message.id)]
+
+
+def test_get_message_changes__more_than_limit__has_more_returned(session):
+    user, messages = _create_user_with_messages(session, ["a", "b", "c"])
+
+    first_page = get_message_changes(session=session, user_id=user.id, since=0, limit=2)
+    second_page = get_message_changes(
+        session=session, user_id=user.id, since=first_page.next_since, limit=2
+    )
+
+    assert first_page.has_more
+    assert not second_page.has_more
+    assert [message for _, message in first_page.items + second_page.items] == (
+        messages
+    )
+
+
+def test_compact_message_changes__old_tombstones__removed_and_old_since_gone(
+    session,
+):
+    user, (kept, deleted) = _create_user_with_messages(session, ["kept", "deleted"])
+    delete_message_for_user(session=session, user_id=user.id, message_id=deleted.id)
+    tombstone_seq = get_message_changes(session=session, user_id=user.id).next_since
+
+    removed = compact_message_changes(
+        session=session, older_than=datetime.now(timezone.utc) + timedelta(seconds=1)
+    )
+
+    assert removed == 2
+    remaining = session.exec(select(MessageChange)).all()
+    assert [(change.op, change.message_id) for change in remaining] == [
+        (ChangeOperation.INSERT, kept.id)
+    ]
+    with pytest.raises(GoneError) as err:
+        get_message_changes(session=session, user_id=user.id, since=0)
+    assert err.value.message == res.CHANGES_COMPACTED
+    page = get_message_changes(session=session, user_id=user.id, since=tombstone_seq)
+    assert page.items == []
+
+
+def test_compact_message_changes__other_users_tombstones__quiet_user_not_gone(
+    session,
+):
+    quiet_user, _ = _create_user_with_messages(session, ["quiet"])
+    first_page = get_message_changes(session=session, user_id=quiet_user.id, since=0)
+    other_user, (message,) = _create_user_with_messages(session, ["deleted"])
+    delete_message_for_user(
+        session=session, user_id=other_user.id, message_id=message.id
+    )
+    caught_up = get_message_changes(
+        session=session, user_id=quiet_user.id, since=first_page.next_since
+    )
+
+    compact_message_changes(
+        session=session, older_than=datetime.now(timezone.utc) + timedelta(seconds=1)
+    )
+    page = get_message_changes(
+        session=session, user_id=quiet_user.id, since=caught_up.next_since
+    )
+
+    # Caught-up clients move past other users' changes
+    assert caught_up.items == []
+    assert caught_up.next_since > first_page.next_since
+    assert page.items == []
+
+
+def test_compact_message_changes__no_old_tombstones__nothing_removed(session):
+    user, (message,) = _create_user_with_messages(session, ["message"])
+    delete_message_for_user(session=session, user_id=user.id, message_id=message.id)
+
+    removed = compact_message_changes(
+        session=session, older_than=datetime.now(timezone.utc) - timedelta(days=1)
+    )
+
+    assert removed == 0
+    assert len(get_message_changes(session=session, user_id=user.id, since=0).items)
+
+
+def test_get_user_messages__messages_found__public_columns_returned(session):
+    user, messages = _create_user_with_messages(session, ["a", "b", "c"])
+    expected = [
+        (message.id, message.sender_id, message.content, message.timestamp)
+        for message in messages
+    ]
+    user_id = user.id
+    session.expunge_all()
+
+    page = get_user_messages(session=session, user_id=user_id, limit=2)
+    next_page = get_user_messages(
+        session=session, user_id=user_id, limit=2, after=page.next_cursor
+    )
+
+    assert [tuple(row) for row in page.items + next_page.items] == expected
+    assert next_page.next_cursor is None
+    # No Message entities were loaded into the session
+    assert not any(isinstance(obj, Message) for obj in session.identity_map.values())
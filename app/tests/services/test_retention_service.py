@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+
+from sqlmodel import select
+
+from app.models import Message, MessageChange, User
+from app.models.message_change import ChangeOperation
+from app.services.message_service import MESSAGE_PUBLIC_COLUMNS
+from app.services.retention_service import (
+    RetentionPolicy,
+    _message_day,
+    apply_retention,
+    create_message_archive,
+    restore_archived_messages,
+)
+from app.tests.utils import generate_random_email, generate_random_name
+
+NOW = datetime(2024, 3, 1)
+
+
+def _create_user_with_messages(session, days_ago):
+    user = User(email=generate_random_email(), name=generate_random_name())
+    session.add(user)
+    session.commit()
+    messages = [
+        Message(
+            content=f"{days} days ago",
+            sender_id=user.id,
+            timestamp=NOW - timedelta(days=days),
+        )
+        for days in days_ago
+    ]
+    session.add_all(messages)
+    session.commit()
+    return user, [message.id for message in messages]
+
+
+def _message_ids(session):
+    return set(session.exec(select(Message.id)).all())
+
+
+def test_apply_retention__max_age__expired_messages_archived_by_day(session, tmp_path):
+    _, (old, older, recent) = _create_user_with_messages(session, [40, 41, 1])
+    archive = create_message_archive(directory=tmp_path)
+
+    result = apply_retention(
+        session=session,
+        policy=RetentionPolicy(max_age=timedelta(days=30)),
+        archive=archive,
+        now=NOW,
+        batch_size=1,
+    )
+
+    assert result.expired == 2
+    assert _message_ids(session) == {recent}
+    assert [row["id"] for day in archive.partitions() for row in archive.read(day)] == [
+        older,
+        old,
+    ]
+    tombstones = session.exec(
+        select(MessageChange.message_id).where(
+            MessageChange.op == ChangeOperation.DELETE
+        )
+    ).all()
+    assert set(tombstones) == {old, older}
+
+
+def test_apply_retention__max_messages_per_user__oldest_messages_archived(
+    session, tmp_path
+):
+    _, (newest, middle, oldest) = _create_user_with_messages(session, [1, 2, 3])
+    _, (other,) = _create_user_with_messages(session, [5])
+
+    result = apply_retention(
+        session=session,
+        policy=RetentionPolicy(max_messages_per_user=2),
+        archive=create_message_archive(directory=tmp_path),
+        now=NOW,
+    )
+
+    assert result.over_limit == 1
+    assert _message_ids(session) == {newest, middle, other}
+
+
+def test_restore_archived_messages__partition_archived__messages_restored_once(
+    session, tmp_path
+):
+    _, message_ids = _create_user_with_messages(session, [40, 40])
+    archive = create_message_archive(directory=tmp_path)
+    apply_retention(
+        session=session,
+        policy=RetentionPolicy(max_age=timedelta(days=30)),
+        archive=archive,
+        now=NOW,
+    )
+    (day,) = archive.partitions()
+
+    restored = restore_archived_messages(session=session, archive=archive, day=day)
+    restored_again = restore_archived_messages(
+        session=session, archive=archive, day=day
+    )
+
+    assert restored == 2
+    assert restored_again == 0
+    assert _message_ids(session) == set(message_ids)
+
+
+def test_restore_archived_messages__batch_archived_twice__messages_restored_once(
+    session, tmp_path
+):
+    _, message_ids = _create_user_with_messages(session, [40, 40])
+    archive = create_message_archive(directory=tmp_path)
+    # A run that crashed after archiving the batch, before deleting it
+    rows = [dict(row._mapping) for row in session.exec(select(*MESSAGE_PUBLIC_COLUMNS))]
+    archive.write(rows, day_of=_message_day)
+    apply_retention(
+        session=session,
+        policy=RetentionPolicy(max_age=timedelta(days=30)),
+        archive=archive,
+        now=NOW,
+    )
+    (day,) = archive.partitions()
+
+    restored = restore_archived_messages(session=session, archive=archive, day=day)
+
+    assert len(list(archive.read(day))) == 4
+    assert restored == 2
+    assert _message_ids(session) == set(message_ids)
@@ -1,17 +1,26 @@
 import pytest
+from sqlmodel import delete, select
 
 from app.core.constants import DEFAULT_USER_LIMIT
+from app.core.read_routing import WRITTEN_KEYS
+from app.models import MessageChange
 from app.models.message import MessageCreate
-from app.services.exceptions import AlreadyExistsError, NotFoundError
-from app.models.user import UserCreate, User, UserUpdate
+from app.services.exceptions import AlreadyExistsError, BadRequestError, NotFoundError
+from app.models.user import UserCreate, User, UserUpdate, UserVersion
+from app.services import user_service
 from app.services.user_service import (
     get_users,
+    estimate_user_count,
     create_user,
+    create_users,
     get_user_by_email,
     _get_user_by_email,
     get_user_by_id,
     update_user,
     delete_user,
+    bump_user_versions,
+    get_user_version_by_email,
+    get_user_version_by_id,
 )
 from app.services.message_service import (
     create_message_for_user,
@@ -19,6 +28,7 @@ from app.services.message_service import (
 )
 from app.tests.utils import generate_random_name, generate_random_email, generate_uuid
 import app.core.resources as res
+from app.core.cache import user_cache
 
 
 def test_create_user__user_created__user_returned(session):
@@ -48,7 +58,8 @@ def test_create_user__user_email_already_exists__already_exists_error_raised(ses
 
 def test_get_users__no_users_found__empty_list_returned(session):
     result = get_users(limit=DEFAULT_USER_LIMIT, session=session)
-    assert result == []
+    assert result.items == []
+    assert result.next_cursor is None
 
 
 def test_get_users__users_found__users_returned(session):
@@ -61,11 +72,10 @@ def test_get_users__users_found__users_returned(session):
         user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
     )
 
-    result_users = get_users(limit=DEFAULT_USER_LIMIT, session=session)
+    result_users = get_users(limit=DEFAULT_USER_LIMIT, session=session).items
 
     assert len(result_users) == 2
-    assert user1 in result_users
-    assert user2 in result_users
+    assert {row.id for row in result_users} == {user1.id, user2.id}
 
 
 def test_get_users__users_found__limited_users_returned(session):
@@ -79,11 +89,152 @@ def test_get_users__users_found__limited_users_returned(session):
         user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
     )
 
-    result_users = get_users(limit=limit, session=session)
+    result_users = get_users(limit=limit, session=session).items
 
     assert len(result_users) == 1
 
 
+def _create_users(session, *emails):
+    return [
+        create_user(
+            session=session, user_in=UserCreate(email=email, name=email.split("@")[0])
+        )
+        for email in emails
+    ]
+
+
+@pytest.mark.parametrize("order_by", ["id", "email"])
+def test_get_users__more_than_limit__all_users_walked_in_order(session, order_by):
+    users = _create_users(session, *(f"user{i}@test.com" for i in range(5)))
+    sort_key = (lambda u: u.id) if order_by == "id" else (lambda u: u.email)
+
+    pages = [get_users(session=session, limit=2, order_by=order_by)]
+    while pages[-1].next_cursor:
+        pages.append(
+            get_users(
+                session=session,
+                limit=2,
+                order_by=order_by,
+                after=pages[-1].next_cursor,
+            )
+        )
+
+    assert [len(page.items) for page in pages] == [2, 2, 1]
+    assert [row.id for page in pages for row in page.items] == [
+        user.id for user in sorted(users, key=sort_key)
+    ]
+
+
+def test_get_users__users_found__public_columns_returned(session):
+    users = _create_users(session, "jo@test.com", "jan@test.com")
+    expected = [
+        (user.id, user.name, user.email)
+        for user in sorted(users, key=lambda u: u.email)
+    ]
+    session.expunge_all()
+
+    page = get_users(session=session, order_by="email")
+
+    assert [tuple(row) for row in page.items] == expected
+    # No User entities were loaded into the session
+    assert not session.identity_map
+
+
+def test_get_users__cursor_from_other_ordering__bad_request_error_raised(session):
+    _create_users(session, "a@test.com", "b@test.com")
+    page = get_users(session=session, limit=1, order_by="email")
+
+    with pytest.raises(BadRequestError) as err:
+        get_users(session=session, limit=1, order_by="id", after=page.next_cursor)
+
+    assert err.value.message == res.INVALID_CURSOR
+
+
+def test_get_users__email_prefix__matching_users_returned(session):
+    _create_users(
+        session, "anna@test.com", "annabel@test.com", "ann@test.com", "bob@test.com"
+    )
+
+    page = get_users(session=session, email_prefix="anna", order_by="email")
+
+    assert [user.email for user in page.items] == [
+        "anna@test.com",
+        "annabel@test.com",
+    ]
+
+
+def test_get_users__name_prefix__matching_users_returned(session):
+    _create_users(session, "carl@test.com", "carla@test.com", "dora@test.com")
+
+    page = get_users(session=session, name_prefix="car", order_by="email")
+
+    assert [user.name for user in page.items] == ["carl", "carla"]
+
+
+@pytest.mark.parametrize(
+    "name_prefix, expected",
+    [
+        ("a\U0010ffff", ["a\U0010ffff", "a\U0010ffffb"]),
+        ("\U0010ffff", ["\U0010ffff"]),
+        ("a\ud7ff", ["a\ud7ffc"]),
+    ],
+)
+def test_get_users__prefix_ending_in_last_code_point__carried_upper_bound(
+    session, name_prefix, expected
+):
+    for name in (
+        "a\U0010ffff",
+        "a\U0010ffffb",
+        "b",
+        "\U0010ffff",
+        "a\ud7ffc",
+        "a\ue000",
+    ):
+        create_user(
+            session=session,
+            user_in=UserCreate(email=generate_random_email(), name=name),
+        )
+
+    page = get_users(session=session, name_prefix=name_prefix)
+
+    assert sorted(user.name for user in page.items) == expected
+
+
+def test_estimate_user_count__below_exact_limit__exact_count_returned(session):
+    _create_users(session, "eve@test.com", "evan@test.com", "finn@test.com")
+
+    assert estimate_user_count(session=session) == user_service.UserCount(3, True)
+    assert estimate_user_count(
+        session=session, email_prefix="ev"
+    ) == user_service.UserCount(2, True)
+
+
+def test_estimate_user_count__above_exact_limit__estimate_returned(
+    session, monkeypatch
+):
+    monkeypatch.setattr(user_service, "USER_COUNT_EXACT_LIMIT", 2)
+    _create_users(session, "gus@test.com", "gwen@test.com", "hal@test.com")
+
+    assert estimate_user_count(session=session) == user_service.UserCount(3, False)
+    assert estimate_user_count(
+        session=session, email_prefix="g"
+    ) == user_service.UserCount(2, True)
+    assert estimate_user_count(
+        session=session, name_prefix="h"
+    ) == user_service.UserCount(1, True)
+
+
+def test_estimate_user_count__filtered_above_exact_limit__lower_bound_returned(
+    session, monkeypatch
+):
+    monkeypatch.setattr(user_service, "USER_COUNT_EXACT_LIMIT", 1)
+    _create_users(session, "ida@test.com", "ivan@test.com")
+
+    count = estimate_user_count(session=session, email_prefix="i")
+
+    assert count == user_service.UserCount(1, False)
+
+
 def test_get_user_by_email__user_found__user_returned(session):
     email = generate_random_email()
     name = generate_random_name()
@@ -199,6 +350,21 @@ def test_update_user__user_found__user_updated(
     assert updated_user.id == user.id
 
 
+def test_update_user__email_changed__user_and_both_emails_noted_as_written(
+    session,
+):
+    old_email, new_email = generate_random_email(), generate_random_email()
+    user = create_user(
+        session=session,
+        user_in=UserCreate(email=old_email, name=generate_random_name()),
+    )
+    session.info.clear()
+
+    update_user(session=session, user_id=user.id, user_in=UserUpdate(email=new_email))
+
+    assert session.info[WRITTEN_KEYS] == {str(user.id), old_email, new_email}
+
+
 def test_update_user__user_not_found__not_found_error_raised(session):
     user_id = generate_uuid()
 
@@ -228,6 +394,73 @@ def test_update_user__user_email_already_exists__already_exists_error_raised(ses
     assert user.id != new_user.id
 
 
+def test_get_user_version_by_email__user_never_written__version_zero(session):
+    user = create_user(
+        session=session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+
+    version = get_user_version_by_email(session=session, email=user.email)
+
+    assert tuple(version) == (user.id, 0, None)
+    assert get_user_version_by_email(session=session, email="x@test.com") is None
+
+
+def test_get_user_version_by_id__user_and_messages_written__version_bumped(session):
+    user = create_user(
+        session=session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+    update_user(session=session, user_id=user.id, user_in=UserUpdate(name="New"))
+    first = get_user_version_by_id(session=session, user_id=user.id)
+    create_message_for_user(
+        session=session, user_id=user.id, message_in=MessageCreate(content="Hi")
+    )
+
+    second = get_user_version_by_id(session=session, user_id=user.id)
+
+    assert first.version == 1
+    assert first.modified_at is not None
+    assert second.version == 2
+    assert second.modified_at >= first.modified_at
+
+
+def test_bump_user_versions__many_users__each_bumped_once(session, mocker):
+    mocker.patch("app.services.user_service.USER_VERSION_CHUNK_SIZE", 2)
+    users = [
+        create_user(
+            session=session,
+            user_in=UserCreate(
+                email=generate_random_email(), name=generate_random_name()
+            ),
+        )
+        for _ in range(3)
+    ]
+    bump_user_versions(session, [users[0].id])
+    session.commit()
+
+    bump_user_versions(session, [user.id for user in users] + [users[0].id])
+    session.commit()
+
+    versions = [
+        get_user_version_by_id(session=session, user_id=user.id).version
+        for user in users
+    ]
+    assert versions == [2, 1, 1]
+
+
+def test_delete_user__user_versioned__version_deleted(session):
+    user = create_user(
+        session=session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+    update_user(session=session, user_id=user.id, user_in=UserUpdate(name="New"))
+
+    delete_user(session=session, user_id=user.id)
+
+    assert session.exec(select(UserVersion)).all() == []
+
+
 def test_delete_user__user_found__user_deleted(session):
     user = create_user(
         session=session,
@@ -258,17 +491,163 @@ def test_delete_user__user_deleted__user_messages_deleted(session):
         user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
     )
 
-    message1 = create_message_for_user(
-        session, user_id=user.id, message_in=MessageCreate(content="Test message 1")
+    message_ids = [
+        create_message_for_user(
+            session, user_id=user.id, message_in=MessageCreate(content=content)
+        ).id
+        for content in ("Test message 1", "Test message 2")
+    ]
+
+    delete_user(session=session, user_id=user.id)
+
+    for message_id in message_ids:
+        assert _get_message(session=session, message_id=message_id) is None
+    # The change log of the user goes with them
+    assert session.exec(select(MessageChange)).all() == []
+
+
+def test_create_users__all_new__users_created(session):
+    users_in = [
+        UserCreate(email=generate_random_email(), name=generate_random_name())
+        for _ in range(3)
+    ]
+
+    items = create_users(session=session, users_in=users_in)
+
+    assert [item.index for item in items] == [0, 1, 2]
+    assert all(item.error is None for item in items)
+    for user_in in users_in:
+        assert _get_user_by_email(session=session, email=user_in.email) is not None
+
+
+def test_create_users__conflicting_emails__conflicts_reported_per_item(session):
+    existing_user = create_user(
+        session=session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+    new_email = generate_random_email()
+    users_in = [
+        UserCreate(email=existing_user.email, name=generate_random_name()),
+        UserCreate(email=new_email, name=generate_random_name()),
+        UserCreate(email=new_email, name=generate_random_name()),
+    ]
+
+    items = create_users(session=session, users_in=users_in)
+
+    assert items[0].user is None
+    assert items[0].error == res.EMAIL_ALREADY_EXISTS
+    assert items[1].user.email == new_email
+    assert items[1].error is None
+    assert items[2].user is None
+    assert items[2].error == res.EMAIL_DUPLICATED_IN_BATCH
+    assert len(get_users(session=session, limit=DEFAULT_USER_LIMIT).items) == 2
+
+
+def test_create_users__email_taken_after_check__conflict_reported_per_item(
+    session, mocker
+):
+    taken_email = generate_random_email()
+    create_user(
+        session=session,
+        user_in=UserCreate(email=taken_email, name=generate_random_name()),
+    )
+    existing_emails_queries = user_service._existing_emails_queries
+    checks = []
+
+    def check_before_email_taken(users_in):
+        # The first check runs before another request takes the email
+        checks.append(users_in)
+        return existing_emails_queries(users_in) if len(checks) > 1 else iter(())
+
+    mocker.patch.object(
+        user_service, "_existing_emails_queries", check_before_email_taken
+    )
+    new_email = generate_random_email()
+    users_in = [
+        UserCreate(email=taken_email, name=generate_random_name()),
+        UserCreate(email=new_email, name=generate_random_name()),
+    ]
+
+    items = create_users(session=session, users_in=users_in)
+
+    assert len(checks) == 2
+    assert items[0].error == res.EMAIL_ALREADY_EXISTS
+    assert items[1].user.email == new_email
+    assert _get_user_by_email(session=session, email=new_email) is not None
+
+
+def test_get_user_by_id__user_cached__returned_from_cache(session):
+    user = create_user(
+        session=session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+    get_user_by_id(session=session, user_id=user.id)
+    hits = user_cache.stats.hits
+    session.expunge_all()
+
+    cached_user = get_user_by_id(session=session, user_id=user.id)
+
+    assert user_cache.stats.hits == hits + 1
+    assert cached_user.id == user.id
+    assert cached_user.email == user.email
+
+
+def test_update_user__user_cached__cache_invalidated(session):
+    user = create_user(
+        session=session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
     )
-    message2 = create_message_for_user(
-        session, user_id=user.id, message_in=MessageCreate(content="Test message 2")
+    old_email = user.email
+    get_user_by_email(session=session, email=old_email)
+    new_email = generate_random_email()
+
+    update_user(session=session, user_id=user.id, user_in=UserUpdate(email=new_email))
+
+    assert get_user_by_email(session=session, email=new_email).id == user.id
+    with pytest.raises(NotFoundError):
+        get_user_by_email(session=session, email=old_email)
+
+
+def test_delete_user__user_cached__cache_invalidated(session):
+    user = create_user(
+        session=session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
     )
+    get_user_by_id(session=session, user_id=user.id)
 
     delete_user(session=session, user_id=user.id)
 
-    result_message1 = _get_message(session=session, message_id=message1.id)
-    result_message2 = _get_message(session=session, message_id=message2.id)
+    with pytest.raises(NotFoundError):
+        get_user_by_id(session=session, user_id=user.id)
+
+
+def _cache_deleted_user(session):
+    # Cached here, then deleted by another worker, which leaves the cache be
+    user = create_user(
+        session=session,
+        user_in=UserCreate(email=generate_random_email(), name=generate_random_name()),
+    )
+    get_user_by_id(session=session, user_id=user.id)
+    session.exec(delete(User).where(User.id == user.id))
+    session.commit()
+    session.expunge_all()
+    return user
+
+
+def test_delete_user__cached_user_deleted__not_found_error_raised(session):
+    user = _cache_deleted_user(session)
 
-    assert result_message1 is None
-    assert result_message2 is None
+    with pytest.raises(NotFoundError) as err:
+        delete_user(session=session, user_id=user.id)
+
+    assert err.value.message == res.USER_NOT_FOUND
+    assert user_cache.get(user_service._id_cache_key(user.id)) is None
+
+
+def test_update_user__cached_user_deleted__not_found_error_raised(session):
+    user = _cache_deleted_user(session)
+
+    with pytest.raises(NotFoundError) as err:
+        update_user(session=session, user_id=user.id, user_in=UserUpdate(name="x"))
+
+    assert err.value.message == res.USER_NOT_FOUND
@@ -0,0 +1,142 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, delete, select
+
+from app.core import config
+from app.database import (
+    create_async_db_engine,
+    create_db_engine,
+    create_read_engine,
+    migrate_cascade_deletes,
+    read_replica_urls,
+)
+from app.models import Message, MessageChange, User
+from app.models.message_search import create_search_index, message_fts
+
+
+def test_create_db_engine__sqlite_file__pragmas_applied(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'test.db'}")
+
+    with engine.connect() as connection:
+        journal_mode = connection.execute(text("PRAGMA journal_mode")).scalar()
+        synchronous = connection.execute(text("PRAGMA synchronous")).scalar()
+        busy_timeout = connection.execute(text("PRAGMA busy_timeout")).scalar()
+        cache_size = connection.execute(text("PRAGMA cache_size")).scalar()
+
+    assert journal_mode == "wal"
+    # NORMAL
+    assert synchronous == 1
+    assert busy_timeout == config.SQLITE_BUSY_TIMEOUT_MS
+    assert cache_size == config.SQLITE_CACHE_SIZE
+    engine.dispose()
+
+
+def test_create_db_engine__sqlite_file__pool_configured(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'test.db'}")
+
+    assert engine.pool.size() == config.DATABASE_POOL_SIZE
+    assert engine.pool._max_overflow == config.DATABASE_MAX_OVERFLOW
+    assert engine.echo == config.DATABASE_ECHO
+    engine.dispose()
+
+
+def test_create_db_engine__sqlite_memory__engine_created_without_pool_sizing():
+    engine = create_db_engine("sqlite://")
+
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT 1")).scalar() == 1
+    engine.dispose()
+
+
+@pytest.mark.anyio
+async def test_create_async_db_engine__sqlite_file__pragmas_applied(tmp_path):
+    async_engine = create_async_db_engine(f"sqlite:///{tmp_path / 'test.db'}")
+
+    async with async_engine.connect() as connection:
+        journal_mode = (await connection.execute(text("PRAGMA journal_mode"))).scalar()
+
+    assert journal_mode == "wal"
+    await async_engine.dispose()
+
+
+def test_create_read_engine__sqlite_file__reads_and_rejects_writes(tmp_path):
+    url = f"sqlite:///{tmp_path / 'test.db'}"
+    engine = create_db_engine(url)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(name="Jo", email="jo@test.com"))
+        session.commit()
+    read_engine = create_read_engine(url)
+
+    with Session(read_engine) as session:
+        assert session.exec(select(User.email)).all() == ["jo@test.com"]
+        with pytest.raises(OperationalError):
+            session.exec(delete(User))
+    engine.dispose()
+    read_engine.dispose()
+
+
+def test_read_replica_urls__sqlite_read_engines__file_shared_memory_not(mocker):
+    mocker.patch.object(config, "DATABASE_READ_URLS", ["postgresql://replica/db"])
+    mocker.patch.object(config, "SQLITE_READ_ENGINES", 2)
+
+    assert read_replica_urls("sqlite:///./app.db") == [
+        "postgresql://replica/db",
+        "sqlite:///./app.db",
+        "sqlite:///./app.db",
+    ]
+    assert read_replica_urls("sqlite://") == ["postgresql://replica/db"]
+
+
+def _create_tables_without_cascade(engine):
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for table in (Message.__table__, MessageChange.__table__):
+            sql = connection.execute(
+                text("SELECT sql FROM sqlite_master WHERE name = :name"),
+                {"name": table.name},
+            ).scalar()
+            connection.execute(text(f"DROP TABLE {table.name}"))
+            connection.execute(text(sql.replace(" ON DELETE CASCADE", "")))
+            for index in table.indexes:
+                index.create(connection)
+        create_search_index(connection)
+
+
+def test_migrate_cascade_deletes__tables_without_cascade__rebuilt_with_rows(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    _create_tables_without_cascade(engine)
+    user = User(name="Jo", email="jo@test.com")
+    message = Message(content="pizza tonight", sender_id=user.id)
+    with Session(engine, expire_on_commit=False) as session:
+        session.add_all([user, message])
+        session.commit()
+        session.add(MessageChange(user_id=user.id, message_id=message.id, op="insert"))
+        session.commit()
+        # A compacted entry must not get its seq reused after the migration
+        session.add(MessageChange(user_id=user.id, message_id=message.id, op="delete"))
+        session.commit()
+        session.exec(delete(MessageChange).where(MessageChange.seq == 2))
+        session.commit()
+
+    migrated = migrate_cascade_deletes(engine)
+    again = migrate_cascade_deletes(engine)
+
+    assert migrated == ["message", "message_change"]
+    assert again == []
+    with Session(engine) as session:
+        assert session.exec(select(Message.id)).all() == [message.id]
+        found = session.exec(
+            select(message_fts.c.message_id).where(text("message_fts MATCH 'pizza'"))
+        ).all()
+        assert found == [message.id.hex]
+        session.add(MessageChange(user_id=user.id, message_id=message.id, op="delete"))
+        session.commit()
+        assert session.exec(select(MessageChange.seq)).all() == [1, 3]
+
+        session.exec(delete(User))
+        session.commit()
+        assert session.exec(select(Message)).all() == []
+        assert session.exec(select(MessageChange)).all() == []
+    engine.dispose()
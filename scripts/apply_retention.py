@@ -0,0 +1,67 @@
+"""Archive messages outside of the retention policy.
+
+Moves messages older than the maximum age, and the oldest messages of users
+over the per-user maximum, into compressed NDJSON files with one partition
+per day, in batches that each commit on their own. Limits default to the
+MESSAGE_RETENTION_* settings; scripts/restore_archive.py puts a partition
+back.
+
+    python scripts/apply_retention.py --max-age-days 365 --max-per-user 100000
+"""
+
+import argparse
+import sys
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlmodel import Session
+
+from app.core import config
+from app.core.constants import MESSAGE_DELETE_CHUNK_SIZE
+from app.database import engine
+from app.services.retention_service import (
+    RetentionPolicy,
+    apply_retention,
+    create_message_archive,
+)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--max-age-days", type=int, default=config.MESSAGE_RETENTION_MAX_AGE_DAYS
+    )
+    parser.add_argument(
+        "--max-per-user", type=int, default=config.MESSAGE_RETENTION_MAX_PER_USER
+    )
+    parser.add_argument("--archive-dir", default=config.MESSAGE_ARCHIVE_DIR)
+    parser.add_argument(
+        "--compression",
+        choices=("gzip", "zstd"),
+        default=config.MESSAGE_ARCHIVE_COMPRESSION,
+    )
+    parser.add_argument("--batch-size", type=int, default=MESSAGE_DELETE_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    policy = RetentionPolicy(
+        max_age=timedelta(days=args.max_age_days) if args.max_age_days > 0 else None,
+        max_messages_per_user=args.max_per_user or None,
+    )
+    archive = create_message_archive(
+        directory=args.archive_dir, compression=args.compression
+    )
+    with Session(engine) as session:
+        result = apply_retention(
+            session=session, policy=policy, archive=archive, batch_size=args.batch_size
+        )
+    print(
+        f"Archived {result.expired} expired messages and "
+        f"{result.over_limit} messages over the per-user limit"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
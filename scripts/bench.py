@@ -0,0 +1,361 @@
+"""In-process load benchmark for the API.
+
+Seeds a fresh SQLite database, drives every API route over ASGI at a fixed
+concurrency and prints a JSON report with p50/p95/p99 latencies and req/s
+per route. Reports can be compared against a baseline from another commit:
+
+    python scripts/bench.py --users 1000 --messages-per-user 100 -o new.json
+    python scripts/bench.py --baseline old.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+@dataclass
+class Request:
+    method: str
+    url: str
+    json: object | None = None
+
+
+@dataclass
+class Scenario:
+    name: str
+    # Builds the n-th request; scenarios that consume data (deletes) get
+    # their own pre-seeded rows so every request hits an existing row.
+    build: Callable[[int], Request]
+
+
+@dataclass
+class Dataset:
+    user_ids: list[str] = field(default_factory=list)
+    emails: list[str] = field(default_factory=list)
+    # Users/messages reserved for destructive scenarios
+    disposable_user_ids: list[str] = field(default_factory=list)
+    disposable_messages: list[tuple[str, str]] = field(default_factory=list)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages-per-user", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500, help="per route")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=20, help="per route")
+    parser.add_argument("--routes", nargs="*", help="only run these routes")
+    parser.add_argument("--database", help="SQLite file, a temporary one by default")
+    parser.add_argument(
+        "--fast-json", action="store_true", help="run with FAST_JSON_RESPONSES=1"
+    )
+    parser.add_argument("-o", "--output", help="write the JSON report to a file")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.2,
+        help="fail if a route's p95 grows by more than this fraction",
+    )
+    return parser.parse_args(argv)
+
+
+def configure_environment(database_path: str, fast_json: bool = False) -> None:
+    # Settings are read at import time, so they must be set before the
+    # application is imported.
+    os.environ["DATABASE_URL"] = f"sqlite:///{database_path}"
+    if fast_json:
+        os.environ["FAST_JSON_RESPONSES"] = "1"
+    os.environ.setdefault("LOG_SAMPLE_RATE", "0")
+    # Write scenarios would otherwise measure 429 responses
+    os.environ.setdefault("RATE_LIMIT_BACKEND", "none")
+    sys.path.insert(0, str(ROOT_DIR))
+
+
+def seed_database(users: int, messages_per_user: int, reserved: int) -> Dataset:
+    from sqlmodel import insert
+
+    from app.database import engine, init_db
+    from app.models import Message, User
+
+    init_db()
+    dataset = Dataset()
+    start_time = datetime(2024, 1, 1)
+    user_rows = []
+    for index in range(users + reserved):
+        user_id = uuid.uuid4()
+        email = f"bench-user-{index}-{user_id.hex[:8]}@bench.com"
+        user_rows.append({"id": user_id, "name": f"User {index}", "email": email})
+        if index < users:
+            dataset.user_ids.append(str(user_id))
+            dataset.emails.append(email)
+        else:
+            dataset.disposable_user_ids.append(str(user_id))
+
+    with engine.begin() as connection:
+        connection.execute(insert(User), user_rows)
+        batch = []
+        for user_index, user_row in enumerate(user_rows[:users]):
+            for message_index in range(messages_per_user):
+                batch.append(
+                    {
+                        "id": uuid.uuid4(),
+                        "content": f"Message {message_index} from user {user_index}",
+                        "sender_id": user_row["id"],
+                        "timestamp": start_time + timedelta(seconds=message_index),
+                    }
+                )
+                if len(batch) >= 10_000:
+                    connection.execute(insert(Message), batch)
+                    batch = []
+        # Messages reserved for the delete scenario, owned by the first user
+        disposable_messages = [
+            {
+                "id": uuid.uuid4(),
+                "content": "Disposable message",
+                "sender_id": user_rows[0]["id"],
+                "timestamp": start_time,
+            }
+            for _ in range(reserved)
+        ]
+        batch.extend(disposable_messages)
+        if batch:
+            connection.execute(insert(Message), batch)
+    dataset.disposable_messages = [
+        (str(row["sender_id"]), str(row["id"])) for row in disposable_messages
+    ]
+    return dataset
+
+
+def build_scenarios(dataset: Dataset) -> list[Scenario]:
+    user_ids = dataset.user_ids
+    emails = dataset.emails
+
+    def pick(values: list, n: int):
+        return values[n % len(values)]
+
+    return [
+        Scenario("GET /api/", lambda n: Request("GET", "/api/")),
+        Scenario("GET /api/users/", lambda n: Request("GET", "/api/users/?limit=100")),
+        Scenario(
+            "GET /api/users/{email}",
+            lambda n: Request("GET", f"/api/users/{pick(emails, n)}"),
+        ),
+        Scenario(
+            "POST /api/users/",
+            lambda n: Request(
+                "POST",
+                "/api/users/",
+                {"name": "Bench", "email": f"{uuid.uuid4().hex}@bench.com"},
+            ),
+        ),
+        Scenario(
+            "POST /api/users/batch",
+            lambda n: Request(
+                "POST",
+                "/api/users/batch",
+                [
+                    {"name": "Bench", "email": f"{uuid.uuid4().hex}@bench.com"}
+                    for _ in range(10)
+                ],
+            ),
+        ),
+        Scenario(
+            "PATCH /api/users/{user_id}",
+            lambda n: Request(
+                "PATCH", f"/api/users/{pick(user_ids, n)}", {"name": f"User {n}"}
+            ),
+        ),
+        Scenario(
+            "DELETE /api/users/{user_id}",
+            lambda n: Request("DELETE", f"/api/users/{dataset.disposable_user_ids[n]}"),
+        ),
+        Scenario(
+            "GET /api/users/{user_id}/messages/",
+            lambda n: Request("GET", f"/api/users/{pick(user_ids, n)}/messages/"),
+        ),
+        Scenario(
+            "GET /api/users/{user_id}/messages/search",
+            lambda n: Request(
+                "GET", f"/api/users/{pick(user_ids, n)}/messages/search?q=message"
+            ),
+        ),
+        Scenario(
+            "POST /api/users/{user_id}/messages/",
+            lambda n: Request(
+                "POST",
+                f"/api/users/{pick(user_ids, n)}/messages/",
+                {"content": f"Bench message {n}"},
+            ),
+        ),
+        Scenario(
+            "POST /api/users/{user_id}/messages/batch",
+            lambda n: Request(
+                "POST",
+                f"/api/users/{pick(user_ids, n)}/messages/batch",
+                [{"content": f"Bench message {n}-{i}"} for i in range(100)],
+            ),
+        ),
+        Scenario(
+            "DELETE /api/users/{user_id}/messages/{message_id}",
+            lambda n: Request(
+                "DELETE",
+                "/api/users/{}/messages/{}".format(*dataset.disposable_messages[n]),
+            ),
+        ),
+        Scenario("GET /metrics", lambda n: Request("GET", "/metrics")),
+    ]
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(
+        0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1)
+    )
+    return sorted_values[index]
+
+
+async def run_scenario(
+    client, scenario: Scenario, requests: int, concurrency: int, offset: int = 0
+) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    counter = itertools.count(offset)
+    stop = offset + requests
+
+    async def worker() -> None:
+        nonlocal errors
+        for n in counter:
+            if n >= stop:
+                return
+            request = scenario.build(n)
+            start_time = time.perf_counter()
+            response = await client.request(
+                request.method, request.url, json=request.json
+            )
+            latencies.append(time.perf_counter() - start_time)
+            if response.status_code >= 400:
+                errors += 1
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start_time
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": round(len(latencies) / elapsed, 2) if elapsed else 0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0,
+    }
+
+
+async def run_benchmark(args: argparse.Namespace, dataset: Dataset) -> dict:
+    import httpx
+
+    from app.main import app
+
+    scenarios = build_scenarios(dataset)
+    if args.routes:
+        scenarios = [scenario for scenario in scenarios if scenario.name in args.routes]
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        for scenario in scenarios:
+            # Warmup requests use the indices after the measured ones, so
+            # destructive scenarios never touch the same row twice.
+            await run_scenario(
+                client, scenario, args.warmup, args.concurrency, offset=args.requests
+            )
+            results[scenario.name] = await run_scenario(
+                client, scenario, args.requests, args.concurrency
+            )
+    return results
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> bool:
+    ok = True
+    print(f"{'route':<55} {'p95 base':>10} {'p95 new':>10} {'change':>8}")
+    for route, result in report["results"].items():
+        base = baseline["results"].get(route)
+        if not base or not base["p95_ms"]:
+            continue
+        change = (result["p95_ms"] - base["p95_ms"]) / base["p95_ms"]
+        marker = ""
+        if change > max_regression:
+            ok = False
+            marker = "  REGRESSION"
+        print(
+            f"{route:<55} {base['p95_ms']:>10.2f} {result['p95_ms']:>10.2f} "
+            f"{change:>+8.1%}{marker}"
+        )
+    return ok
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database_path = args.database or os.path.join(temp_dir, "bench.db")
+        configure_environment(database_path, fast_json=args.fast_json)
+        reserved = args.requests + args.warmup
+        dataset = seed_database(args.users, args.messages_per_user, reserved)
+        results = asyncio.run(run_benchmark(args, dataset))
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "users": args.users,
+            "messages_per_user": args.messages_per_user,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "fast_json": args.fast_json,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        return 0 if compare(report, baseline, args.max_regression) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""Compare the default and the fast JSON response paths of list endpoints.
+
+The default path selects column rows and runs them through FastAPI's
+response_model validation, jsonable_encoder and JSONResponse; "entities" is
+the same with full ORM entities, as listings loaded them before. The fast
+path (FAST_JSON_RESPONSES=1) validates the rows once with a TypeAdapter and
+renders them with orjson.
+
+    python scripts/bench_serialization.py --sizes 20 100 1000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import uuid
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, insert, select
+from starlette.responses import JSONResponse
+
+from app.core.responses import ORJSONResponse, RowSerializer
+from app.models import Message, User
+from app.models.message import MessageRow, MessagesPublic
+from app.services.message_service import MESSAGE_PUBLIC_COLUMNS
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    return parser.parse_args(argv)
+
+
+def seed(size: int) -> Session:
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    user_id = uuid.uuid4()
+    start_time = datetime(2024, 1, 1)
+    session = Session(engine)
+    session.exec(
+        insert(User), params=[{"id": user_id, "name": "Bench", "email": "b@b.com"}]
+    )
+    session.exec(
+        insert(Message),
+        params=[
+            {
+                "id": uuid.uuid4(),
+                "sender_id": user_id,
+                "content": f"Benchmark message number {index}",
+                "timestamp": start_time + timedelta(seconds=index),
+            }
+            for index in range(size)
+        ],
+    )
+    session.commit()
+    return session
+
+
+def default_path(
+    session: Session, loop: asyncio.AbstractEventLoop, statement=None
+) -> Callable:
+    field = create_model_field("Response_bench", MessagesPublic, mode="serialization")
+    if statement is None:
+        statement = select(*MESSAGE_PUBLIC_COLUMNS)
+
+    def run() -> bytes:
+        session.expunge_all()
+        messages = session.exec(statement).all()
+        content = loop.run_until_complete(
+            serialize_response(
+                field=field, response_content=MessagesPublic(data=messages)
+            )
+        )
+        return JSONResponse(content).body
+
+    return run
+
+
+def fast_path(session: Session) -> Callable:
+    serialize = RowSerializer(MessageRow)
+
+    def run() -> bytes:
+        rows = session.exec(select(*MESSAGE_PUBLIC_COLUMNS)).all()
+        content = {"data": serialize(rows), "next_cursor": None, "prev_cursor": None}
+        return ORJSONResponse(content).body
+
+    return run
+
+
+def measure(run: Callable, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start_time)
+    return timings
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    loop = asyncio.new_event_loop()
+    results = {}
+    for size in args.sizes:
+        session = seed(size)
+        paths = {
+            "entities": default_path(session, loop, select(Message)),
+            "default": default_path(session, loop),
+            "fast": fast_path(session),
+        }
+        expected = json.loads(paths["entities"]())["data"]
+        assert all(json.loads(run())["data"] == expected for run in paths.values())
+        result = {}
+        for name, run in paths.items():
+            timings = measure(run, args.repeat)
+            result[name] = {
+                "median_ms": round(statistics.median(timings) * 1000, 3),
+                "min_ms": round(min(timings) * 1000, 3),
+            }
+        for name in ("default", "fast"):
+            result[f"{name}_speedup"] = round(
+                result["entities"]["median_ms"] / result[name]["median_ms"], 2
+            )
+        results[f"{size} messages"] = result
+        session.close()
+    loop.close()
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+"""Compact the message change log.
+
+Drops deletion tombstones older than the retention period together with the
+log entries of the messages they deleted. Clients that last synced before
+the newest dropped tombstone are told to reload all messages.
+
+    python scripts/compact_changes.py --older-than-days 30
+"""
+
+import argparse
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlmodel import Session
+
+from app.core import config
+from app.database import engine
+from app.services.message_service import compact_message_changes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--older-than-days",
+        type=int,
+        default=config.MESSAGE_TOMBSTONE_RETENTION_DAYS,
+    )
+    args = parser.parse_args()
+
+    older_than = datetime.now(timezone.utc) - timedelta(days=args.older_than_days)
+    with Session(engine) as session:
+        removed = compact_message_changes(session=session, older_than=older_than)
+    print(f"Removed {removed} change log entries")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
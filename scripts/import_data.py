@@ -0,0 +1,116 @@
+"""Bulk import users or messages from NDJSON or CSV.
+
+Reads a file (or stdin with "-") as a stream, validates records in worker
+processes against UserCreate/MessageCreate and inserts them from a single
+writer, one executemany per commit. After every commit the number of
+processed records is saved to a checkpoint file; running the same command
+again resumes from there. Records without an id get one derived from the
+import's id, kept in the checkpoint, so only a resumed import generates the
+same ids again. Import users before their messages.
+
+Users have "name", "email" and optionally "id"; messages have "sender_id",
+"content" and optionally "id" and "timestamp". CSV files need a header row.
+
+    python scripts/import_data.py users users.ndjson --workers 4
+    zcat messages.csv.gz | python scripts/import_data.py messages - \\
+        --format csv --checkpoint messages.checkpoint
+"""
+
+import argparse
+import io
+import os
+import sys
+from pathlib import Path
+from typing import IO
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlmodel import Session
+
+from app.database import engine, init_db
+from app.services.import_service import (
+    ImportCheckpoint,
+    import_records,
+    read_records,
+)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("kind", choices=("users", "messages"))
+    parser.add_argument("source", help='input file, or "-" for stdin')
+    parser.add_argument(
+        "--format",
+        choices=("ndjson", "csv"),
+        help="by default from the file extension, NDJSON unless .csv",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--commit-size", type=int, default=10_000)
+    parser.add_argument(
+        "--checkpoint", help="checkpoint file, <source>.checkpoint by default"
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="ignore an existing checkpoint"
+    )
+    return parser.parse_args(argv)
+
+
+def open_source(source: str) -> IO[str]:
+    if source == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+    return open(source, encoding="utf-8", newline="")
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.source == "-" and not args.checkpoint:
+        print("Imports from stdin need --checkpoint", file=sys.stderr)
+        return 2
+    format = args.format or ("csv" if args.source.endswith(".csv") else "ndjson")
+    source = args.source if args.source == "-" else str(Path(args.source).resolve())
+    checkpoint = ImportCheckpoint(
+        args.checkpoint or f"{args.source}.checkpoint", source=source, kind=args.kind
+    )
+    resumed = not args.restart and checkpoint.resumable()
+    skip = checkpoint.load() if resumed else 0
+    if resumed:
+        print(
+            f"Resuming after record {skip}, "
+            f"{checkpoint.skipped} existing records skipped so far",
+            file=sys.stderr,
+        )
+    else:
+        # Keeps the new import id before anything is committed, so even a
+        # run interrupted before its first commit resumes with the same ids
+        checkpoint.save(0)
+
+    def report(number: int, error: str) -> None:
+        print(f"Record {number}: {error}", file=sys.stderr)
+
+    init_db()
+    with open_source(args.source) as stream, Session(engine) as session:
+        result = import_records(
+            session=session,
+            kind=args.kind,
+            import_id=checkpoint.import_id,
+            records=read_records(stream, format, skip=skip),
+            checkpoint=checkpoint,
+            resumed=resumed,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            commit_size=args.commit_size,
+            on_reject=report,
+            on_skip=report,
+        )
+    print(
+        f"Imported {result.imported}, skipped {result.skipped} existing, "
+        f"rejected {result.rejected} {args.kind}"
+    )
+    if resumed:
+        print(f"Skipped {checkpoint.skipped} existing {args.kind} in all runs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
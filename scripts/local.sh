@@ -5,6 +5,7 @@ clean=false
 lint=false
 test=false
 run=false
+bench=false
 
 print_help() {
     echo "Usage: $0 [OPTIONS]"
@@ -14,6 +15,7 @@ print_help() {
     echo "  -l, lint     Run linting and formatting on the application code."
     echo "  -t, test     Run pytest on the application code."
     echo "  -r, run      Run the application with the existing or newly created environment."
+    echo "  -b, bench    Run the load benchmark and write bench_output.txt."
     echo "  -h, help     Display this help message."
     echo
     exit 0
@@ -34,6 +36,9 @@ for arg in "$@"; do
         -r|run)
             run=true
             ;;
+        -b|bench)
+            bench=true
+            ;;
         -h|help)
             print_help
             ;;
@@ -94,6 +99,11 @@ run_unit_tests() {
     ./scripts/test.sh
 }
 
+run_benchmark() {
+    echo "Running benchmark..."
+    python scripts/bench.py --output bench_output.txt
+}
+
 run_application() {
     echo "Running the application..."
     uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload --reload-dir app
@@ -114,6 +124,11 @@ if [ "$test" = true ]; then
     run_unit_tests
 fi
 
+if [ "$bench" = true ]; then
+    setup_environment
+    run_benchmark
+fi
+
 if [ "$run" = true ]; then
     setup_environment
     run_application
@@ -0,0 +1,24 @@
+"""Add ON DELETE CASCADE to the user foreign keys of an SQLite database.
+
+Databases created before users were deleted by cascade have message and
+change log tables whose foreign keys lack it, so deleting a user with
+messages fails once foreign keys are enforced. Run this once to rebuild
+those tables; it does nothing for tables that are already up to date.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.database import engine, migrate_cascade_deletes
+
+
+def main() -> int:
+    migrated = migrate_cascade_deletes(engine)
+    print(f"Rebuilt tables: {', '.join(migrated) or 'none'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,25 @@
+"""Rebuild the full-text search index of messages.
+
+Creates the FTS5 table and its triggers if they are missing and repopulates
+the index from the message table. Run it once for databases created before
+search existed, and after VACUUM.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.database import engine
+from app.models.message_search import rebuild_search_index
+
+
+def main() -> int:
+    with engine.begin() as connection:
+        indexed = rebuild_search_index(connection)
+    print(f"Indexed {indexed} messages")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
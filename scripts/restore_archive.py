@@ -0,0 +1,53 @@
+"""Restore archived messages of one day.
+
+Reads a partition written by scripts/apply_retention.py and inserts its
+messages back in batches. Messages that already exist or whose sender was
+deleted are skipped, so restoring twice is harmless.
+
+    python scripts/restore_archive.py --list
+    python scripts/restore_archive.py 2024-01-31
+"""
+
+import argparse
+import sys
+from datetime import date
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlmodel import Session
+
+from app.core import config
+from app.core.constants import MESSAGE_DELETE_CHUNK_SIZE
+from app.database import engine
+from app.services.retention_service import (
+    create_message_archive,
+    restore_archived_messages,
+)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("day", nargs="?", type=date.fromisoformat)
+    parser.add_argument("--list", action="store_true", help="list partitions")
+    parser.add_argument("--archive-dir", default=config.MESSAGE_ARCHIVE_DIR)
+    parser.add_argument("--batch-size", type=int, default=MESSAGE_DELETE_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    archive = create_message_archive(directory=args.archive_dir)
+    if args.list:
+        for day in archive.partitions():
+            print(day.isoformat())
+        return 0
+    if args.day is None:
+        parser.error("a partition day is required")
+    with Session(engine) as session:
+        restored = restore_archived_messages(
+            session=session, archive=archive, day=args.day, batch_size=args.batch_size
+        )
+    print(f"Restored {restored} messages")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())